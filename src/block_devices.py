@@ -0,0 +1,31 @@
+from aws_cdk import aws_imagebuilder as imagebuilder
+
+ROOT_DEVICE_NAME = "/dev/xvda"
+
+
+def block_device_mappings(spec: dict) -> list:
+    """Block device mappings for the build instance and the resulting AMI.
+
+    `block_devices` lists every volume with its `device_name`, `volume_size`,
+    `volume_type` (gp3 by default), gp3/io `iops` and `throughput`,
+    `delete_on_termination` and `encrypted`. Without it a single gp3 root
+    volume of `root_volume_size` GiB is used.
+    """
+    block_devices = spec.get("block_devices") or [
+        {"device_name": ROOT_DEVICE_NAME, "volume_size": spec.get("root_volume_size")}
+    ]
+
+    return [
+        imagebuilder.CfnImageRecipe.InstanceBlockDeviceMappingProperty(
+            device_name=device["device_name"],
+            ebs=imagebuilder.CfnImageRecipe.EbsInstanceBlockDeviceSpecificationProperty(
+                volume_size=device.get("volume_size"),
+                volume_type=device.get("volume_type", "gp3"),
+                iops=device.get("iops"),
+                throughput=device.get("throughput"),
+                delete_on_termination=device.get("delete_on_termination"),
+                encrypted=device.get("encrypted"),
+            ),
+        )
+        for device in block_devices
+    ]
@@ -0,0 +1,346 @@
+import hashlib
+import json
+
+from aws_cdk import Stack
+from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_imagebuilder as imagebuilder
+from cdk_nag import NagSuppressions
+from constructs import Construct
+
+from src.container_image import container_repository_name
+from src.context_snapshot import snapshot_subnet, snapshot_vpc
+from src.package_cache import uses_artifacts, with_proxy_egress_rule
+from src.performance_tests import RESULTS_PREFIX
+from src.s3_ops import components_bucket_name
+
+# Permissions copied from AWS managed policies AmazonSSMManagedInstanceCore and EC2InstanceProfileForImageBuilder
+BUILD_INSTANCE_POLICY_STATEMENTS = [
+    {
+        "actions": [
+            "ssm:DescribeAssociation",
+            "ssm:GetDeployablePatchSnapshotForInstance",
+            "ssm:GetDocument",
+            "ssm:DescribeDocument",
+            "ssm:GetManifest",
+            "ssm:GetParameter",
+            "ssm:GetParameters",
+            "ssm:ListAssociations",
+            "ssm:ListInstanceAssociations",
+            "ssm:PutInventory",
+            "ssm:PutComplianceItems",
+            "ssm:PutConfigurePackageResult",
+            "ssm:UpdateAssociationStatus",
+            "ssm:UpdateInstanceAssociationStatus",
+            "ssm:UpdateInstanceInformation",
+        ],
+        "resources": ["*"],
+    },
+    {
+        "actions": [
+            "ssmmessages:CreateControlChannel",
+            "ssmmessages:CreateDataChannel",
+            "ssmmessages:OpenControlChannel",
+            "ssmmessages:OpenDataChannel",
+        ],
+        "resources": ["*"],
+    },
+    {
+        "actions": [
+            "ec2messages:AcknowledgeMessage",
+            "ec2messages:DeleteMessage",
+            "ec2messages:FailMessage",
+            "ec2messages:GetEndpoint",
+            "ec2messages:GetMessages",
+            "ec2messages:SendReply",
+        ],
+        "resources": ["*"],
+    },
+    {
+        "actions": ["imagebuilder:GetComponent"],
+        "resources": ["*"],
+    },
+    {
+        "actions": ["kms:Decrypt"],
+        "resources": ["*"],
+        "conditions": {
+            "ForAnyValue:StringEquals": {
+                "kms:EncryptionContextKeys": "aws:imagebuilder:arn",
+                "aws:CalledVia": ["imagebuilder.amazonaws.com"],
+            }
+        },
+    },
+    {
+        "actions": ["s3:GetObject"],
+        "resources": ["arn:aws:s3:::ec2imagebuilder*"],
+    },
+    {
+        "actions": [
+            "logs:CreateLogStream",
+            "logs:CreateLogGroup",
+            "logs:PutLogEvents",
+        ],
+        "resources": ["arn:aws:logs:*:*:log-group:/aws/imagebuilder/*"],
+    },
+]
+
+DEFAULT_EGRESS_RULES = [
+    {"cidr": "0.0.0.0/0", "port": 80, "description": "Allow http traffic"},
+    {"cidr": "0.0.0.0/0", "port": 443, "description": "Allow https traffic"},
+]
+
+
+class BuildInstanceProfile(Construct):
+    """Managed policy, role and instance profile used by image builder build instances.
+
+    `grant_pipeline` adds what the build instances of a pipeline need beyond
+    building an image, e.g. pushing its container images.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str) -> None:
+        super().__init__(scope, construct_id)
+
+        statements = [
+            iam.PolicyStatement(effect=iam.Effect.ALLOW, **statement)
+            for statement in BUILD_INSTANCE_POLICY_STATEMENTS
+        ]
+
+        self.managed_policy = iam.ManagedPolicy(
+            self, "rManagedPolicy", statements=statements
+        )
+        # statements shared by the pipelines, resources are added per pipeline
+        self._shared_statements = {}
+
+        # below role is assumed by ec2 instance
+        self.role = iam.Role(
+            self,
+            "rInstanceRole",
+            assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),
+        )
+
+        self.role.add_managed_policy(self.managed_policy)
+
+        # create an instance profile to attach the role
+        self.instance_profile = iam.CfnInstanceProfile(
+            self, "rInstanceProfile", roles=[self.role.role_name]
+        )
+
+        NagSuppressions.add_resource_suppressions(
+            self.managed_policy,
+            suppressions=[
+                {
+                    "id": "AwsSolutions-IAM5",
+                    "reason": "Permissions copied from AWS managed policies AmazonSSMManagedInstanceCore, EC2InstanceProfileForImageBuilder and EC2InstanceProfileForImageBuilderECRContainerBuilds",
+                },
+            ],
+            apply_to_children=True,
+        )
+
+    def grant_pipeline(
+        self, spec: dict, package_cache: dict, performance_tests: dict
+    ) -> None:
+        """Allows the build instances what a pipeline spec uses, `package_cache` and `performance_tests` being the context defaults."""
+        stack = Stack.of(self)
+        bucket_arn = f"arn:{stack.partition}:s3:::{components_bucket_name(stack.account, stack.region)}"
+
+        # installers cached by the S3Ops stack
+        if uses_artifacts([spec], package_cache):
+            self._allow("artifacts", ["s3:GetObject"], f"{bucket_arn}/artifacts/*")
+
+        # disk usage stored by the shrink component and results of the desktop performance tests
+        performance_tests = spec.get("performance_tests", performance_tests) or {}
+        if spec.get("shrink_image", True) or performance_tests.get("enabled"):
+            self._allow(
+                "results",
+                ["s3:PutObject"],
+                f"{bucket_arn}/{RESULTS_PREFIX}/{spec['name']}/*",
+            )
+
+        # docker images of the container recipes, permissions copied from the AWS managed policy
+        # EC2InstanceProfileForImageBuilderECRContainerBuilds
+        if spec.get("container") is not None:
+            self._allow("ecr_token", ["ecr:GetAuthorizationToken"], "*")
+            self._allow(
+                "ecr",
+                [
+                    "ecr:BatchCheckLayerAvailability",
+                    "ecr:BatchGetImage",
+                    "ecr:CompleteLayerUpload",
+                    "ecr:GetDownloadUrlForLayer",
+                    "ecr:InitiateLayerUpload",
+                    "ecr:PutImage",
+                    "ecr:UploadLayerPart",
+                ],
+                stack.format_arn(
+                    service="ecr",
+                    resource="repository",
+                    resource_name=container_repository_name(
+                        spec["name"], spec["container"]
+                    ),
+                ),
+            )
+
+    def _allow(self, key: str, actions: list, resource: str) -> None:
+        statement = self._shared_statements.get(key)
+        if statement is None:
+            statement = iam.PolicyStatement(
+                effect=iam.Effect.ALLOW, actions=actions, resources=[resource]
+            )
+            self._shared_statements[key] = statement
+            self.managed_policy.add_statements(statement)
+        elif resource not in statement.resources:
+            statement.add_resources(resource)
+
+
+class BuildSecurityGroup(ec2.SecurityGroup):
+    """Security group for build instances which only allows the configured outbound traffic."""
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        vpc: ec2.IVpc,
+        description: str,
+        egress_rules: list = None,
+    ) -> None:
+        super().__init__(
+            scope,
+            construct_id,
+            vpc=vpc,
+            allow_all_outbound=False,
+            description=description,
+        )
+
+        for rule in egress_rules or DEFAULT_EGRESS_RULES:
+            self.add_egress_rule(
+                ec2.Peer.ipv4(rule.get("cidr", "0.0.0.0/0")),
+                ec2.Port.tcp(rule["port"]),
+                rule.get("description", f"Allow traffic on port {rule['port']}"),
+            )
+
+
+class BuildInfrastructure(Stack):
+    """Build infrastructure shared by all image builder pipelines in a VPC.
+
+    The stack owns a single build instance role and instance profile, one security
+    group per distinct set of egress rules and one infrastructure configuration per
+    pipeline, keyed by the pipeline name so its export never changes. Pipeline
+    stacks reference them through cross stack exports, which the stack exports
+    for every pipeline spec, so its content does not depend on which pipeline
+    stacks are built.
+
+    With a `snapshot` from src.context_snapshot the VPC and its subnets are
+    resolved from the snapshot instead of being looked up.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        vpc_id: str,
+        snapshot: dict = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self.vpc_id = vpc_id
+        self.snapshot = snapshot
+        if snapshot:
+            vpc = snapshot_vpc(snapshot, vpc_id)
+            self.vpc = ec2.Vpc.from_vpc_attributes(
+                self,
+                "rVpc",
+                vpc_id=vpc_id,
+                vpc_cidr_block=vpc["cidr_block"],
+                availability_zones=vpc["availability_zones"],
+            )
+        else:
+            self.vpc = ec2.Vpc.from_lookup(self, "rVpc", vpc_id=vpc_id)
+
+        self.instance_profile = BuildInstanceProfile(self, "rBuildInstanceProfile")
+
+        self._security_groups = {}
+        self._infra_configs = {}
+
+    def security_group(self, egress_rules: list = None) -> ec2.SecurityGroup:
+        egress_rules = egress_rules or DEFAULT_EGRESS_RULES
+        digest = _digest(egress_rules)
+
+        if digest not in self._security_groups:
+            self._security_groups[digest] = BuildSecurityGroup(
+                self,
+                f"rSecurityGroup{digest}",
+                vpc=self.vpc,
+                description="Security group for image builder build instances",
+                egress_rules=egress_rules,
+            )
+
+        return self._security_groups[digest]
+
+    def pipeline_configuration(
+        self, spec: dict
+    ) -> imagebuilder.CfnInfrastructureConfiguration:
+        """Exported infrastructure configuration of a pipeline spec."""
+        package_cache = spec.get(
+            "package_cache", self.node.try_get_context("package_cache")
+        )
+        egress_rules = spec.get("egress_rules") or DEFAULT_EGRESS_RULES
+        # the default rules only allow http and https, not the proxy port, e.g. 3128 or 3142
+        if package_cache and package_cache.get("proxy"):
+            egress_rules = with_proxy_egress_rule(egress_rules, package_cache["proxy"])
+
+        self.instance_profile.grant_pipeline(
+            spec,
+            self.node.try_get_context("package_cache"),
+            self.node.try_get_context("performance_tests"),
+        )
+
+        infra_config = self.infrastructure_configuration(
+            pipeline_name=spec["name"],
+            subnet_id=spec.get("subnet_id", self.node.try_get_context("subnet_id")),
+            instance_types=spec.get("instance_types"),
+            egress_rules=egress_rules,
+        )
+        # the export the pipeline stack imports, kept while the pipeline stack is not built
+        self.export_value(infra_config.attr_arn)
+        return infra_config
+
+    def infrastructure_configuration(
+        self,
+        pipeline_name: str,
+        subnet_id: str,
+        instance_types: list,
+        egress_rules: list = None,
+    ) -> imagebuilder.CfnInfrastructureConfiguration:
+        if self.snapshot:
+            # fail the synth rather than the build when the subnet is not in the VPC
+            snapshot_subnet(self.snapshot, self.vpc_id, subnet_id)
+
+        security_group = self.security_group(egress_rules)
+
+        # keyed by the pipeline, so a change of its instance types, subnet or egress rules updates the
+        # configuration in place and the export imported by the pipeline stack keeps its name
+        if pipeline_name not in self._infra_configs:
+            # create infrastructure configuration to supply instance type
+            infra_config = imagebuilder.CfnInfrastructureConfiguration(
+                self,
+                f"rInfraConfig{pipeline_name}",
+                name=f"{self.stack_name}-{pipeline_name}",
+                instance_types=instance_types,
+                instance_profile_name=self.instance_profile.instance_profile.ref,
+                subnet_id=subnet_id,
+                security_group_ids=[security_group.security_group_id],
+            )
+
+            # infrastructure need to wait for instance profile to complete before beginning deployment.
+            infra_config.add_dependency(self.instance_profile.instance_profile)
+
+            self._infra_configs[pipeline_name] = infra_config
+
+        return self._infra_configs[pipeline_name]
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:8]
@@ -0,0 +1,139 @@
+import json
+import os
+
+from aws_cdk import Duration, Stack
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as targets
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from cdk_nag import NagSuppressions
+from constructs import Construct
+
+from src.component_registry import FINGERPRINT_TAG
+from src.lambda_runtime import PYTHON_RUNTIME, PYTHON_RUNTIME_SUPPRESSION
+
+dirname = os.path.dirname(__file__)
+
+
+class BuildOrchestrator(Stack):
+    """Starts out of date pipelines on a schedule while capping concurrent builds.
+
+    `pipelines` lists the `arn`, `name`, `parent` pipeline arn, build `subnet`,
+    recipe `fingerprint` and latest AMI `parameter` of every managed pipeline,
+    parents first.
+    `orchestrator` is the `build_orchestrator` context with the `schedule` of
+    the checks, the `max_concurrent_builds` in the account and per subnet and
+    the `fingerprint_max_age_days` during which an image is reused instead of
+    building the same recipe inputs again. `reserved_concurrency` reserves
+    concurrent executions for the function; unset, none are reserved.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        pipelines: list,
+        orchestrator: dict,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        function = lambda_.Function(
+            self,
+            "rFunction",
+            runtime=PYTHON_RUNTIME,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(
+                os.path.join(dirname, "functions", "build_orchestrator")
+            ),
+            timeout=Duration.minutes(1),
+            # with 1, two runs can not both start the last free build; reserving any
+            # executions needs a concurrency quota above the default of 10
+            reserved_concurrent_executions=orchestrator.get("reserved_concurrency"),
+            environment={
+                "PIPELINES": json.dumps(pipelines),
+                "MAX_CONCURRENT_BUILDS": str(
+                    orchestrator.get("max_concurrent_builds", 2)
+                ),
+                "MAX_CONCURRENT_BUILDS_PER_SUBNET": str(
+                    orchestrator.get("max_concurrent_builds_per_subnet", 1)
+                ),
+                "FINGERPRINT_TAG": FINGERPRINT_TAG,
+                "FINGERPRINT_MAX_AGE_DAYS": str(
+                    orchestrator.get("fingerprint_max_age_days", 7)
+                ),
+            },
+        )
+
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "imagebuilder:GetImagePipeline",
+                    "imagebuilder:ListImagePipelineImages",
+                    "imagebuilder:StartImagePipelineExecution",
+                ],
+                resources=[pipeline["arn"] for pipeline in pipelines],
+            )
+        )
+
+        # AMIs built from the same recipe inputs, found by their fingerprint tag
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["ec2:DescribeImages"],
+                resources=["*"],
+            )
+        )
+
+        # AMIs reused by their fingerprint are published as the latest AMI of the pipeline
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["ssm:GetParameter", "ssm:PutParameter"],
+                resources=[
+                    self.format_arn(
+                        service="ssm",
+                        resource="parameter",
+                        resource_name=pipeline["parameter"].lstrip("/"),
+                    )
+                    for pipeline in pipelines
+                ],
+            )
+        )
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["ec2:CreateTags"],
+                resources=[
+                    self.format_arn(
+                        service="ec2", account="", resource="image", resource_name="*"
+                    )
+                ],
+            )
+        )
+
+        events.Rule(
+            self,
+            "rScheduleRule",
+            schedule=events.Schedule.expression(
+                orchestrator.get("schedule", "rate(15 minutes)")
+            ),
+            targets=[targets.LambdaFunction(function)],
+        )
+
+        NagSuppressions.add_resource_suppressions(
+            function,
+            suppressions=[
+                {
+                    "id": "AwsSolutions-IAM4",
+                    "reason": "AWSLambdaBasicExecutionRole only allows writing the function logs",
+                },
+                PYTHON_RUNTIME_SUPPRESSION,
+                {
+                    "id": "AwsSolutions-IAM5",
+                    "reason": "ec2:DescribeImages does not support resource level permissions and reused AMIs are not known in advance",
+                },
+            ],
+            apply_to_children=True,
+        )
@@ -0,0 +1,234 @@
+"""Stacks of the cdk app, built from the context of the app.
+
+app.py builds them for `cdk synth`; the synth benchmark builds the same app
+in-process to time it.
+"""
+import os
+
+from aws_cdk import App, Aspects, Tags
+
+from src.context_snapshot import load_snapshot, snapshot_path
+from src.instance_benchmark import trial_specs
+from src.pipeline_specs import (
+    BUILD_ORCHESTRATOR_ID,
+    S3_OPS_ID,
+    build_infrastructure_id,
+    matching_stacks,
+    ordered_specs,
+    selected_stacks,
+    stack_dependencies,
+    stack_patterns,
+)
+
+
+def _untimed(phase: str, func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def build_app(app: App, env: dict, registry=None, timed=None) -> dict:
+    """Adds the selected stacks to app and returns them by id.
+
+    `env` is the account and region of the stacks; `registry` the
+    ComponentRegistry of the pipelines, by default one recording the component
+    versions in src/component_versions.json. `timed(phase, func, *args,
+    **kwargs)` calls func and adds its duration to phase, e.g. in the synth
+    benchmark.
+    """
+    default_vpc_id = app.node.try_get_context("vpc_id")
+
+    # recorded vpc, subnet and ssm lookups, so synth does not call AWS, see src/context_snapshot.py
+    snapshot = load_snapshot(
+        snapshot_path(
+            {"context_snapshot": app.node.try_get_context("context_snapshot")}
+        ),
+        env["account"],
+        env["region"],
+    )
+
+    specs = app.node.try_get_context("pipelines")
+    # trial pipelines building benchmarked pipelines on every instance type to compare
+    specs = specs + trial_specs(
+        specs, app.node.try_get_context("instance_benchmark") or {}
+    )
+    build_orchestrator = app.node.try_get_context("build_orchestrator") or {}
+
+    # only the requested stacks and the stacks they depend on are built, e.g. `cdk synth -c stacks=Ubuntu*`
+    requested = stack_patterns(
+        app.node.try_get_context("stacks") or os.environ.get("CDK_STACKS")
+    )
+    dependencies = stack_dependencies(
+        specs,
+        default_vpc_id,
+        build_orchestrator=bool(build_orchestrator.get("enabled")),
+    )
+    selected = selected_stacks(dependencies, requested)
+    timed = timed or _untimed
+
+    stacks = {}
+
+    if S3_OPS_ID in selected:
+        from src.package_cache import uses_artifacts
+        from src.s3_ops import S3Ops
+
+        stacks[S3_OPS_ID] = timed(
+            "construct_s3_ops",
+            S3Ops,
+            app,
+            S3_OPS_ID,
+            artifacts=uses_artifacts(specs, app.node.try_get_context("package_cache")),
+        )
+
+    pipeline_specs = [spec for spec in ordered_specs(specs) if spec["id"] in selected]
+    if pipeline_specs:
+        _add_pipelines(
+            app, env, specs, pipeline_specs, stacks, snapshot, registry, timed
+        )
+
+    # start out of date pipelines on a schedule, a few builds at a time
+    if BUILD_ORCHESTRATOR_ID in selected:
+        stacks[BUILD_ORCHESTRATOR_ID] = timed(
+            "construct_build_orchestrator",
+            _build_orchestrator,
+            app,
+            env,
+            pipeline_specs,
+            stacks,
+            build_orchestrator,
+        )
+        for stack_id in dependencies[BUILD_ORCHESTRATOR_ID]:
+            stacks[BUILD_ORCHESTRATOR_ID].add_dependency(stacks[stack_id])
+
+    for tag_key, tag_value in app.node.try_get_context("resource_tags").items():
+        Tags.of(app).add(tag_key, tag_value)
+
+    _add_nag_checks(app, stacks, dependencies, requested)
+
+    return stacks
+
+
+def _add_pipelines(
+    app: App,
+    env: dict,
+    specs: list,
+    pipeline_specs: list,
+    stacks: dict,
+    snapshot: dict,
+    registry,
+    timed,
+) -> None:
+    """Adds the stacks of the selected pipelines and their build infrastructure to stacks."""
+    from src.component_registry import MANIFEST_PATH, ComponentRegistry
+    from src.image_builder_pipeline import ImageBuilderPipeline
+
+    # `component_manifest` records the versions in another file, e.g. in tests
+    registry = registry or ComponentRegistry(
+        manifest_path=app.node.try_get_context("component_manifest") or MANIFEST_PATH
+    )
+    default_vpc_id = app.node.try_get_context("vpc_id")
+
+    for spec in pipeline_specs:
+        vpc_id = spec.get("vpc_id", default_vpc_id)
+        infrastructure_id = build_infrastructure_id(vpc_id, default_vpc_id)
+        if infrastructure_id not in stacks:
+            stacks[infrastructure_id] = timed(
+                "construct_build_infrastructure",
+                _build_infrastructure,
+                app,
+                env,
+                infrastructure_id,
+                vpc_id,
+                [
+                    vpc_spec
+                    for vpc_spec in ordered_specs(specs)
+                    if vpc_spec.get("vpc_id", default_vpc_id) == vpc_id
+                ],
+                snapshot,
+            )
+
+        parent_stack = stacks.get(spec.get("parent_pipeline"))
+        pipeline_stack = timed(
+            "construct_pipelines",
+            ImageBuilderPipeline,
+            app,
+            spec["id"],
+            spec=spec,
+            registry=registry,
+            build_infrastructure=stacks[infrastructure_id],
+            parent=parent_stack,
+            env=env,
+        )
+        pipeline_stack.add_dependency(stacks[S3_OPS_ID])
+        if parent_stack:
+            pipeline_stack.add_dependency(parent_stack)
+
+        stacks[spec["id"]] = pipeline_stack
+
+
+def _build_infrastructure(
+    app: App,
+    env: dict,
+    infrastructure_id: str,
+    vpc_id: str,
+    vpc_specs: list,
+    snapshot: dict,
+):
+    from src.build_infrastructure import BuildInfrastructure
+
+    # one shared build infrastructure stack per vpc used by the pipelines, with the configurations of
+    # all of its pipelines whichever are selected, so deploying it never removes those of the others
+    build_infrastructure = BuildInfrastructure(
+        app, infrastructure_id, vpc_id=vpc_id, snapshot=snapshot, env=env
+    )
+    for spec in vpc_specs:
+        build_infrastructure.pipeline_configuration(spec)
+    return build_infrastructure
+
+
+def _build_orchestrator(
+    app: App, env: dict, pipeline_specs: list, stacks: dict, build_orchestrator: dict
+):
+    from src.build_orchestrator import BuildOrchestrator
+    from src.service_catalog import latest_ami_parameter_name
+
+    managed_pipelines = [
+        {
+            "arn": stacks[spec["id"]].pipeline_arn,
+            "name": spec["name"],
+            "parent": stacks[spec["parent_pipeline"]].pipeline_arn
+            if spec.get("parent_pipeline")
+            else None,
+            "subnet": spec.get("subnet_id", app.node.try_get_context("subnet_id")),
+            "fingerprint": stacks[spec["id"]].fingerprint,
+            "parameter": latest_ami_parameter_name(spec["name"]),
+        }
+        # trial pipelines are only run by src.instance_benchmark
+        for spec in pipeline_specs
+        if not spec.get("trial_of")
+    ]
+    return BuildOrchestrator(
+        app,
+        BUILD_ORCHESTRATOR_ID,
+        pipelines=managed_pipelines,
+        orchestrator=build_orchestrator,
+        env=env,
+    )
+
+
+def _add_nag_checks(
+    app: App, stacks: dict, dependencies: dict, requested: list
+) -> None:
+    # `nag_scope` all checks every built stack, selected only the requested ones and none skips the checks
+    nag_scope = app.node.try_get_context("nag_scope") or "all"
+    if nag_scope not in ("all", "selected", "none"):
+        raise ValueError(f"nag_scope must be all, selected or none, not {nag_scope}")
+    if nag_scope == "none":
+        return
+
+    from cdk_nag import AwsSolutionsChecks
+
+    checked = stacks
+    if nag_scope == "selected":
+        checked = matching_stacks(dependencies, requested)
+    checks = AwsSolutionsChecks()
+    for stack_id in checked:
+        Aspects.of(stacks[stack_id]).add(checks)
@@ -0,0 +1,146 @@
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import yaml
+
+from src.performance_tests import RESULTS_PARAMETERS
+from src.step_metrics import PIPELINE_PARAMETER, render_document
+
+dirname = os.path.dirname(__file__)
+
+COMPONENTS_DIR = os.path.join(dirname, "components")
+MANIFEST_PATH = os.path.join(dirname, "component_versions.json")
+INITIAL_VERSION = "1.0.0"
+# AMI tag holding the fingerprint of the recipe inputs an image was built from
+FINGERPRINT_TAG = "RecipeFingerprint"
+# component parameters naming the pipeline, they do not change the image
+PIPELINE_PARAMETERS = RESULTS_PARAMETERS + (PIPELINE_PARAMETER,)
+
+
+def inputs_digest(inputs: dict) -> str:
+    # inputs must only contain values known at synth time (no CDK tokens),
+    # e.g. component paths and versions, parent image and block devices
+    return hashlib.sha256(
+        json.dumps(inputs, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def recipe_fingerprint(inputs: dict) -> str:
+    """Digest of recipe inputs without the component parameters naming the pipeline.
+
+    Pipelines building the same recipe get the same fingerprint, so the image
+    of one stands for the image of the others.
+    """
+    components = []
+    for path, version, parameters in inputs["components"]:
+        image_parameters = {
+            parameter: value
+            for parameter, value in (parameters or {}).items()
+            if parameter not in PIPELINE_PARAMETERS
+        }
+        components.append([path, version, image_parameters or None])
+    return inputs_digest({**inputs, "components": components})
+
+
+def _bump_patch(version: str) -> str:
+    major, minor, patch = (int(part) for part in version.split("."))
+    return f"{major}.{minor}.{patch + 1}"
+
+
+def _version_key(version: str) -> tuple:
+    return tuple(int(part) for part in version.split("."))
+
+
+class ComponentRegistry:
+    """Derives image builder component and recipe versions from content hashes.
+
+    Every hash seen for a component (or recipe) is recorded in a local manifest
+    together with the version it was published as. Content matching the latest
+    version resolves to it, so CloudFormation sees no change and image builder
+    does not rebuild anything. Any other content, including content reverted to
+    an earlier version, gets the next patch version after the highest one
+    recorded, so versions always follow the order the content was built in.
+    """
+
+    def __init__(
+        self, components_dir: str = COMPONENTS_DIR, manifest_path: str = MANIFEST_PATH
+    ) -> None:
+        self.components_dir = components_dir
+        self.manifest_path = manifest_path
+        self._rendered_dir = None
+        # documents that are not read from the components folder, e.g. compiled recipes
+        self._documents = {}
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                self._manifest = json.load(manifest_file)
+        else:
+            self._manifest = {}
+
+    def component_path(self, relative_path: str) -> str:
+        return os.path.join(self.components_dir, relative_path)
+
+    def register_document(self, relative_path: str, document: dict) -> None:
+        self._documents[relative_path] = document
+
+    def component_document(self, relative_path: str) -> dict:
+        if relative_path in self._documents:
+            return self._documents[relative_path]
+        with open(
+            self.component_path(relative_path), encoding="utf-8"
+        ) as component_file:
+            return yaml.safe_load(component_file)
+
+    def component_content(self, relative_path: str) -> str:
+        # the uploaded component, with every step instrumented by src.step_metrics
+        return render_document(self.component_document(relative_path))
+
+    def component_hash(self, relative_path: str) -> str:
+        return hashlib.sha256(
+            self.component_content(relative_path).encode("utf-8")
+        ).hexdigest()
+
+    def rendered_component_path(self, relative_path: str) -> str:
+        """Writes the uploaded component to a content addressed path, <os>/<sha>/file.yml."""
+        if self._rendered_dir is None:
+            self._rendered_dir = tempfile.mkdtemp(prefix="rendered-components-")
+            # file assets are copied into the cloud assembly when they are created
+            atexit.register(shutil.rmtree, self._rendered_dir, ignore_errors=True)
+
+        folder, file_name = os.path.split(relative_path)
+        path = os.path.join(
+            self._rendered_dir, folder, self.component_hash(relative_path), file_name
+        )
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as rendered_file:
+                rendered_file.write(self.component_content(relative_path))
+        return path
+
+    def component_version(self, relative_path: str) -> str:
+        # manifest keys always use forward slashes so the file is portable
+        key = relative_path.replace(os.sep, "/")
+        return self._resolve("components", key, self.component_hash(relative_path))
+
+    def recipe_version(self, recipe_name: str, inputs: dict) -> str:
+        return self._resolve("recipes", recipe_name, inputs_digest(inputs))
+
+    def _resolve(self, section: str, key: str, digest: str) -> str:
+        versions = self._manifest.setdefault(section, {}).setdefault(key, {})
+        latest = max(versions.values(), key=_version_key, default=None)
+
+        # an earlier version is never reused, image builder and the parent image arns pick the highest one
+        if latest is None or versions.get(digest) != latest:
+            versions[digest] = _bump_patch(latest) if latest else INITIAL_VERSION
+            self.save()
+
+        return versions[digest]
+
+    def save(self) -> None:
+        with open(self.manifest_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(self._manifest, manifest_file, indent=2, sort_keys=True)
+            manifest_file.write("\n")
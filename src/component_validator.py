@@ -0,0 +1,403 @@
+"""Offline validation and local dry runs of AWSTOE component documents.
+
+Validation checks every document against the AWSTOE document schema and
+parses the commands of every ExecuteBash step with `bash -n`. It runs for every
+component during synth, so a broken component fails `cdk synth` instead of a
+build instance. The command line, also run by pre-commit, shellchecks the
+steps as well and fails when shellcheck is not installed, so synth does not
+depend on which tools happen to be installed.
+
+    python -m src.component_validator                       # validate all components
+    python -m src.component_validator ubuntu/install_xrdp.yml --dry-run ubuntu:22.04
+
+A dry run executes the ExecuteBash steps of the build and validate phases in a
+throwaway container (docker or podman) or in a chroot and reports the duration
+of every step. Other actions cannot be reproduced locally and are skipped.
+"""
+import argparse
+import functools
+import glob
+import os
+import re
+import shutil
+import subprocess  # nosec B404
+import sys
+import time
+
+import yaml
+
+from src.component_registry import COMPONENTS_DIR
+
+PHASES = ("build", "validate", "test")
+
+DOCUMENT_KEYS = {
+    "name",
+    "description",
+    "schemaVersion",
+    "parameters",
+    "constants",
+    "phases",
+}
+STEP_KEYS = {
+    "name",
+    "action",
+    "inputs",
+    "onFailure",
+    "timeoutSeconds",
+    "maxAttempts",
+    "if",
+    "loop",
+}
+ON_FAILURE = {"Abort", "Continue", "Ignore"}
+
+ACTIONS = {
+    "AppendFile",
+    "Assert",
+    "CopyFile",
+    "CopyFolder",
+    "CreateFile",
+    "CreateFolder",
+    "CreateSymlink",
+    "DeleteFile",
+    "DeleteFolder",
+    "ExecuteBash",
+    "ExecuteBinary",
+    "ExecuteDocument",
+    "ExecutePowerShell",
+    "InstallMSI",
+    "ListFiles",
+    "MoveFile",
+    "MoveFolder",
+    "ReadFile",
+    "Reboot",
+    "S3Download",
+    "S3Upload",
+    "SetFileEncoding",
+    "SetFileOwner",
+    "SetFilePermissions",
+    "SetFolderOwner",
+    "SetFolderPermissions",
+    "SetRegistry",
+    "UninstallMSI",
+    "UpdateOS",
+    "WebDownload",
+}
+
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]*$")
+VARIABLE_PATTERN = re.compile(r"{{\s*([^}\s]+)\s*}}")
+
+
+def _declared_variables(document: dict) -> set:
+    names = set()
+    for section in ("parameters", "constants"):
+        for declaration in document.get(section) or []:
+            if isinstance(declaration, dict):
+                names.update(declaration)
+    return names
+
+
+def _validate_variables(document: dict, where: str, value) -> list:
+    declared = _declared_variables(document)
+    # dotted names are built-in variables, e.g. step outputs, loop values and ssm parameters
+    return [
+        f"{where}: {{{{ {variable} }}}} is not a declared parameter or constant"
+        for variable in VARIABLE_PATTERN.findall(str(value))
+        if "." not in variable and ":" not in variable and variable not in declared
+    ]
+
+
+def _validate_step(document: dict, phase_name: str, step) -> list:
+    if not isinstance(step, dict):
+        return [f"phase {phase_name}: every step must be a mapping"]
+
+    where = f"phase {phase_name}, step {step.get('name')}"
+    errors = [f"{where}: unknown key {key}" for key in sorted(set(step) - STEP_KEYS)]
+
+    if not NAME_PATTERN.match(str(step.get("name", ""))):
+        errors.append(f"{where}: name must only contain letters, digits, _ and -")
+    if step.get("action") not in ACTIONS:
+        errors.append(f"{where}: unknown action {step.get('action')}")
+    if "inputs" not in step and step.get("action") != "Reboot":
+        errors.append(f"{where}: inputs are required")
+    if step.get("onFailure", "Abort") not in ON_FAILURE:
+        errors.append(
+            f"{where}: onFailure must be one of {', '.join(sorted(ON_FAILURE))}"
+        )
+
+    if step.get("action") == "ExecuteBash":
+        commands = (step.get("inputs") or {}).get("commands")
+        if not isinstance(commands, list) or not all(
+            isinstance(command, str) for command in commands
+        ):
+            errors.append(f"{where}: ExecuteBash inputs need a list of commands")
+
+    return errors + _validate_variables(document, where, step.get("inputs"))
+
+
+def _validate_phase(document: dict, phase) -> list:
+    if not isinstance(phase, dict) or phase.get("name") not in PHASES:
+        return [f"phase names must be one of {', '.join(PHASES)}"]
+
+    steps = phase.get("steps")
+    if not isinstance(steps, list) or not steps:
+        return [f"phase {phase['name']}: at least one step is required"]
+
+    errors = []
+    step_names = [step.get("name") for step in steps if isinstance(step, dict)]
+    for duplicate in sorted(
+        {name for name in step_names if step_names.count(name) > 1}
+    ):
+        errors.append(f"phase {phase['name']}: duplicate step name {duplicate}")
+
+    for step in steps:
+        errors.extend(_validate_step(document, phase["name"], step))
+
+    return errors
+
+
+def validate_document(document) -> list:
+    """Returns the AWSTOE schema errors of a component document."""
+    if not isinstance(document, dict):
+        return ["document must be a mapping"]
+
+    errors = [
+        f"unknown top level key {key}" for key in sorted(set(document) - DOCUMENT_KEYS)
+    ]
+
+    if not NAME_PATTERN.match(str(document.get("name", ""))):
+        errors.append("name must only contain letters, digits, _ and -")
+    if str(document.get("schemaVersion")) != "1.0":
+        errors.append("schemaVersion must be 1.0")
+
+    phases = document.get("phases")
+    if not isinstance(phases, list) or not phases:
+        return errors + ["at least one phase is required"]
+
+    phase_names = [phase.get("name") for phase in phases if isinstance(phase, dict)]
+    for duplicate in sorted(
+        {name for name in phase_names if phase_names.count(name) > 1}
+    ):
+        errors.append(f"duplicate phase {duplicate}")
+
+    for phase in phases:
+        errors.extend(_validate_phase(document, phase))
+
+    return errors
+
+
+def bash_steps(document: dict, phases: tuple = PHASES) -> list:
+    """Returns (phase, step name, script) for every ExecuteBash step of the given phases."""
+    return [
+        (phase["name"], step["name"], "\n".join(step["inputs"]["commands"]))
+        for phase in document.get("phases", [])
+        if phase.get("name") in phases
+        for step in phase.get("steps", [])
+        if step.get("action") == "ExecuteBash"
+    ]
+
+
+def _substitute(script: str, parameters: dict) -> str:
+    return VARIABLE_PATTERN.sub(
+        lambda match: str(parameters.get(match.group(1), "PARAMETER")), script
+    )
+
+
+def bash_syntax(document: dict) -> list:
+    """Returns the bash syntax errors of the ExecuteBash steps, if bash is installed."""
+    executable = shutil.which("bash")
+    if not executable:
+        return []
+
+    errors = []
+    for phase_name, step_name, script in bash_steps(document):
+        completed = subprocess.run(  # nosec B603
+            [executable, "-n"],
+            input=_substitute(script, {}),
+            capture_output=True,
+            text=True,
+        )
+        errors.extend(
+            f"phase {phase_name}, step {step_name}: {line.split(':', 1)[-1].strip()}"
+            for line in completed.stderr.splitlines()
+        )
+
+    return errors
+
+
+def shellcheck(document: dict, severity: str = "error") -> list:
+    """Returns the shellcheck findings for the ExecuteBash steps, shellcheck must be installed."""
+    executable = shutil.which("shellcheck")
+    if not executable:
+        raise FileNotFoundError("shellcheck is not installed")
+
+    errors = []
+    for phase_name, step_name, script in bash_steps(document):
+        completed = subprocess.run(  # nosec B603
+            [executable, "--shell=bash", f"--severity={severity}", "--format=gcc", "-"],
+            input=_substitute(script, {}),
+            capture_output=True,
+            text=True,
+        )
+        errors.extend(
+            f"phase {phase_name}, step {step_name}: {line.split(':', 3)[-1].strip()}"
+            for line in completed.stdout.splitlines()
+        )
+
+    return errors
+
+
+@functools.lru_cache(maxsize=None)
+def _validate_content(content: str, shellcheck_severity: str = None) -> tuple:
+    try:
+        document = yaml.safe_load(content)
+    except yaml.YAMLError as error:
+        return (f"invalid yaml: {error}",)
+
+    errors = validate_document(document) or bash_syntax(document)
+    if not errors and shellcheck_severity:
+        errors = shellcheck(document, shellcheck_severity)
+    return tuple(errors)
+
+
+def validate_component(path: str, shellcheck_severity: str = None) -> list:
+    """Validates a component file; results are cached by content so every file is only checked once per synth.
+
+    With a `shellcheck_severity`, the steps are also shellchecked at that severity.
+    """
+    with open(path, encoding="utf-8") as component_file:
+        return list(_validate_content(component_file.read(), shellcheck_severity))
+
+
+def _runner_command(runner: str, target: str) -> list:
+    if runner == "chroot":
+        return ["chroot", target, "/bin/bash", "-s"]
+    return [runner, "run", "--rm", "-i", target, "/bin/bash", "-s"]
+
+
+def dry_run(document: dict, runner: str, target: str, parameters: dict = None) -> dict:
+    """Runs the build and validate ExecuteBash steps one after another and returns their timings.
+
+    All steps are sent to a single shell, as every container run starts from a fresh
+    image. The shell marks the start and end of every step on stderr.
+    """
+    steps = bash_steps(document, phases=("build", "validate"))
+    script = ["set -e"]
+    for phase_name, step_name, commands in steps:
+        script += [
+            f'echo ">>> {phase_name}/{step_name} $(date +%s.%N)" >&2',
+            f"(\n{_substitute(commands, parameters or {})}\n)",
+            f'echo "<<< {phase_name}/{step_name} $(date +%s.%N)" >&2',
+        ]
+
+    start = time.perf_counter()
+    completed = subprocess.run(  # nosec B603
+        _runner_command(runner, target),
+        input="\n".join(script) + "\n",
+        capture_output=True,
+        text=True,
+    )
+    total = time.perf_counter() - start
+
+    started = {}
+    durations = {}
+    for line in completed.stderr.splitlines():
+        if line.startswith((">>> ", "<<< ")):
+            step, timestamp = line[4:].rsplit(" ", 1)
+            if line.startswith(">>> "):
+                started[step] = float(timestamp)
+            else:
+                durations[step] = round(float(timestamp) - started[step], 3)
+
+    return {
+        "returncode": completed.returncode,
+        "total_seconds": round(total, 3),
+        # steps that did not finish, because they or an earlier step failed, have no duration
+        "steps": [
+            {
+                "step": f"{phase_name}/{step_name}",
+                "duration_seconds": durations.get(f"{phase_name}/{step_name}"),
+            }
+            for phase_name, step_name, _ in steps
+        ],
+        "output": completed.stdout,
+        "errors": completed.stderr,
+    }
+
+
+def _arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Validate and dry run image builder components"
+    )
+    parser.add_argument(
+        "components",
+        nargs="*",
+        help="component paths relative to src/components, all by default",
+    )
+    parser.add_argument(
+        "--dry-run",
+        metavar="TARGET",
+        help="container image, or directory with --runner chroot, to run the components in",
+    )
+    parser.add_argument(
+        "--runner", choices=["docker", "podman", "chroot"], default="docker"
+    )
+    parser.add_argument(
+        "--parameter",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="component parameter used by dry runs",
+    )
+    parser.add_argument(
+        "--no-shellcheck",
+        action="store_true",
+        help="only check the schema and the bash syntax, as synth does",
+    )
+    args = parser.parse_args()
+    if not args.no_shellcheck and not shutil.which("shellcheck"):
+        parser.error("shellcheck is not installed, install it or pass --no-shellcheck")
+    return args
+
+
+def _run_in(path: str, args: argparse.Namespace) -> bool:
+    # dry runs a component, returns whether it succeeded
+    with open(os.path.join(COMPONENTS_DIR, path), encoding="utf-8") as component_file:
+        result = dry_run(
+            yaml.safe_load(component_file),
+            args.runner,
+            args.dry_run,
+            dict(parameter.split("=", 1) for parameter in args.parameter),
+        )
+    for timing in result["steps"]:
+        print(f"  {timing['step']}: {timing['duration_seconds']}s")
+    if result["returncode"]:
+        print(result["errors"], file=sys.stderr)
+    return not result["returncode"]
+
+
+def main() -> int:
+    args = _arguments()
+    paths = args.components or sorted(
+        os.path.relpath(path, COMPONENTS_DIR)
+        for path in glob.glob(os.path.join(COMPONENTS_DIR, "*", "*.yml"))
+    )
+
+    failed = False
+    for path in paths:
+        errors = validate_component(
+            os.path.join(COMPONENTS_DIR, path),
+            None if args.no_shellcheck else "error",
+        )
+        print(f"{path}: {'ok' if not errors else 'invalid'}")
+        for error in errors:
+            print(f"  {error}")
+        failed = failed or bool(errors)
+
+        if args.dry_run and not errors:
+            failed = not _run_in(path, args) or failed
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
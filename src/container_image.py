@@ -0,0 +1,135 @@
+from aws_cdk import RemovalPolicy
+from aws_cdk import aws_ecr as ecr
+from aws_cdk import aws_imagebuilder as imagebuilder
+from constructs import Construct
+
+# repositories of the container images, the build instance profile may push to them
+REPOSITORY_PREFIX = "centralised-images"
+
+# container image of the same distribution as the base AMI of each os
+PARENT_IMAGES = {
+    "amazon_linux": "amazonlinux:2",
+    "ubuntu": "ubuntu:22.04",
+}
+
+# image builder replaces the placeholders with the parent image and the commands running the components
+DOCKERFILE_TEMPLATE = """FROM {{{ imagebuilder:parentImage }}}
+{{{ imagebuilder:environments }}}
+{{{ imagebuilder:components }}}
+"""
+
+# the ubuntu image has neither curl nor unzip, which the ubuntu components download and unpack installers with
+DOCKERFILE_TEMPLATES = {
+    "ubuntu": """FROM {{{ imagebuilder:parentImage }}}
+{{{ imagebuilder:environments }}}
+RUN apt-get -y -q update && DEBIAN_FRONTEND=noninteractive apt-get -y -q install --no-install-recommends ca-certificates curl unzip
+{{{ imagebuilder:components }}}
+""",
+}
+
+
+def container_parent_image(os_name: str, container: dict) -> str:
+    """Parent image of the container recipe of a pipeline spec."""
+    if container.get("parent_image"):
+        return container["parent_image"]
+    if os_name not in PARENT_IMAGES:
+        raise ValueError(
+            f"No default container parent_image for os {os_name}, set one in the container spec"
+        )
+    return PARENT_IMAGES[os_name]
+
+
+def container_dockerfile_template(os_name: str, container: dict) -> str:
+    """Dockerfile template of the container recipe of a pipeline spec."""
+    return container.get(
+        "dockerfile_template", DOCKERFILE_TEMPLATES.get(os_name, DOCKERFILE_TEMPLATE)
+    )
+
+
+def container_repository_name(name: str, container: dict) -> str:
+    """ECR repository the container images of the pipeline named name are pushed to."""
+    repository_name = container.get(
+        "repository_name", f"{REPOSITORY_PREFIX}/{name.lower()}"
+    )
+    # the build instance profile may only push to the repositories below the prefix
+    if not repository_name.startswith(f"{REPOSITORY_PREFIX}/"):
+        raise ValueError(
+            f"Container repository_name of {name} must start with {REPOSITORY_PREFIX}/, not {repository_name}"
+        )
+    return repository_name
+
+
+def _component_configuration(
+    component_arn: str, parameters: dict
+) -> imagebuilder.CfnContainerRecipe.ComponentConfigurationProperty:
+    parameters = [
+        imagebuilder.CfnContainerRecipe.ComponentParameterProperty(
+            name=parameter, value=[str(value)]
+        )
+        for parameter, value in parameters.items()
+    ]
+    return imagebuilder.CfnContainerRecipe.ComponentConfigurationProperty(
+        component_arn=component_arn, parameters=parameters or None
+    )
+
+
+class ContainerPipeline(Construct):
+    """Container recipe and pipeline pushing a docker image to ECR.
+
+    The recipe runs the same image builder `components` as the AMI recipe of
+    the pipeline, given as (component arn, parameters) pairs, on top of
+    `parent_image` in a docker build of `dockerfile_template`. The repository keeps the
+    `max_image_count` latest images of the `container` spec.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        name: str,
+        container: dict,
+        parent_image: str,
+        dockerfile_template: str,
+        components: list,
+        recipe_version: str,
+        infrastructure_configuration_arn: str,
+        schedule: imagebuilder.CfnImagePipeline.ScheduleProperty = None,
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        self.repository = ecr.Repository(
+            self,
+            "rRepository",
+            repository_name=container_repository_name(name, container),
+            image_scan_on_push=True,
+            removal_policy=RemovalPolicy.RETAIN,
+            lifecycle_rules=[
+                ecr.LifecycleRule(max_image_count=container.get("max_image_count", 10))
+            ],
+        )
+
+        self.recipe = imagebuilder.CfnContainerRecipe(
+            self,
+            "rContainerRecipe",
+            name=f"r{name}ContainerRecipe",
+            version=recipe_version,
+            container_type="DOCKER",
+            parent_image=parent_image,
+            components=[
+                _component_configuration(component_arn, parameters)
+                for component_arn, parameters in components
+            ],
+            dockerfile_template_data=dockerfile_template,
+            target_repository=imagebuilder.CfnContainerRecipe.TargetContainerRepositoryProperty(
+                service="ECR", repository_name=self.repository.repository_name
+            ),
+        )
+
+        self.pipeline = imagebuilder.CfnImagePipeline(
+            self,
+            "rPipeline",
+            name=f"{name}ContainerPipeline",
+            container_recipe_arn=self.recipe.attr_arn,
+            infrastructure_configuration_arn=infrastructure_configuration_arn,
+            schedule=schedule,
+        )
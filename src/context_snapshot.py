@@ -0,0 +1,246 @@
+"""Records the VPC, subnet and SSM parameter lookups of the app in a snapshot file.
+
+`Vpc.from_lookup` and SSM lookups call AWS on the first synth, so a fresh CI
+runner can not synth offline. The snapshot stores the answers in the `path` of
+the `context_snapshot` context, by default `context_snapshot.json` next to
+`cdk.json`, which is committed with the code.
+When the file exists the app resolves the VPCs, subnets and parameters from it
+and never looks them up, so synth is deterministic and needs no network.
+
+    python -m src.context_snapshot record    # look up everything the app uses
+    python -m src.context_snapshot refresh   # look up again and print what changed
+    python -m src.context_snapshot check     # offline, fails when the snapshot is stale
+
+The snapshot covers the `vpc_id` and `subnet_id` of the context and of every
+pipeline spec, and the `base_image_parameter` of the pipeline specs. `check`
+reports a snapshot recorded more than `max_age_days` of the `context_snapshot`
+context ago, or one missing a VPC, subnet or parameter the context uses.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+
+dirname = os.path.dirname(__file__)
+
+CDK_JSON_PATH = os.path.join(os.path.dirname(dirname), "cdk.json")
+SNAPSHOT_PATH = os.path.join(os.path.dirname(dirname), "context_snapshot.json")
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path(context: dict, cdk_json_path: str = CDK_JSON_PATH) -> str:
+    """Path of the snapshot set by `context_snapshot.path`, relative to the folder of cdk.json."""
+    path = (context.get("context_snapshot") or {}).get("path")
+    if not path:
+        return SNAPSHOT_PATH
+    return os.path.join(os.path.dirname(os.path.abspath(cdk_json_path)), path)
+
+
+def snapshot_targets(context: dict) -> tuple:
+    """Returns the subnets to look up per VPC and the SSM parameter names the context uses."""
+    default_vpc_id = context.get("vpc_id")
+    vpcs = {default_vpc_id: set()}
+    if context.get("subnet_id"):
+        vpcs[default_vpc_id].add(context["subnet_id"])
+    parameters = set()
+
+    for spec in context.get("pipelines", []):
+        subnets = vpcs.setdefault(spec.get("vpc_id", default_vpc_id), set())
+        subnets.add(spec.get("subnet_id", context.get("subnet_id")))
+        if spec.get("base_image_parameter"):
+            parameters.add(spec["base_image_parameter"])
+
+    return (
+        {vpc_id: subnets - {None} for vpc_id, subnets in vpcs.items() if vpc_id},
+        parameters,
+    )
+
+
+def load_snapshot(path: str, account: str, region: str):
+    """Returns the snapshot at path, or None when there is none."""
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as snapshot_file:
+        snapshot = json.load(snapshot_file)
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"{path} has version {snapshot.get('version')}, expected {SNAPSHOT_VERSION}, "
+            "run python -m src.context_snapshot record"
+        )
+    if (snapshot["account"], snapshot["region"]) != (account, region):
+        raise ValueError(
+            f"{path} was recorded in {snapshot['account']}/{snapshot['region']}, not {account}/{region}"
+        )
+    return snapshot
+
+
+def snapshot_vpc(snapshot: dict, vpc_id: str) -> dict:
+    """Returns the recorded `cidr_block`, `availability_zones` and `subnets` of a VPC."""
+    if vpc_id not in snapshot["vpcs"]:
+        raise ValueError(
+            f"VPC {vpc_id} is not in the context snapshot, run python -m src.context_snapshot refresh"
+        )
+    return snapshot["vpcs"][vpc_id]
+
+
+def snapshot_subnet(snapshot: dict, vpc_id: str, subnet_id: str) -> dict:
+    subnets = snapshot_vpc(snapshot, vpc_id)["subnets"]
+    if subnet_id not in subnets:
+        raise ValueError(
+            f"Subnet {subnet_id} is not a recorded subnet of VPC {vpc_id}, "
+            "run python -m src.context_snapshot refresh"
+        )
+    return subnets[subnet_id]
+
+
+def snapshot_parameter(snapshot: dict, name: str) -> str:
+    if name not in snapshot["parameters"]:
+        raise ValueError(
+            f"SSM parameter {name} is not in the context snapshot, run python -m src.context_snapshot refresh"
+        )
+    return snapshot["parameters"][name]
+
+
+def stale_entries(snapshot: dict, context: dict, now: datetime.datetime) -> list:
+    """Returns why the snapshot is stale for the context, or an empty list."""
+    problems = []
+    vpcs, parameters = snapshot_targets(context)
+
+    for vpc_id, subnet_ids in sorted(vpcs.items()):
+        if vpc_id not in snapshot["vpcs"]:
+            problems.append(f"VPC {vpc_id} is not recorded")
+            continue
+        for subnet_id in sorted(subnet_ids - set(snapshot["vpcs"][vpc_id]["subnets"])):
+            problems.append(f"Subnet {subnet_id} of VPC {vpc_id} is not recorded")
+    for name in sorted(parameters - set(snapshot["parameters"])):
+        problems.append(f"SSM parameter {name} is not recorded")
+
+    max_age_days = (context.get("context_snapshot") or {}).get("max_age_days", 30)
+    recorded_at = datetime.datetime.fromisoformat(snapshot["recorded_at"])
+    age = now - recorded_at
+    if age > datetime.timedelta(days=max_age_days):
+        problems.append(
+            f"Recorded {age.days} days ago, more than max_age_days {max_age_days}"
+        )
+
+    return problems
+
+
+def snapshot_changes(old: dict, new: dict, prefix: str = "") -> list:
+    """Returns the paths of the values that differ between two snapshots."""
+    changes = []
+    for key in sorted(set(old) | set(new)):
+        if key == "recorded_at":
+            continue
+        path = f"{prefix}{key}"
+        old_value, new_value = old.get(key), new.get(key)
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            changes.extend(snapshot_changes(old_value, new_value, f"{path}."))
+        elif old_value != new_value:
+            changes.append(
+                f"{path}: {json.dumps(old_value)} -> {json.dumps(new_value)}"
+            )
+    return changes
+
+
+def record(context: dict, account: str, region: str) -> dict:
+    """Looks up the VPCs, subnets and SSM parameters the context uses."""
+    import boto3
+
+    ec2 = boto3.client("ec2", region_name=region)
+    ssm = boto3.client("ssm", region_name=region)
+    vpcs, parameters = snapshot_targets(context)
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "account": account,
+        "region": region,
+        "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(
+            timespec="seconds"
+        ),
+        "vpcs": {},
+        "parameters": {},
+    }
+
+    for vpc_id in sorted(vpcs):
+        vpc = ec2.describe_vpcs(VpcIds=[vpc_id])["Vpcs"][0]
+        subnets = {}
+        paginator = ec2.get_paginator("describe_subnets")
+        for page in paginator.paginate(
+            Filters=[{"Name": "vpc-id", "Values": [vpc_id]}]
+        ):
+            for subnet in page["Subnets"]:
+                subnets[subnet["SubnetId"]] = {
+                    "availability_zone": subnet["AvailabilityZone"],
+                    "cidr_block": subnet["CidrBlock"],
+                }
+        snapshot["vpcs"][vpc_id] = {
+            "cidr_block": vpc["CidrBlock"],
+            "availability_zones": sorted(
+                {subnet["availability_zone"] for subnet in subnets.values()}
+            ),
+            "subnets": dict(sorted(subnets.items())),
+        }
+
+    for name in sorted(parameters):
+        snapshot["parameters"][name] = ssm.get_parameter(Name=name)["Parameter"][
+            "Value"
+        ]
+
+    return snapshot
+
+
+def _load_context(cdk_json_path: str) -> dict:
+    with open(cdk_json_path, encoding="utf-8") as cdk_json:
+        return json.load(cdk_json)["context"]
+
+
+def _write(path: str, snapshot: dict) -> None:
+    with open(path, "w", encoding="utf-8") as snapshot_file:
+        json.dump(snapshot, snapshot_file, indent=2)
+        snapshot_file.write("\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cdk-json", default=CDK_JSON_PATH)
+    parser.add_argument(
+        "--snapshot", help="snapshot file, by default the context_snapshot path"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("record", help="look up and write a new snapshot")
+    commands.add_parser(
+        "refresh", help="look up again, print the changes and write the snapshot"
+    )
+    commands.add_parser("check", help="fail when the snapshot is stale")
+    args = parser.parse_args()
+
+    context = _load_context(args.cdk_json)
+    args.snapshot = args.snapshot or snapshot_path(context, args.cdk_json)
+    account = os.environ["CDK_DEFAULT_ACCOUNT"]
+    region = os.environ["CDK_DEFAULT_REGION"]
+
+    if args.command == "check":
+        snapshot = load_snapshot(args.snapshot, account, region)
+        if snapshot is None:
+            sys.exit(f"{args.snapshot} does not exist")
+        problems = stale_entries(
+            snapshot, context, datetime.datetime.now(datetime.timezone.utc)
+        )
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+
+    snapshot = record(context, account, region)
+    if args.command == "refresh":
+        previous = load_snapshot(args.snapshot, account, region) or {}
+        for change in snapshot_changes(previous, snapshot) or ["No changes"]:
+            print(change)
+    _write(args.snapshot, snapshot)
+
+
+if __name__ == "__main__":
+    main()
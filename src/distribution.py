@@ -0,0 +1,69 @@
+from aws_cdk import aws_imagebuilder as imagebuilder
+from constructs import Construct
+
+
+def _ami_distribution(
+    name: str, target: dict, ami_tags: dict
+) -> imagebuilder.CfnDistributionConfiguration.DistributionProperty:
+    launch_permissions = target.get("launch_permissions", {})
+
+    # ami_distribution_configuration is untyped in the L1 construct, so it is passed
+    # with the property names cloudformation expects
+    ami_distribution = {
+        # build date keeps the AMI name unique for every image built by the pipeline
+        "Name": f"{name}-{{{{ imagebuilder:buildDate }}}}",
+        "KmsKeyId": target.get("kms_key_id"),
+        "TargetAccountIds": target.get("accounts"),
+        "AmiTags": ami_tags,
+    }
+
+    if launch_permissions:
+        ami_distribution["LaunchPermissionConfiguration"] = {
+            "UserIds": launch_permissions.get("user_ids"),
+            "UserGroups": launch_permissions.get("user_groups"),
+            "OrganizationArns": launch_permissions.get("organization_arns"),
+            "OrganizationalUnitArns": launch_permissions.get(
+                "organizational_unit_arns"
+            ),
+        }
+
+    return imagebuilder.CfnDistributionConfiguration.DistributionProperty(
+        region=target["region"],
+        ami_distribution_configuration=ami_distribution,
+    )
+
+
+class ImageDistribution(Construct):
+    """Distribution configuration copying the AMI of a pipeline to other regions and accounts.
+
+    `distribution` is the `distribution` context of the pipeline: a list of
+    `regions`, each with a `region`, optional target `accounts`, the `kms_key_id`
+    used to encrypt the copy and `launch_permissions` for other accounts or
+    organisations. The build region is always included, so image builder copies
+    the AMI to every other region in parallel once it is built. `ami_tags` are
+    added to the AMI in every region.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        name: str,
+        distribution: dict,
+        build_region: str,
+        ami_tags: dict = None,
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        targets = list(distribution.get("regions", []))
+        if build_region not in [target["region"] for target in targets]:
+            targets.insert(0, {"region": build_region})
+
+        self.distribution_configuration = imagebuilder.CfnDistributionConfiguration(
+            self,
+            "rDistributionConfig",
+            name=f"r{name}DistributionConfig",
+            distributions=[
+                _ami_distribution(name, target, ami_tags) for target in targets
+            ],
+        )
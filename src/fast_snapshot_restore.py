@@ -0,0 +1,102 @@
+import json
+import os
+
+from aws_cdk import Duration, Stack
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as targets
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from cdk_nag import NagSuppressions
+from constructs import Construct
+
+from src.lambda_runtime import PYTHON_RUNTIME, PYTHON_RUNTIME_SUPPRESSION
+
+dirname = os.path.dirname(__file__)
+
+
+class FastSnapshotRestore(Construct):
+    """Pre-warms the snapshots of the latest AMI built from a recipe.
+
+    `availability_zones` maps each region the AMI is distributed to onto the
+    availability zones in which fast snapshot restore is enabled, so desktops
+    launched there do not lazily hydrate their volumes from S3 on first boot.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        recipe_name: str,
+        availability_zones: dict,
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        stack = Stack.of(self)
+        image_arn_prefix = stack.format_arn(
+            service="imagebuilder",
+            resource="image",
+            resource_name=f"{recipe_name.lower()}/",
+        )
+
+        function = lambda_.Function(
+            self,
+            "rFunction",
+            runtime=PYTHON_RUNTIME,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(
+                os.path.join(dirname, "functions", "fast_snapshot_restore")
+            ),
+            timeout=Duration.minutes(5),
+            environment={
+                "FAST_SNAPSHOT_RESTORE": json.dumps(availability_zones),
+                "IMAGE_ARN_PREFIX": image_arn_prefix,
+            },
+        )
+
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["imagebuilder:GetImage"],
+                resources=[f"{image_arn_prefix}*"],
+            )
+        )
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "ec2:DescribeImages",
+                    "ec2:EnableFastSnapshotRestores",
+                    "ec2:DisableFastSnapshotRestores",
+                ],
+                resources=["*"],
+            )
+        )
+
+        # image builder sends this event once the image and all its distributed copies are available
+        events.Rule(
+            self,
+            "rImageAvailableRule",
+            event_pattern=events.EventPattern(
+                source=["aws.imagebuilder"],
+                detail_type=["EC2 Image Builder Image State Change"],
+                detail={"state": {"status": ["AVAILABLE"]}},
+                resources=events.Match.prefix(image_arn_prefix),
+            ),
+            targets=[targets.LambdaFunction(function)],
+        )
+
+        NagSuppressions.add_resource_suppressions(
+            function,
+            suppressions=[
+                {
+                    "id": "AwsSolutions-IAM4",
+                    "reason": "AWSLambdaBasicExecutionRole only allows writing the function logs",
+                },
+                PYTHON_RUNTIME_SUPPRESSION,
+                {
+                    "id": "AwsSolutions-IAM5",
+                    "reason": "Fast snapshot restore actions do not support resource level permissions and image versions are not known in advance",
+                },
+            ],
+            apply_to_children=True,
+        )
@@ -0,0 +1,218 @@
+"""Starts image builder pipelines whose image is out of date, a few at a time.
+
+Triggered on a schedule. PIPELINES lists every managed pipeline with its
+parent pipeline and build subnet, parents first. A pipeline is started when no
+image was built from its current recipe version yet, e.g. because a component
+changed, or when its parent pipeline built a newer image than its latest one.
+
+At most MAX_CONCURRENT_BUILDS builds run at the same time, and at most
+MAX_CONCURRENT_BUILDS_PER_SUBNET in the same subnet, so builds do not compete
+for the same NAT bandwidth. A pipeline is not started while its parent builds.
+
+A pipeline that built before is not started when an AMI tagged with the
+fingerprint of its recipe inputs was built in the last FINGERPRINT_MAX_AGE_DAYS,
+e.g. by another pipeline with the same recipe, as the build would produce the
+same image. That AMI is published to the latest AMI parameter of the pipeline
+instead and tagged with REUSED_TAG_PREFIX and the pipeline name. Older images
+are rebuilt to pick up package updates. The AMI of a layered pipeline must also
+be newer than the latest image of its parent, and parent pipelines always build,
+as their children are built on top of their own latest image.
+"""
+import datetime
+import json
+import logging
+import os
+import uuid
+
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PIPELINES = json.loads(os.environ["PIPELINES"])
+MAX_CONCURRENT_BUILDS = int(os.environ["MAX_CONCURRENT_BUILDS"])
+MAX_CONCURRENT_BUILDS_PER_SUBNET = int(os.environ["MAX_CONCURRENT_BUILDS_PER_SUBNET"])
+FINGERPRINT_TAG = os.environ["FINGERPRINT_TAG"]
+FINGERPRINT_MAX_AGE_DAYS = int(os.environ["FINGERPRINT_MAX_AGE_DAYS"])
+REUSED_TAG_PREFIX = "ReusedBy:"
+
+BUILDING = {
+    "PENDING",
+    "CREATING",
+    "BUILDING",
+    "TESTING",
+    "DISTRIBUTING",
+    "INTEGRATING",
+}
+
+
+def _images(imagebuilder, pipeline_arn: str) -> list:
+    images = []
+    paginator = imagebuilder.get_paginator("list_image_pipeline_images")
+    for page in paginator.paginate(imagePipelineArn=pipeline_arn):
+        images.extend(page["imageSummaryList"])
+    return images
+
+
+def _latest(images: list, statuses: set = None) -> str:
+    # dateCreated is an ISO 8601 timestamp, so the latest one sorts last
+    dates = [
+        image["dateCreated"]
+        for image in images
+        if statuses is None or image["state"]["status"] in statuses
+    ]
+    return max(dates, default="")
+
+
+def build_reason(pipeline: dict, recipe_version: str, images: dict):
+    """Returns why a pipeline should build, or None when its image is up to date.
+
+    Failed builds count as built, so a broken recipe is not retried on every run.
+    """
+    own_images = images[pipeline["arn"]]
+    # image versions are <recipe version>/<build number>
+    if not any(
+        image["version"].split("/")[0] == recipe_version for image in own_images
+    ):
+        return f"no image of recipe version {recipe_version}"
+
+    parent = pipeline.get("parent")
+    if parent and _latest(images[parent], {"AVAILABLE"}) > _latest(own_images):
+        return "parent pipeline built a newer image"
+
+    return None
+
+
+def fingerprint_image(ec2, fingerprint: str, built_after: str = ""):
+    """Returns the id of the latest recent AMI built from the same recipe inputs, or None.
+
+    Only AMIs created after built_after, an ISO 8601 timestamp, count.
+    """
+    oldest = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        days=FINGERPRINT_MAX_AGE_DAYS
+    )
+    images = ec2.describe_images(
+        Owners=["self"],
+        Filters=[{"Name": f"tag:{FINGERPRINT_TAG}", "Values": [fingerprint]}],
+    )["Images"]
+    # CreationDate is an ISO 8601 timestamp, so it compares as a string
+    newer_than = max(oldest.isoformat(), built_after)
+    amis = [ami for ami in images if ami["CreationDate"] > newer_than]
+    if not amis:
+        return None
+    return max(amis, key=lambda ami: ami["CreationDate"])["ImageId"]
+
+
+def publish_image(ssm, ec2, pipeline: dict, ami_id: str) -> bool:
+    """Publishes a reused AMI as the latest AMI of the pipeline, returns False when it already is."""
+    try:
+        current = ssm.get_parameter(Name=pipeline["parameter"])["Parameter"]["Value"]
+    except ssm.exceptions.ParameterNotFound:
+        current = None
+    if current == ami_id:
+        return False
+
+    ssm.put_parameter(
+        Name=pipeline["parameter"],
+        Value=ami_id,
+        Type="String",
+        DataType="aws:ec2:image",
+        Description=f"Latest AMI of {pipeline['arn']}, reused by its fingerprint",
+        Overwrite=True,
+    )
+    ec2.create_tags(
+        Resources=[ami_id],
+        Tags=[
+            {
+                "Key": f"{REUSED_TAG_PREFIX}{pipeline['name']}",
+                "Value": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+        ],
+    )
+    return True
+
+
+def _building(pipelines: list, images: dict) -> list:
+    return [
+        pipeline
+        for pipeline in pipelines
+        if any(
+            image["state"]["status"] in BUILDING for image in images[pipeline["arn"]]
+        )
+    ]
+
+
+def _blocked(pipeline: dict, building: list) -> bool:
+    """Whether the pipeline or its parent builds, or its subnet has no free build."""
+    building_arns = [running["arn"] for running in building]
+    if pipeline["arn"] in building_arns or pipeline.get("parent") in building_arns:
+        return True
+    subnet_builds = [
+        running for running in building if running["subnet"] == pipeline["subnet"]
+    ]
+    return len(subnet_builds) >= MAX_CONCURRENT_BUILDS_PER_SUBNET
+
+
+def _reused(ssm, ec2, pipeline: dict, reason: str, images: dict) -> bool:
+    """Whether a recent AMI with the fingerprint of the pipeline replaces its build."""
+    parent = pipeline.get("parent")
+    # an image of a layered pipeline must include the latest image of its parent
+    parent_built = _latest(images[parent], {"AVAILABLE"}) if parent else ""
+    ami_id = fingerprint_image(ec2, pipeline["fingerprint"], parent_built)
+    if not ami_id:
+        return False
+    if publish_image(ssm, ec2, pipeline, ami_id):
+        logger.info(
+            "Not starting %s: %s, but published %s with the same fingerprint",
+            pipeline["arn"],
+            reason,
+            ami_id,
+        )
+    return True
+
+
+def start_builds(imagebuilder, ec2, ssm, pipelines: list, images: dict) -> list:
+    """Starts the out of date pipelines that fit in the concurrency caps, returns the started ones."""
+    building = _building(pipelines, images)
+    parents = {pipeline.get("parent") for pipeline in pipelines}
+    started = []
+
+    for pipeline in pipelines:
+        if len(building) >= MAX_CONCURRENT_BUILDS:
+            logger.info("%s builds running, not starting more", len(building))
+            break
+        if _blocked(pipeline, building):
+            continue
+
+        recipe_arn = imagebuilder.get_image_pipeline(imagePipelineArn=pipeline["arn"])[
+            "imagePipeline"
+        ]["imageRecipeArn"]
+        reason = build_reason(pipeline, recipe_arn.split("/")[-1], images)
+        if not reason:
+            continue
+
+        # a pipeline that never built keeps its first build, so its latest image resolves for its children,
+        # and parents always build, as their children use their latest image rather than the parameter
+        reusable = images[pipeline["arn"]] and pipeline["arn"] not in parents
+        if reusable and _reused(ssm, ec2, pipeline, reason, images):
+            continue
+
+        logger.info("Starting %s: %s", pipeline["arn"], reason)
+        imagebuilder.start_image_pipeline_execution(
+            imagePipelineArn=pipeline["arn"], clientToken=str(uuid.uuid4())
+        )
+        building.append(pipeline)
+        started.append(pipeline)
+
+    return started
+
+
+def handler(event, context):
+    imagebuilder = boto3.client("imagebuilder")
+    images = {
+        pipeline["arn"]: _images(imagebuilder, pipeline["arn"])
+        for pipeline in PIPELINES
+    }
+    start_builds(
+        imagebuilder, boto3.client("ec2"), boto3.client("ssm"), PIPELINES, images
+    )
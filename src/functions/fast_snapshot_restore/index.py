@@ -0,0 +1,76 @@
+"""Enables fast snapshot restore for the snapshots of a newly built AMI.
+
+Triggered by the EventBridge event image builder sends when an image becomes
+AVAILABLE. FAST_SNAPSHOT_RESTORE maps each region to the availability zones
+in which snapshots are pre-warmed. Fast snapshot restore is disabled again for
+the snapshots of older AMIs built by the same recipe, so only the latest
+image is kept warm.
+"""
+import json
+import logging
+import os
+
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+FAST_SNAPSHOT_RESTORE = json.loads(os.environ["FAST_SNAPSHOT_RESTORE"])
+IMAGE_ARN_PREFIX = os.environ["IMAGE_ARN_PREFIX"]
+
+
+def _snapshot_ids(image: dict) -> list:
+    return [
+        mapping["Ebs"]["SnapshotId"]
+        for mapping in image.get("BlockDeviceMappings", [])
+        if "SnapshotId" in mapping.get("Ebs", {})
+    ]
+
+
+def _restore_snapshots(ec2, ami_id: str, availability_zones: list) -> None:
+    images = ec2.describe_images(
+        Owners=["self"],
+        Filters=[
+            {"Name": "tag:Ec2ImageBuilderArn", "Values": [f"{IMAGE_ARN_PREFIX}*"]}
+        ],
+    )["Images"]
+
+    for image in images:
+        snapshot_ids = _snapshot_ids(image)
+        if not snapshot_ids:
+            continue
+
+        if image["ImageId"] == ami_id:
+            logger.info(
+                "Enabling fast snapshot restore for %s in %s",
+                snapshot_ids,
+                availability_zones,
+            )
+            ec2.enable_fast_snapshot_restores(
+                AvailabilityZones=availability_zones, SourceSnapshotIds=snapshot_ids
+            )
+        else:
+            ec2.disable_fast_snapshot_restores(
+                AvailabilityZones=availability_zones, SourceSnapshotIds=snapshot_ids
+            )
+
+
+def handler(event, context):
+    image_arn = event["resources"][0]
+    image = boto3.client("imagebuilder").get_image(imageBuildVersionArn=image_arn)[
+        "image"
+    ]
+    account_id = context.invoked_function_arn.split(":")[4]
+
+    for ami in image["outputResources"]["amis"]:
+        availability_zones = FAST_SNAPSHOT_RESTORE.get(ami["region"])
+
+        # copies shared with other accounts are managed by those accounts
+        if not availability_zones or ami.get("accountId", account_id) != account_id:
+            continue
+
+        _restore_snapshots(
+            boto3.client("ec2", region_name=ami["region"]),
+            ami["image"],
+            availability_zones,
+        )
@@ -0,0 +1,70 @@
+"""Stores the id of a newly built AMI in the PARAMETER_NAME SSM parameter.
+
+Triggered by the EventBridge event image builder sends when an image becomes
+AVAILABLE. The parameter is written in every region the AMI was distributed
+to, with the aws:ec2:image data type, so CloudFormation can resolve it as an
+AWS::EC2::Image::Id. Copies in other accounts are published through the
+PUBLISH_ROLE_NAME role of those accounts, and skipped when it is empty.
+"""
+import logging
+import os
+
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PARAMETER_NAME = os.environ["PARAMETER_NAME"]
+PUBLISH_ROLE_NAME = os.environ.get("PUBLISH_ROLE_NAME", "")
+
+
+def _ssm_client(partition: str, account_id: str, ami: dict):
+    if ami.get("accountId", account_id) == account_id:
+        return boto3.client("ssm", region_name=ami["region"])
+    if not PUBLISH_ROLE_NAME:
+        return None
+
+    credentials = boto3.client("sts").assume_role(
+        RoleArn=f"arn:{partition}:iam::{ami['accountId']}:role/{PUBLISH_ROLE_NAME}",
+        RoleSessionName="latest-ami-parameter",
+    )["Credentials"]
+    return boto3.client(
+        "ssm",
+        region_name=ami["region"],
+        aws_access_key_id=credentials["AccessKeyId"],
+        aws_secret_access_key=credentials["SecretAccessKey"],
+        aws_session_token=credentials["SessionToken"],
+    )
+
+
+def handler(event, context):
+    image_arn = event["resources"][0]
+    image = boto3.client("imagebuilder").get_image(imageBuildVersionArn=image_arn)[
+        "image"
+    ]
+    _, partition, _, _, account_id, _ = context.invoked_function_arn.split(":", 5)
+
+    for ami in image["outputResources"]["amis"]:
+        ssm = _ssm_client(partition, account_id, ami)
+        if not ssm:
+            logger.info(
+                "Not publishing %s in %s, there is no publish role",
+                ami["image"],
+                ami["accountId"],
+            )
+            continue
+
+        logger.info(
+            "Publishing %s in %s %s",
+            ami["image"],
+            ami.get("accountId", account_id),
+            ami["region"],
+        )
+        ssm.put_parameter(
+            Name=PARAMETER_NAME,
+            Value=ami["image"],
+            Type="String",
+            DataType="aws:ec2:image",
+            Description=f"Latest AMI built by {image_arn.rsplit('/', 2)[0]}",
+            Overwrite=True,
+        )
@@ -0,0 +1,490 @@
+from aws_cdk import Stack
+from aws_cdk import aws_imagebuilder as imagebuilder
+from aws_cdk import aws_s3_assets as s3_assets
+from aws_cdk import aws_ssm as ssm
+from constructs import Construct
+
+from src.block_devices import block_device_mappings
+from src.build_infrastructure import BuildInfrastructure
+from src.component_registry import (
+    FINGERPRINT_TAG,
+    ComponentRegistry,
+    recipe_fingerprint,
+)
+from src.component_validator import validate_component, validate_document
+from src.container_image import (
+    DOCKERFILE_TEMPLATES,
+    ContainerPipeline,
+    container_dockerfile_template,
+    container_parent_image,
+)
+from src.context_snapshot import snapshot_parameter
+from src.distribution import ImageDistribution
+from src.fast_snapshot_restore import FastSnapshotRestore
+from src.latest_image import LatestImageParameter
+from src.package_cache import with_package_cache
+from src.performance_tests import performance_test_entry, shrink_image_entry
+from src.recipe_compiler import compile_recipe
+from src.s3_ops import components_bucket_name
+from src.service_catalog import latest_ami_parameter_name
+from src.step_dashboard import StepDashboard
+from src.step_metrics import PIPELINE_PARAMETER
+
+DEPENDENCY_UPDATES = "EXPRESSION_MATCH_AND_DEPENDENCY_UPDATES_AVAILABLE"
+
+
+class ImageBuilderPipeline(Stack):
+    """Image builder pipeline described by a pipeline spec from the `pipelines` context.
+
+    The spec options are documented in operations/operations.md.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        spec: dict,
+        registry: ComponentRegistry,
+        build_infrastructure: BuildInfrastructure,
+        parent: "ImageBuilderPipeline" = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        name = spec["name"]
+        self.recipe_name = f"r{name}Recipe"
+        self.pipeline_name = f"{name}ImagePipeline"
+        self._components = {}
+
+        package_cache = spec.get(
+            "package_cache", self.node.try_get_context("package_cache")
+        )
+        performance_tests = self._performance_tests(spec)
+        component_entries, documents, source_entries = self._recipe_entries(
+            spec, registry, package_cache, performance_tests
+        )
+
+        recipe_inputs = {
+            "components": component_inputs(registry, component_entries),
+            "parent_image": self._parent_image(spec, build_infrastructure, parent),
+            "root_volume_size": spec.get("root_volume_size"),
+            "block_devices": spec.get("block_devices"),
+        }
+        # options that are not set are left out so adding a new option does not change existing recipe versions
+        recipe_inputs = {
+            key: value for key, value in recipe_inputs.items() if value is not None
+        }
+        self._fingerprint(spec, registry, parent, recipe_inputs, source_entries)
+        recipe = self._recipe(
+            spec, registry, recipe_inputs, component_entries, documents
+        )
+
+        infra_config = build_infrastructure.pipeline_configuration(spec)
+        distribution_configuration_arn = self._distribution(spec)
+
+        # duration and downloads of every component step, reported by the instrumented components
+        StepDashboard(self, "rStepDashboard", name=name, documents=documents)
+
+        schedule = pipeline_schedule(
+            spec.get("schedule", self.node.try_get_context("schedule"))
+        )
+
+        # the same components built into a docker image pushed to ECR, see src/container_image.py
+        if spec.get("container") is not None:
+            self._container_pipeline(
+                spec, registry, package_cache, infra_config.attr_arn, schedule
+            )
+
+        # build the imagebuilder pipeline
+        imagebuilder.CfnImagePipeline(
+            self,
+            "rPipeline",
+            name=self.pipeline_name,
+            image_recipe_arn=recipe.attr_arn,
+            infrastructure_configuration_arn=infra_config.attr_arn,
+            distribution_configuration_arn=distribution_configuration_arn,
+            schedule=schedule,
+            image_tests_configuration=imagebuilder.CfnImagePipeline.ImageTestsConfigurationProperty(
+                image_tests_enabled=True,
+                timeout_minutes=performance_tests.get("timeout_minutes", 720),
+            )
+            if performance_tests
+            else None,
+        )
+
+    def _parent_image(
+        self,
+        spec: dict,
+        build_infrastructure: BuildInfrastructure,
+        parent: "ImageBuilderPipeline",
+    ) -> str:
+        # the image of the parent pipeline is resolved to its latest version whenever this pipeline runs
+        if parent:
+            return parent.latest_image_arn
+        if not spec.get("base_image_parameter"):
+            return spec.get("base_image_id")
+
+        if not build_infrastructure.snapshot:
+            raise ValueError(
+                f"Pipeline {spec['name']} has a base_image_parameter but there is no context snapshot"
+            )
+        # the recorded value, so the recipe version only changes when the snapshot is refreshed
+        return snapshot_parameter(
+            build_infrastructure.snapshot, spec["base_image_parameter"]
+        )
+
+    def _performance_tests(self, spec: dict) -> dict:
+        # desktop performance tests run on an instance launched from the new image, see src/performance_tests.py
+        performance_tests = spec.get(
+            "performance_tests", self.node.try_get_context("performance_tests")
+        )
+        if performance_tests and performance_tests.get("enabled"):
+            return performance_tests
+        return None
+
+    def _recipe_entries(
+        self,
+        spec: dict,
+        registry: ComponentRegistry,
+        package_cache: dict,
+        performance_tests: dict,
+    ) -> tuple:
+        """Returns the component entries of the recipe, their documents and the entries to fingerprint."""
+        name = spec["name"]
+        bucket_name = components_bucket_name(self.account, self.region)
+
+        # components are either a path or a dict with the path and the parameters passed to the component
+        component_entries = [
+            entry if isinstance(entry, dict) else {"path": entry}
+            for entry in spec["components"]
+        ]
+        if package_cache:
+            component_entries = with_package_cache(
+                spec["os"], component_entries, package_cache, bucket_name
+            )
+
+        # the image is captured once caches and temporary files are removed, unless `shrink_image` is false
+        if spec.get("shrink_image", True):
+            component_entries.append(shrink_image_entry(spec["os"], bucket_name, name))
+
+        # component and recipe versions are derived from the content of the component yaml, so a new version
+        # is only created (and the image rebuilt) when the yaml actually changes.
+        documents = [
+            valid_document(registry, entry["path"]) for entry in component_entries
+        ]
+
+        # the compiled component is named after the pipeline, so the fingerprint uses the components it compiles
+        source_entries = list(component_entries)
+        if spec.get("compile_components"):
+            component_entries, documents = compiled_recipe(
+                registry, name, component_entries, documents
+            )
+
+        if performance_tests:
+            test_entry = performance_test_entry(
+                spec["os"], performance_tests, bucket_name, name
+            )
+            component_entries.append(test_entry)
+            source_entries.append(test_entry)
+            documents.append(valid_document(registry, test_entry["path"]))
+
+        return (
+            with_pipeline_parameter(component_entries, name),
+            documents,
+            source_entries,
+        )
+
+    def _recipe(
+        self,
+        spec: dict,
+        registry: ComponentRegistry,
+        recipe_inputs: dict,
+        component_entries: list,
+        documents: list,
+    ) -> imagebuilder.CfnImageRecipe:
+        components = []
+        for entry, document in zip(component_entries, documents):
+            component = self._component(registry, spec["name"], entry["path"], document)
+            parameters = [
+                imagebuilder.CfnImageRecipe.ComponentParameterProperty(
+                    name=parameter, value=[str(value)]
+                )
+                for parameter, value in entry.get("parameters", {}).items()
+            ]
+            components.append(
+                imagebuilder.CfnImageRecipe.ComponentConfigurationProperty(
+                    component_arn=component.attr_arn,
+                    parameters=parameters or None,
+                )
+            )
+
+        # recipe that installs all of above components on top of the base image
+        return imagebuilder.CfnImageRecipe(
+            self,
+            "rRecipe",
+            name=self.recipe_name,
+            version=registry.recipe_version(self.recipe_name, recipe_inputs),
+            components=components,
+            parent_image=recipe_inputs.get("parent_image"),
+            block_device_mappings=block_device_mappings(spec),
+        )
+
+    def _fingerprint(
+        self,
+        spec: dict,
+        registry: ComponentRegistry,
+        parent: "ImageBuilderPipeline",
+        recipe_inputs: dict,
+        source_entries: list,
+    ) -> None:
+        # identifies the content of the image across pipelines and builds: the recipe name and the parameters
+        # naming the pipeline are left out and the latest image of a parent pipeline stands for the fingerprint
+        # of the parent recipe; the build orchestrator only reuses images newer than the latest image of the parent
+        fingerprint_inputs = {
+            **recipe_inputs,
+            "components": component_inputs(registry, source_entries),
+        }
+        if spec.get("compile_components"):
+            fingerprint_inputs["compile_components"] = True
+        if parent:
+            fingerprint_inputs["parent_image"] = parent.fingerprint
+        self.fingerprint = recipe_fingerprint(fingerprint_inputs)
+
+        ssm.StringParameter(
+            self,
+            "rRecipeFingerprint",
+            parameter_name=f"/centralised-amis/{spec['name']}/recipe-fingerprint",
+            string_value=self.fingerprint,
+            description=f"Fingerprint of the recipe inputs of {spec['name']}, the {FINGERPRINT_TAG} tag of its AMIs",
+            tier=ssm.ParameterTier.STANDARD,
+        )
+
+    def _distribution(self, spec: dict) -> str:
+        """Distributes, pre-warms and publishes the AMI; returns the distribution configuration arn, if any."""
+        # copy the AMI to other regions and accounts as part of the build
+        distribution = spec.get(
+            "distribution", self.node.try_get_context("distribution")
+        )
+        self._publish(spec, distribution or {})
+
+        # trial images must not stand in for the images of the benchmarked pipeline
+        ami_tags = None if spec.get("trial_of") else {FINGERPRINT_TAG: self.fingerprint}
+        if not distribution and not ami_tags:
+            return None
+        return ImageDistribution(
+            self,
+            "rDistribution",
+            name=spec["name"],
+            distribution=distribution or {},
+            build_region=self.region,
+            ami_tags=ami_tags,
+        ).distribution_configuration.attr_arn
+
+    def _publish(self, spec: dict, distribution: dict) -> None:
+        # pre-warm the snapshots of the latest AMI so desktops do not hydrate them lazily on first boot
+        if spec.get("fast_snapshot_restore"):
+            FastSnapshotRestore(
+                self,
+                "rFastSnapshotRestore",
+                recipe_name=self.recipe_name,
+                availability_zones=spec["fast_snapshot_restore"],
+            )
+
+        # the latest AMI resolved by the service catalog products, trial images are never launched
+        if not spec.get("trial_of"):
+            LatestImageParameter(
+                self,
+                "rLatestImageParameter",
+                recipe_name=self.recipe_name,
+                parameter_name=latest_ami_parameter_name(spec["name"]),
+                target_accounts=[
+                    account
+                    for target in distribution.get("regions", [])
+                    for account in target.get("accounts") or []
+                ],
+                publish_role_name=distribution.get("publish_role_name"),
+            )
+
+    def _component(
+        self, registry: ComponentRegistry, name: str, path: str, document: dict
+    ) -> imagebuilder.CfnComponent:
+        # components are shared by the AMI and the container recipe of the pipeline
+        if path in self._components:
+            return self._components[path]
+
+        # the rendered component is a file asset keyed by its content hash, uploaded by the cdk cli
+        # only when no object with that hash exists yet
+        component_asset = s3_assets.Asset(
+            self,
+            f"rComponentAsset{document['name']}",
+            path=registry.rendered_component_path(path),
+        )
+        self._components[path] = imagebuilder.CfnComponent(
+            self,
+            f"rComponent{document['name']}",
+            # compiled components are already named after the pipeline
+            name=document["name"]
+            if path.startswith("compiled/")
+            else f"{name}{document['name']}",
+            description=document.get("description"),
+            platform="Linux",
+            version=registry.component_version(path),
+            uri=component_asset.s3_object_url,
+        )
+        return self._components[path]
+
+    def _container_pipeline(
+        self,
+        spec: dict,
+        registry: ComponentRegistry,
+        package_cache: dict,
+        infrastructure_configuration_arn: str,
+        schedule: imagebuilder.CfnImagePipeline.ScheduleProperty,
+    ) -> ContainerPipeline:
+        name = spec["name"]
+        container = spec["container"]
+
+        # the components of the AMI unless the container needs others, e.g. without services started by systemd
+        component_entries = [
+            entry if isinstance(entry, dict) else {"path": entry}
+            for entry in container.get("components", spec["components"])
+        ]
+        if package_cache:
+            component_entries = with_package_cache(
+                spec["os"],
+                component_entries,
+                package_cache,
+                components_bucket_name(self.account, self.region),
+            )
+        component_entries = with_pipeline_parameter(component_entries, name)
+
+        components = []
+        for entry in component_entries:
+            document = valid_document(registry, entry["path"])
+            component = self._component(registry, name, entry["path"], document)
+            components.append((component.attr_arn, entry.get("parameters", {})))
+
+        recipe_name = f"r{name}ContainerRecipe"
+        parent_image = container_parent_image(spec["os"], container)
+        dockerfile_template = container_dockerfile_template(spec["os"], container)
+        # the os independent default template is left out, recipes using it keep their version
+        custom_template = container.get(
+            "dockerfile_template", DOCKERFILE_TEMPLATES.get(spec["os"])
+        )
+        recipe_inputs = {
+            "components": component_inputs(registry, component_entries),
+            "parent_image": parent_image,
+            "dockerfile_template": custom_template,
+        }
+        recipe_inputs = {
+            key: value for key, value in recipe_inputs.items() if value is not None
+        }
+
+        return ContainerPipeline(
+            self,
+            "rContainer",
+            name=name,
+            container=container,
+            parent_image=parent_image,
+            dockerfile_template=dockerfile_template,
+            components=components,
+            recipe_version=registry.recipe_version(recipe_name, recipe_inputs),
+            infrastructure_configuration_arn=infrastructure_configuration_arn,
+            schedule=schedule,
+        )
+
+    @property
+    def pipeline_arn(self) -> str:
+        # image builder arns use the lower case resource name
+        return self.format_arn(
+            service="imagebuilder",
+            resource="image-pipeline",
+            resource_name=self.pipeline_name.lower(),
+        )
+
+    @property
+    def latest_image_arn(self) -> str:
+        # x.x.x selects the latest version of the image when it is used
+        return self.format_arn(
+            service="imagebuilder",
+            resource="image",
+            resource_name=f"{self.recipe_name.lower()}/x.x.x",
+        )
+
+
+def compiled_recipe(
+    registry: ComponentRegistry, name: str, component_entries: list, documents: list
+) -> tuple:
+    """Compiles the components of a pipeline into one, returns its entry and document in lists."""
+    # a single component with one package install per package manager, see src/recipe_compiler.py
+    compiled, compiled_parameters = compile_recipe(
+        f"{name}Compiled", list(zip(documents, component_entries))
+    )
+    errors = validate_document(compiled)
+    if errors:
+        details = "\n  ".join(errors)
+        raise ValueError(f"Compiled component of {name} is invalid:\n  {details}")
+    registry.register_document(f"compiled/{name}.yml", compiled)
+    entry = {"path": f"compiled/{name}.yml", "parameters": compiled_parameters}
+    return [entry], [compiled]
+
+
+def valid_document(registry: ComponentRegistry, path: str) -> dict:
+    # fail the synth rather than a build instance when a component is broken
+    errors = validate_component(registry.component_path(path))
+    if errors:
+        details = "\n  ".join(errors)
+        raise ValueError(f"Component {path} is invalid:\n  {details}")
+    return registry.component_document(path)
+
+
+def with_pipeline_parameter(component_entries: list, name: str) -> list:
+    # the pipeline the instrumented steps report their metrics for, see src/step_metrics.py
+    return [
+        {
+            **entry,
+            "parameters": {**entry.get("parameters", {}), PIPELINE_PARAMETER: name},
+        }
+        for entry in component_entries
+    ]
+
+
+def component_inputs(registry: ComponentRegistry, component_entries: list) -> list:
+    # a list, as the order of the components matters
+    return [
+        [
+            entry["path"],
+            registry.component_version(entry["path"]),
+            entry.get("parameters"),
+        ]
+        for entry in component_entries
+    ]
+
+
+def pipeline_schedule(schedule):
+    """Image builder schedule from a cron `expression` and a `start_condition`.
+
+    A plain string is used as the expression, None or an empty value means the
+    pipeline only runs when it is started. Unless the start condition is
+    EXPRESSION_MATCH_ONLY, a scheduled run only builds when the parent image or
+    a component has a newer version than the last image.
+    """
+    if not schedule:
+        return None
+    if isinstance(schedule, str):
+        schedule = {"expression": schedule}
+
+    start_condition = schedule.get("start_condition", DEPENDENCY_UPDATES)
+    if start_condition not in (DEPENDENCY_UPDATES, "EXPRESSION_MATCH_ONLY"):
+        raise ValueError(
+            f"Schedule start_condition must be {DEPENDENCY_UPDATES} or EXPRESSION_MATCH_ONLY, not {start_condition}"
+        )
+    if not schedule.get("expression", "").startswith("cron("):
+        raise ValueError(
+            f"Schedule expression must be a cron() expression, not {schedule.get('expression')}"
+        )
+
+    return imagebuilder.CfnImagePipeline.ScheduleProperty(
+        schedule_expression=schedule["expression"],
+        pipeline_execution_start_condition=start_condition,
+    )
@@ -0,0 +1,304 @@
+"""Benchmarks build instance types and recommends the `instance_types` of a pipeline.
+
+The `instance_benchmark` context lists the `pipelines` to benchmark, the
+`instance_types` to try, their on-demand `prices` per hour and the
+`max_build_minutes` a build may take. For every benchmarked pipeline the app
+adds one trial pipeline per instance type, which builds the same recipe on that
+instance type only.
+
+    python -m src.instance_benchmark start                 # run every trial pipeline once
+    python -m src.instance_benchmark collect --output timings.json
+    python -m src.instance_benchmark recommend timings.json --write
+
+`collect` reads the build durations from the image builder log streams of the
+trial images. `recommend` ranks the instance types of every pipeline: instance
+types whose median build finishes within `max_build_minutes` come first,
+cheapest build first, followed by the slower ones, fastest first. `--write`
+stores the ranking as the `instance_types` of the pipeline in `cdk.json`, so
+image builder falls back to the next best instance type when the first one has
+no capacity.
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import statistics
+
+dirname = os.path.dirname(__file__)
+
+CDK_JSON_PATH = os.path.join(os.path.dirname(dirname), "cdk.json")
+
+
+def _type_suffix(instance_type: str) -> str:
+    # t3.medium becomes T3Medium
+    return "".join(
+        part.capitalize() for part in re.split(r"[^A-Za-z0-9]", instance_type)
+    )
+
+
+def trial_specs(specs: list, benchmark: dict) -> list:
+    """Returns one trial pipeline spec per benchmarked pipeline and instance type."""
+    specs_by_id = {spec["id"]: spec for spec in specs}
+    trials = []
+
+    for pipeline_id in benchmark.get("pipelines", []):
+        if pipeline_id not in specs_by_id:
+            raise ValueError(f"Cannot benchmark unknown pipeline {pipeline_id}")
+
+        for instance_type in benchmark["instance_types"]:
+            trial = copy.deepcopy(specs_by_id[pipeline_id])
+            suffix = _type_suffix(instance_type)
+            trial["id"] = f"{pipeline_id}{suffix}Trial"
+            trial["name"] = f"{trial['name']}{suffix}Trial"
+            trial["description"] = f"{trial.get('description')} ({instance_type} trial)"
+            trial["instance_types"] = [instance_type]
+            trial["trial_of"] = pipeline_id
+            # trials only build the AMI, they do not copy or pre-warm it; None also
+            # overrides the distribution context
+            trial["distribution"] = None
+            # trials only build when src.instance_benchmark starts them, None overrides the schedule context
+            trial["schedule"] = None
+            trial.pop("fast_snapshot_restore", None)
+            trial.pop("container", None)
+            trials.append(trial)
+
+    return trials
+
+
+def build_duration_seconds(log_streams: list) -> float:
+    """Duration of a build from the log streams image builder wrote for the image."""
+    first = min(stream["firstEventTimestamp"] for stream in log_streams)
+    last = max(stream["lastEventTimestamp"] for stream in log_streams)
+    return (last - first) / 1000
+
+
+def build_log_streams(log_streams: list, build_version: str) -> list:
+    """Keeps the log streams of a build version, a prefix of 1.0.0/1 also matches 1.0.0/10."""
+    return [
+        stream
+        for stream in log_streams
+        # the stream of the build version itself or the streams below it
+        if f"{stream['logStreamName']}/".startswith(f"{build_version}/")
+    ]
+
+
+def rank_instance_types(
+    durations: dict, prices: dict, max_build_minutes: float = None
+) -> list:
+    """Ranks instance types by the median duration of their builds.
+
+    `durations` maps each instance type to the durations in seconds of its
+    successful builds. Returns a list of dicts with the instance type, the
+    median duration and the cost of a build, best first.
+    """
+    results = []
+    for instance_type, seconds in durations.items():
+        if not seconds:
+            continue
+        if instance_type not in prices:
+            raise ValueError(f"No price configured for instance type {instance_type}")
+
+        median = statistics.median(seconds)
+        results.append(
+            {
+                "instance_type": instance_type,
+                "median_seconds": round(median, 1),
+                "builds": len(seconds),
+                "cost": round(median / 3600 * prices[instance_type], 4),
+            }
+        )
+
+    def rank(result):
+        if max_build_minutes is None:
+            return (0, result["cost"], result["median_seconds"])
+        if result["median_seconds"] <= max_build_minutes * 60:
+            return (0, result["cost"], result["median_seconds"])
+        return (1, result["median_seconds"], result["cost"])
+
+    return sorted(results, key=rank)
+
+
+WHITESPACE = re.compile(r"\s*")
+
+
+def _value_spans(text: str, start: int) -> dict:
+    """Maps the keys, or indexes, of the JSON object or array at start onto the spans of their values."""
+    decoder = json.JSONDecoder()
+    closing = "}" if text[start] == "{" else "]"
+    spans = {}
+    index = WHITESPACE.match(text, start + 1).end()
+    while text[index] != closing:
+        if closing == "}":
+            key, index = decoder.raw_decode(text, index)
+            # skip the colon after the key
+            index = WHITESPACE.match(
+                text, WHITESPACE.match(text, index).end() + 1
+            ).end()
+        else:
+            key = len(spans)
+        _, end = decoder.raw_decode(text, index)
+        spans[key] = (index, end)
+        index = WHITESPACE.match(text, end).end()
+        if text[index] == ",":
+            index = WHITESPACE.match(text, index + 1).end()
+    return spans
+
+
+def write_instance_types(
+    cdk_json: str,
+    pipeline_id: str,
+    instance_types: list,
+    keys: tuple = ("instance_types",),
+) -> str:
+    """Replaces the instance_types of a pipeline in the cdk.json text, keeping its formatting.
+
+    `keys` leads from the pipeline to the instance types, e.g. those of its product.
+    """
+    root = _value_spans(cdk_json, WHITESPACE.match(cdk_json).end())
+    context = _value_spans(cdk_json, root["context"][0])
+    for start, _ in _value_spans(cdk_json, context["pipelines"][0]).values():
+        # only the keys of the pipeline itself, not e.g. the instance_types of its product
+        members = _value_spans(cdk_json, start)
+        if json.loads(cdk_json[slice(*members["id"])]) != pipeline_id:
+            continue
+        for depth, key in enumerate(keys, 1):
+            if key not in members:
+                raise ValueError(
+                    f"Pipeline {pipeline_id} has no {'.'.join(keys)} in cdk.json"
+                )
+            value_start, value_end = members[key]
+            if depth < len(keys):
+                members = _value_spans(cdk_json, value_start)
+
+        return f"{cdk_json[:value_start]}{json.dumps(instance_types)}{cdk_json[value_end:]}"
+
+    raise ValueError(f"Pipeline {pipeline_id} not found in cdk.json")
+
+
+def _load_context(cdk_json_path: str) -> dict:
+    with open(cdk_json_path, encoding="utf-8") as cdk_json:
+        return json.load(cdk_json)["context"]
+
+
+def _pipeline_arn(imagebuilder, name: str) -> str:
+    pipelines = imagebuilder.list_image_pipelines(
+        filters=[{"name": "name", "values": [f"{name}ImagePipeline"]}]
+    )["imagePipelineList"]
+    if not pipelines:
+        raise ValueError(f"Trial pipeline {name}ImagePipeline is not deployed")
+    return pipelines[0]["arn"]
+
+
+def _paginated(client, operation: str, key: str, **kwargs) -> list:
+    # trial pipelines keep every image and a build writes a log stream per step, both span several pages
+    paginator = client.get_paginator(operation)
+    return [item for page in paginator.paginate(**kwargs) for item in page[key]]
+
+
+def start(context: dict) -> None:
+    import boto3
+
+    imagebuilder = boto3.client("imagebuilder")
+    for trial in trial_specs(context["pipelines"], context["instance_benchmark"]):
+        imagebuilder.start_image_pipeline_execution(
+            imagePipelineArn=_pipeline_arn(imagebuilder, trial["name"])
+        )
+        print(f"Started {trial['name']}ImagePipeline")
+
+
+def collect(context: dict) -> dict:
+    """Returns the durations of the successful builds of every trial pipeline."""
+    import boto3
+
+    imagebuilder = boto3.client("imagebuilder")
+    log_client = boto3.client("logs")
+
+    timings = {}
+    for trial in trial_specs(context["pipelines"], context["instance_benchmark"]):
+        recipe_name = f"r{trial['name']}Recipe"
+        durations = timings.setdefault(trial["trial_of"], {}).setdefault(
+            trial["instance_types"][0], []
+        )
+
+        images = _paginated(
+            imagebuilder,
+            "list_image_pipeline_images",
+            "imageSummaryList",
+            imagePipelineArn=_pipeline_arn(imagebuilder, trial["name"]),
+        )
+        for image in images:
+            if image["state"]["status"] != "AVAILABLE":
+                continue
+            # log streams are named after the image build version, e.g. 1.0.0/1
+            build_version = "/".join(image["arn"].split("/")[-2:])
+            log_streams = build_log_streams(
+                _paginated(
+                    log_client,
+                    "describe_log_streams",
+                    "logStreams",
+                    logGroupName=f"/aws/imagebuilder/{recipe_name}",
+                    logStreamNamePrefix=build_version,
+                ),
+                build_version,
+            )
+            if log_streams:
+                durations.append(build_duration_seconds(log_streams))
+
+    return timings
+
+
+def recommend(timings: dict, benchmark: dict) -> dict:
+    """Ranks the instance types of every benchmarked pipeline."""
+    return {
+        pipeline_id: rank_instance_types(
+            durations, benchmark["prices"], benchmark.get("max_build_minutes")
+        )
+        for pipeline_id, durations in timings.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cdk-json", default=CDK_JSON_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("start", help="run every trial pipeline once")
+    collect_parser = commands.add_parser(
+        "collect", help="record the build durations of the trial pipelines"
+    )
+    collect_parser.add_argument("--output", required=True)
+    recommend_parser = commands.add_parser(
+        "recommend", help="rank instance types from recorded build durations"
+    )
+    recommend_parser.add_argument("timings")
+    recommend_parser.add_argument(
+        "--write", action="store_true", help="store the ranking in cdk.json"
+    )
+    args = parser.parse_args()
+
+    context = _load_context(args.cdk_json)
+
+    if args.command == "start":
+        start(context)
+    elif args.command == "collect":
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(collect(context), output, indent=2)
+            output.write("\n")
+    else:
+        with open(args.timings, encoding="utf-8") as timings_file:
+            ranking = recommend(json.load(timings_file), context["instance_benchmark"])
+        print(json.dumps(ranking, indent=2))
+
+        if args.write:
+            with open(args.cdk_json, encoding="utf-8") as cdk_json:
+                text = cdk_json.read()
+            for pipeline_id, results in ranking.items():
+                text = write_instance_types(
+                    text, pipeline_id, [result["instance_type"] for result in results]
+                )
+            with open(args.cdk_json, "w", encoding="utf-8") as cdk_json:
+                cdk_json.write(text)
+
+
+if __name__ == "__main__":
+    main()
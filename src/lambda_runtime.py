@@ -0,0 +1,10 @@
+from aws_cdk import aws_lambda as lambda_
+
+# runtime of the python functions, not yet a predefined runtime of the pinned aws-cdk-lib
+PYTHON_RUNTIME = lambda_.Runtime("python3.12", lambda_.RuntimeFamily.PYTHON)
+
+# cdk-nag only knows the runtimes of the pinned aws-cdk-lib, so it flags PYTHON_RUNTIME as outdated
+PYTHON_RUNTIME_SUPPRESSION = {
+    "id": "AwsSolutions-L1",
+    "reason": "python3.12 is newer than the latest runtime known to the pinned aws-cdk-lib",
+}
@@ -0,0 +1,115 @@
+import os
+
+from aws_cdk import Duration, Stack
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as targets
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from cdk_nag import NagSuppressions
+from constructs import Construct
+
+from src.lambda_runtime import PYTHON_RUNTIME, PYTHON_RUNTIME_SUPPRESSION
+
+dirname = os.path.dirname(__file__)
+
+
+class LatestImageParameter(Construct):
+    """Publishes the id of the latest AMI built from a recipe to an SSM parameter.
+
+    The parameter is updated in every region the AMI is distributed to, so
+    templates launching the image, e.g. the Service Catalog products, resolve
+    the latest AMI instead of a fixed AMI id. In the `target_accounts` the AMI
+    is copied to, the function assumes their `publish_role_name` role to
+    update the parameter; without a role only this account is updated.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        recipe_name: str,
+        parameter_name: str,
+        target_accounts: list = None,
+        publish_role_name: str = None,
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        stack = Stack.of(self)
+        image_arn_prefix = stack.format_arn(
+            service="imagebuilder",
+            resource="image",
+            resource_name=f"{recipe_name.lower()}/",
+        )
+
+        function = lambda_.Function(
+            self,
+            "rFunction",
+            runtime=PYTHON_RUNTIME,
+            handler="index.handler",
+            code=lambda_.Code.from_asset(
+                os.path.join(dirname, "functions", "latest_image_parameter")
+            ),
+            timeout=Duration.minutes(1),
+            environment={
+                "PARAMETER_NAME": parameter_name,
+                "PUBLISH_ROLE_NAME": publish_role_name or "",
+            },
+        )
+
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["imagebuilder:GetImage"],
+                resources=[f"{image_arn_prefix}*"],
+            )
+        )
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["ssm:PutParameter"],
+                resources=[
+                    f"arn:{stack.partition}:ssm:*:{stack.account}:parameter{parameter_name}"
+                ],
+            )
+        )
+
+        if publish_role_name and target_accounts:
+            function.add_to_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    actions=["sts:AssumeRole"],
+                    resources=[
+                        f"arn:{stack.partition}:iam::{account}:role/{publish_role_name}"
+                        for account in sorted(set(target_accounts))
+                    ],
+                )
+            )
+
+        # image builder sends this event once the image and all its distributed copies are available
+        events.Rule(
+            self,
+            "rImageAvailableRule",
+            event_pattern=events.EventPattern(
+                source=["aws.imagebuilder"],
+                detail_type=["EC2 Image Builder Image State Change"],
+                detail={"state": {"status": ["AVAILABLE"]}},
+                resources=events.Match.prefix(image_arn_prefix),
+            ),
+            targets=[targets.LambdaFunction(function)],
+        )
+
+        NagSuppressions.add_resource_suppressions(
+            function,
+            suppressions=[
+                {
+                    "id": "AwsSolutions-IAM4",
+                    "reason": "AWSLambdaBasicExecutionRole only allows writing the function logs",
+                },
+                PYTHON_RUNTIME_SUPPRESSION,
+                {
+                    "id": "AwsSolutions-IAM5",
+                    "reason": "Image versions are not known in advance and the parameter is updated in every region the AMI is distributed to",
+                },
+            ],
+            apply_to_children=True,
+        )
@@ -0,0 +1,113 @@
+"""Package proxy and artifact cache used to avoid internet downloads during builds.
+
+Run `python -m src.package_cache` to download the cached artifacts into
+`src/artifacts` before deploying the `S3Ops` stack, which uploads them to the
+components bucket.
+"""
+import ipaddress
+import logging
+import os
+import urllib.parse
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+dirname = os.path.dirname(__file__)
+
+ARTIFACTS_DIR = os.path.join(dirname, "artifacts")
+
+# installers downloaded by components, keyed by the name they are cached under
+ARTIFACTS = {
+    "awscliv2.zip": "https://awscli.amazonaws.com/awscli-exe-linux-x86_64.zip",
+    "aws-cfn-bootstrap-py3-latest.tar.gz": "https://s3.amazonaws.com/cloudformation-examples/aws-cfn-bootstrap-py3-latest.tar.gz",
+}
+
+# components downloading the cached installers, for the operating systems whose components use them
+FETCH_ARTIFACTS_COMPONENTS = {
+    "ubuntu": "ubuntu/fetch_cached_artifacts.yml",
+}
+
+
+def with_package_cache(
+    os_name: str, components: list, package_cache: dict, bucket_name: str
+) -> list:
+    """Surrounds the components of a recipe with the components using the cache.
+
+    `proxy` points apt or yum at a caching proxy for the duration of the build and
+    `artifacts` downloads the cached installers from the components bucket before
+    any other component runs.
+    """
+    before = []
+    after = []
+
+    if package_cache.get("proxy"):
+        before.append(
+            {
+                "path": f"{os_name}/configure_package_proxy.yml",
+                "parameters": {"Proxy": package_cache["proxy"]},
+            }
+        )
+        # the image must not depend on the proxy once it is launched
+        after.append({"path": f"{os_name}/remove_package_proxy.yml"})
+
+    if package_cache.get("artifacts") and os_name in FETCH_ARTIFACTS_COMPONENTS:
+        before.append(
+            {
+                "path": FETCH_ARTIFACTS_COMPONENTS[os_name],
+                "parameters": {"ArtifactBucket": bucket_name},
+            }
+        )
+
+    return before + components + after
+
+
+def uses_artifacts(specs: list, package_cache: dict) -> bool:
+    """Whether a pipeline downloads the cached installers, `package_cache` being the context default."""
+    for spec in specs:
+        cache = spec.get("package_cache", package_cache) or {}
+        if cache.get("artifacts") and spec.get("os") in FETCH_ARTIFACTS_COMPONENTS:
+            return True
+    return False
+
+
+def with_proxy_egress_rule(egress_rules: list, proxy: str) -> list:
+    """Adds an egress rule letting the build instances reach the proxy at the `proxy` url.
+
+    The rules are returned unchanged when one of them already allows the proxy.
+    """
+    url = urllib.parse.urlsplit(proxy)
+    if url.scheme not in ("http", "https") or not url.hostname:
+        raise ValueError(
+            f"package_cache proxy must be an http or https url, not {proxy}"
+        )
+
+    try:
+        cidr = f"{ipaddress.IPv4Address(url.hostname)}/32"
+    except ValueError:
+        # a host name may resolve to any address
+        cidr = "0.0.0.0/0"
+    port = url.port or (443 if url.scheme == "https" else 80)
+
+    allowed = {(rule.get("cidr", "0.0.0.0/0"), rule["port"]) for rule in egress_rules}
+    if {(cidr, port), ("0.0.0.0/0", port)} & allowed:
+        return egress_rules
+    return egress_rules + [
+        {
+            "cidr": cidr,
+            "port": port,
+            "description": "Allow traffic to the package proxy",
+        }
+    ]
+
+
+def download_artifacts(artifacts_dir: str = ARTIFACTS_DIR) -> None:
+    os.makedirs(artifacts_dir, exist_ok=True)
+
+    for name, url in ARTIFACTS.items():
+        logger.info("Downloading %s", url)
+        urllib.request.urlretrieve(url, os.path.join(artifacts_dir, name))  # nosec B310
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    download_artifacts()
@@ -0,0 +1,224 @@
+"""Desktop performance tests run on an instance launched from every new image.
+
+The `performance_tests` context, or the same key of a pipeline spec, adds the
+`test_desktop_performance.yml` component of the pipeline's `os` to the recipe.
+Its test phase measures how long xrdp and a MATE session over RDP take to
+start, the cold start of Firefox and LibreOffice and the read throughput of the
+root volume. The results are stored in the components bucket under
+`performance/<pipeline name>/`, and the build fails when a result exceeds its
+`thresholds`.
+
+    python -m src.performance_tests report AmazonLinuxMateWorkspace --bucket <components bucket>
+
+prints the stored results of a pipeline, oldest first, to trend them across
+images.
+
+The `shrink_image.yml` component stores the disk usage of every image under
+`performance/<pipeline name>/volume/`.
+
+    python -m src.performance_tests root-volume UbuntuImagebuilderPipeline --bucket <components bucket>
+
+proposes the `root_volume_size` of a pipeline in cdk.json that leaves
+`--free-gib` free on its latest image, but not below the root snapshot of its
+parent image, as a volume can not be smaller than the snapshot it is created
+from. Without the parent image, e.g. before its parameter exists, the current
+`root_volume_size` is the lower bound.
+"""
+import argparse
+import json
+import os
+
+dirname = os.path.dirname(__file__)
+
+CDK_JSON_PATH = os.path.join(os.path.dirname(dirname), "cdk.json")
+
+# threshold keys of the `performance_tests` context and the component parameters they set
+THRESHOLD_PARAMETERS = {
+    "max_session_start_seconds": "MaxSessionStartSeconds",
+    "max_firefox_start_seconds": "MaxFirefoxStartSeconds",
+    "max_libreoffice_start_seconds": "MaxLibreOfficeStartSeconds",
+    "min_disk_read_mibps": "MinDiskReadMiBps",
+}
+
+RESULTS_PREFIX = "performance"
+# below the results of a pipeline, so the desktop test results do not include them
+VOLUME_PREFIX = "volume"
+# parameters storing results under the pipeline name, they do not change the image
+RESULTS_PARAMETERS = ("ResultsBucket", "ResultsPrefix")
+
+
+def performance_test_entry(
+    os_name: str, performance_tests: dict, bucket_name: str, pipeline_name: str
+) -> dict:
+    """Returns the component entry of the performance tests of a recipe."""
+    thresholds = performance_tests.get("thresholds", {})
+    unknown = sorted(set(thresholds) - set(THRESHOLD_PARAMETERS))
+    if unknown:
+        raise ValueError(
+            f"Unknown performance test thresholds {', '.join(unknown)}, use {', '.join(THRESHOLD_PARAMETERS)}"
+        )
+
+    parameters = {
+        "ResultsBucket": bucket_name,
+        "ResultsPrefix": f"{RESULTS_PREFIX}/{pipeline_name}",
+    }
+    for threshold, value in thresholds.items():
+        parameters[THRESHOLD_PARAMETERS[threshold]] = value
+    if performance_tests.get("disk_read_mib"):
+        parameters["DiskReadMiB"] = performance_tests["disk_read_mib"]
+
+    return {
+        "path": f"{os_name}/test_desktop_performance.yml",
+        "parameters": parameters,
+    }
+
+
+def shrink_image_entry(os_name: str, bucket_name: str, pipeline_name: str) -> dict:
+    """Returns the component entry of the shrink component, which stores the disk usage of the image."""
+    return {
+        "path": f"{os_name}/shrink_image.yml",
+        "parameters": {
+            "ResultsBucket": bucket_name,
+            "ResultsPrefix": f"{RESULTS_PREFIX}/{pipeline_name}/{VOLUME_PREFIX}",
+        },
+    }
+
+
+def _stored(bucket_name: str, prefix: str) -> list:
+    import boto3
+
+    s3 = boto3.client("s3")
+    stored = []
+    paginator = s3.get_paginator("list_objects_v2")
+    # keys start with the time of the measurement, so they list oldest first; the delimiter leaves out
+    # the keys below the prefix, e.g. the disk usage below the test results
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter="/"):
+        for item in page.get("Contents", []):
+            body = s3.get_object(Bucket=bucket_name, Key=item["Key"])["Body"]
+            stored.append(json.loads(body.read()))
+    return stored
+
+
+def report(bucket_name: str, pipeline_name: str) -> list:
+    """Returns the stored results of a pipeline, oldest first."""
+    return _stored(bucket_name, f"{RESULTS_PREFIX}/{pipeline_name}/")
+
+
+def disk_usage(bucket_name: str, pipeline_name: str) -> list:
+    """Returns the stored disk usage of the images of a pipeline, oldest first."""
+    return _stored(bucket_name, f"{RESULTS_PREFIX}/{pipeline_name}/{VOLUME_PREFIX}/")
+
+
+def proposed_root_volume_size(usages: list, free_gib: int = 2, min_gib: int = 0) -> int:
+    """Returns the root_volume_size leaving free_gib free on the latest image, or None without usage.
+
+    The size is at least min_gib, e.g. the root snapshot size of the parent image.
+    """
+    if not usages:
+        return None
+    return max(usages[-1]["used_gib"] + free_gib, min_gib)
+
+
+def root_snapshot_gib(ec2, image_id: str) -> int:
+    """Returns the size of the root snapshot of an AMI, the smallest root volume launched from it."""
+    image = ec2.describe_images(ImageIds=[image_id])["Images"][0]
+    return next(
+        mapping["Ebs"]["VolumeSize"]
+        for mapping in image["BlockDeviceMappings"]
+        if mapping["DeviceName"] == image["RootDeviceName"]
+    )
+
+
+def _parent_image_id(spec: dict, specs: list) -> str:
+    # the latest image of a parent pipeline, or the base image, see ImageBuilderPipeline._parent_image
+    parameter = spec.get("base_image_parameter")
+    if spec.get("parent_pipeline"):
+        from src.service_catalog import latest_ami_parameter_name
+
+        parent = next(
+            parent for parent in specs if parent["id"] == spec["parent_pipeline"]
+        )
+        parameter = latest_ami_parameter_name(parent["name"])
+    if not parameter:
+        return spec.get("base_image_id")
+
+    import boto3
+
+    ssm = boto3.client("ssm")
+    try:
+        return ssm.get_parameter(Name=parameter)["Parameter"]["Value"]
+    except ssm.exceptions.ParameterNotFound:
+        return None
+
+
+def _min_root_volume_gib(spec: dict, specs: list) -> int:
+    image_id = _parent_image_id(spec, specs)
+    if not image_id:
+        return spec.get("root_volume_size", 0)
+
+    import boto3
+
+    return root_snapshot_gib(boto3.client("ec2"), image_id)
+
+
+def _root_volume(
+    cdk_json_path: str, pipeline_id: str, bucket_name: str, free_gib: int
+) -> None:
+    with open(cdk_json_path, encoding="utf-8") as cdk_json:
+        specs = json.load(cdk_json)["context"]["pipelines"]
+    spec = next((spec for spec in specs if spec["id"] == pipeline_id), None)
+    if spec is None:
+        raise ValueError(f"Pipeline {pipeline_id} not found in cdk.json")
+
+    usages = disk_usage(bucket_name, spec["name"])
+    size = proposed_root_volume_size(
+        usages, free_gib, _min_root_volume_gib(spec, specs) if usages else 0
+    )
+    if size is None:
+        print(f"{pipeline_id}: no disk usage stored yet, build an image first")
+    elif spec.get("block_devices"):
+        print(
+            f"{pipeline_id}: set the volume_size of the root device in block_devices to {size}"
+        )
+    elif size == spec.get("root_volume_size"):
+        print(f"{pipeline_id}: root_volume_size {size} leaves {free_gib} GiB free")
+    else:
+        print(
+            f'{pipeline_id}: "root_volume_size": {spec.get("root_volume_size")} -> {size}, '
+            f"the image uses {usages[-1]['used_gib']} GiB"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser(
+        "report", help="print the stored results of a pipeline"
+    )
+    report_parser.add_argument("pipeline_name")
+    report_parser.add_argument("--bucket", required=True, help="components bucket")
+    root_volume_parser = commands.add_parser(
+        "root-volume", help="propose the root_volume_size of a pipeline"
+    )
+    root_volume_parser.add_argument("pipeline_id")
+    root_volume_parser.add_argument("--bucket", required=True, help="components bucket")
+    root_volume_parser.add_argument("--free-gib", type=int, default=2)
+    root_volume_parser.add_argument("--cdk-json", default=CDK_JSON_PATH)
+    args = parser.parse_args()
+
+    if args.command == "root-volume":
+        _root_volume(args.cdk_json, args.pipeline_id, args.bucket, args.free_gib)
+        return
+
+    results = report(args.bucket, args.pipeline_name)
+    columns = ["measured_at", "image_id", "instance_type"]
+    measurements = sorted({key for result in results for key in result["results"]})
+    print("\t".join(columns + measurements))
+    for result in results:
+        row = [str(result.get(column)) for column in columns]
+        row += [str(result["results"].get(key, "")) for key in measurements]
+        print("\t".join(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Pipeline specs and the stacks the app builds from them.
+
+Kept free of CDK imports, so app.py can decide which stacks to build before it
+imports the modules defining them.
+"""
+import fnmatch
+
+S3_OPS_ID = "S3Ops"
+BUILD_ORCHESTRATOR_ID = "BuildOrchestrator"
+
+
+def ordered_specs(specs: list) -> list:
+    """Orders pipeline specs so that every parent pipeline comes before its children."""
+    specs_by_id = {spec["id"]: spec for spec in specs}
+    # specs by id in the order they are visited
+    ordered = {}
+    visiting = set()
+
+    def visit(spec):
+        if spec["id"] in ordered:
+            return
+        if spec["id"] in visiting:
+            raise ValueError(f"Pipeline {spec['id']} is its own parent pipeline")
+
+        visiting.add(spec["id"])
+        parent_id = spec.get("parent_pipeline")
+        if parent_id:
+            if parent_id not in specs_by_id:
+                raise ValueError(
+                    f"Pipeline {spec['id']} has unknown parent pipeline {parent_id}"
+                )
+            visit(specs_by_id[parent_id])
+        ordered[spec["id"]] = spec
+
+    for spec in specs:
+        visit(spec)
+
+    return list(ordered.values())
+
+
+def build_infrastructure_id(vpc_id: str, default_vpc_id: str) -> str:
+    if vpc_id == default_vpc_id:
+        return "BuildInfrastructure"
+    return f"BuildInfrastructure-{vpc_id}"
+
+
+def stack_dependencies(
+    specs: list, default_vpc_id: str, build_orchestrator: bool = False
+) -> dict:
+    """Maps the id of every stack of the app onto the ids of the stacks it depends on."""
+    dependencies = {S3_OPS_ID: set()}
+    for spec in ordered_specs(specs):
+        infrastructure_id = build_infrastructure_id(
+            spec.get("vpc_id", default_vpc_id), default_vpc_id
+        )
+        dependencies[infrastructure_id] = set()
+        dependencies[spec["id"]] = {S3_OPS_ID, infrastructure_id}
+        if spec.get("parent_pipeline"):
+            dependencies[spec["id"]].add(spec["parent_pipeline"])
+
+    if build_orchestrator:
+        dependencies[BUILD_ORCHESTRATOR_ID] = {
+            spec["id"] for spec in specs if not spec.get("trial_of")
+        }
+
+    return dependencies
+
+
+def matching_stacks(dependencies: dict, patterns: list) -> set:
+    """Returns the stacks matching the patterns, e.g. `Ubuntu*`, or every stack without patterns."""
+    if not patterns:
+        return set(dependencies)
+
+    matching = set()
+    for pattern in patterns:
+        matches = fnmatch.filter(dependencies, pattern)
+        if not matches:
+            raise ValueError(
+                f"No stack matches {pattern}, stacks are {', '.join(sorted(dependencies))}"
+            )
+        matching.update(matches)
+    return matching
+
+
+def selected_stacks(dependencies: dict, patterns: list) -> set:
+    """Returns the stacks matching the patterns together with every stack they depend on."""
+    selected = matching_stacks(dependencies, patterns)
+    pending = list(selected)
+    while pending:
+        for dependency in dependencies[pending.pop()]:
+            if dependency not in selected:
+                selected.add(dependency)
+                pending.append(dependency)
+
+    return selected
+
+
+def stack_patterns(value) -> list:
+    """Stack patterns from the `stacks` context or the CDK_STACKS environment variable."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [pattern.strip() for pattern in value if pattern.strip()]
@@ -0,0 +1,440 @@
+"""Compiles the components of a recipe into a single component document.
+
+Every component of a recipe refreshes the package metadata and solves its own
+package installs. The compiled document keeps the steps of all components in
+order, but
+
+- merges the apt, yum, dnf and amazon-linux-extras installs that follow each
+  other, across components, into a single install at the first of them,
+- drops package metadata refreshes that repeat an earlier one, and
+- runs the ExecuteBash steps of consecutive components marked `concurrent` at
+  the same time, once their package installs were merged; a single concurrent
+  step runs as it is.
+
+Only installs and refreshes on a line of their own, without shell operators,
+are merged. Installs never move ahead of other commands, which may prepare
+them, e.g. debconf preseeds, or use the packages installed before: any line
+other than a refresh, a comment or a plain echo ends the merge, as does any
+step other than ExecuteBash, e.g. an S3Download or a Reboot, and later
+installs start a new merged install after it. ExecuteBash steps with an `if`,
+`loop`, `onFailure`, `timeoutSeconds` or `maxAttempts` are left as they are and
+end the merge too, as merging would change when their packages are installed
+or how their failures are handled; they also never run concurrently. A line
+changing package sources or package manager configuration, e.g.
+add-apt-repository or a write to /etc/yum.repos.d, also makes the next refresh
+run again.
+
+The shipped Ubuntu components run other commands after each of their
+installs, so their installs stay separate; the Amazon Linux 2 ones merge.
+"""
+import copy
+import re
+
+from src.component_validator import VARIABLE_PATTERN
+
+INSTALL_FLAGS = {"-y", "-q", "-qq", "--yes", "--quiet", "--assume-yes"}
+PACKAGE_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9+.:=~_-]*$")
+PACKAGE_COMMAND_PATTERN = re.compile(
+    r"^(?P<prefix>(sudo\s+)?(DEBIAN_FRONTEND=noninteractive\s+)?)"
+    r"(?P<manager>apt-get|yum|dnf|amazon-linux-extras)\s+(?P<arguments>.*)$"
+)
+REFRESH_VERBS = {
+    "apt-get": {"update"},
+    "yum": {"update", "upgrade", "makecache"},
+    "dnf": {"update", "upgrade", "makecache"},
+}
+# commands adding package sources, or changing how they are reached
+SOURCE_CHANGES = (
+    "add-apt-repository",
+    "apt-key",
+    "/etc/apt/",
+    "yum-config-manager",
+    "dnf config-manager",
+    "/etc/yum.repos.d",
+    "/etc/yum.conf",
+    "rpm --import",
+)
+# lines installs may move ahead of: blank lines, comments and echos without shell operators
+PASSIVE_PATTERN = re.compile(r"^\s*(#.*|echo(\s+[^;&|<>`$()]*)?)?$")
+# amazon-linux-extras enables yum repositories, e.g. epel, so yum installs can not move before it
+ENABLES_REPOSITORIES = {"amazon-linux-extras": ("yum",)}
+# step keys deciding whether, how often and how long a step runs and what its failure does
+GUARD_KEYS = ("if", "loop", "onFailure", "timeoutSeconds", "maxAttempts")
+
+
+def is_guarded(step: dict) -> bool:
+    """Whether a step runs conditionally, repeatedly or with its own failure handling."""
+    return any(key in step for key in GUARD_KEYS)
+
+
+def parse_package_command(line: str):
+    """Returns (prefix, manager, verb, packages) of a mergeable package manager command, or None."""
+    match = PACKAGE_COMMAND_PATTERN.match(line.strip())
+    if not match:
+        return None
+
+    verb = None
+    packages = []
+    for argument in match.group("arguments").split():
+        if argument.startswith("-"):
+            if argument not in INSTALL_FLAGS:
+                return None
+        elif verb is None:
+            verb = argument
+        elif PACKAGE_PATTERN.match(argument):
+            packages.append(argument)
+        else:
+            return None
+
+    return match.group("prefix"), match.group("manager"), verb, packages
+
+
+def _install_command(install: dict) -> str:
+    packages = " ".join(install["packages"])
+    if install["manager"] == "apt-get":
+        prefix = install["prefix"]
+        if "DEBIAN_FRONTEND" not in prefix:
+            prefix += "DEBIAN_FRONTEND=noninteractive "
+        return f"{prefix}apt-get install -y -q {packages}"
+    return f"{install['prefix']}{install['manager']} install -y {packages}"
+
+
+def _is_refresh(line: str) -> list:
+    # refreshes combined with other commands, e.g. apt-get update && apt-get upgrade
+    words = line.split()
+    return [
+        manager
+        for manager, verbs in REFRESH_VERBS.items()
+        if manager in words and verbs & set(words)
+    ]
+
+
+class _PackageMerge:
+    """Installs written so far, the installs later ones merge into and the refreshed package managers."""
+
+    def __init__(self) -> None:
+        self.installs = []
+        self.open_installs = {}
+        self.refreshed = set()
+
+    def step(self, step: dict) -> dict:
+        """Returns a copy of a step with its package commands merged, commands split into lines."""
+        step = copy.deepcopy(step)
+        if step["action"] != "ExecuteBash" or is_guarded(step):
+            # installs never move across other steps, e.g. an S3Download of the package they install,
+            # nor into or out of a step that may not run, may run again or may fail without failing the build
+            self.open_installs.clear()
+            if any(change in str(step.get("inputs")) for change in SOURCE_CHANGES):
+                self.refreshed.clear()
+            if step["action"] == "ExecuteBash":
+                step["inputs"]["commands"] = [
+                    command.split("\n") for command in step["inputs"]["commands"]
+                ]
+            return step
+
+        commands = []
+        for command in step["inputs"]["commands"]:
+            lines = []
+            commands.append(lines)
+            for line in command.split("\n"):
+                self.line(lines, line)
+        step["inputs"]["commands"] = commands
+        return step
+
+    def line(self, lines: list, line: str) -> None:
+        parsed = parse_package_command(line)
+        if parsed is None:
+            self._other(lines, line)
+            return
+
+        prefix, manager, verb, packages = parsed
+        if verb in REFRESH_VERBS.get(manager, ()) and not packages:
+            self._refresh(lines, line, manager)
+        elif verb == "install" and packages:
+            self._install(lines, line, prefix, manager, packages)
+        else:
+            self.open_installs.clear()
+            lines.append(line)
+
+    def _other(self, lines: list, line: str) -> None:
+        if not PASSIVE_PATTERN.match(line):
+            self.open_installs.clear()
+        if any(change in line for change in SOURCE_CHANGES):
+            self.refreshed.clear()
+        self.refreshed.update(_is_refresh(line))
+        lines.append(line)
+
+    def _refresh(self, lines: list, line: str, manager: str) -> None:
+        if manager not in self.refreshed:
+            self.refreshed.add(manager)
+            self.open_installs.pop(manager, None)
+            lines.append(line)
+
+    def _install(
+        self, lines: list, line: str, prefix: str, manager: str, packages: list
+    ) -> None:
+        install = self.open_installs.get(manager)
+        if install:
+            install["packages"].extend(
+                package for package in packages if package not in install["packages"]
+            )
+        else:
+            lines.append(line)
+            install = {
+                "lines": lines,
+                "index": len(lines) - 1,
+                "prefix": prefix,
+                "manager": manager,
+                "packages": list(packages),
+            }
+            self.installs.append(install)
+            self.open_installs[manager] = install
+        for enabled in ENABLES_REPOSITORIES.get(manager, ()):
+            self.open_installs.pop(enabled, None)
+            self.refreshed.discard(enabled)
+
+    def write_installs(self) -> None:
+        for install in self.installs:
+            install["lines"][install["index"]] = _install_command(install)
+
+
+def _joined(step: dict) -> dict:
+    if step["action"] == "ExecuteBash":
+        step["inputs"]["commands"] = [
+            "\n".join(lines)
+            for lines in step["inputs"]["commands"]
+            if any(line.strip() for line in lines)
+        ]
+    return step
+
+
+def merge_packages(steps: list) -> list:
+    """Merges the package installs and refreshes of ExecuteBash steps, in order.
+
+    Returns copies of the steps; ExecuteBash steps left without commands are
+    dropped. Other steps keep their place and installs are only merged within
+    the ExecuteBash steps between them.
+    """
+    merge = _PackageMerge()
+    merged_steps = [merge.step(step) for step in steps]
+    merge.write_installs()
+
+    return [
+        step
+        for step in map(_joined, merged_steps)
+        if step["action"] != "ExecuteBash" or step["inputs"]["commands"]
+    ]
+
+
+def _renamed(document: dict, value, step_names: dict):
+    """Renames the parameters, constants and step outputs a value refers to."""
+    declared = {
+        variable
+        for section in ("parameters", "constants")
+        for declaration in document.get(section) or []
+        for variable in declaration
+    }
+
+    def rename(match):
+        variable = match.group(1)
+        if variable in declared:
+            return f"{{{{ {document['name']}{variable} }}}}"
+        phase_name, _, step_output = variable.partition(".")
+        step_name, _, output = step_output.partition(".")
+        if output and (phase_name, step_name) in step_names:
+            return (
+                f"{{{{ {phase_name}.{step_names[(phase_name, step_name)]}.{output} }}}}"
+            )
+        return match.group(0)
+
+    if isinstance(value, str):
+        return VARIABLE_PATTERN.sub(rename, value)
+    if isinstance(value, list):
+        return [_renamed(document, item, step_names) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: _renamed(document, item, step_names) for key, item in value.items()
+        }
+    return value
+
+
+def concurrent_step(name: str, steps: list) -> dict:
+    """ExecuteBash step running the commands of the given steps in background shells."""
+    script = ['__pids=""']
+    for step in steps:
+        commands = "\n".join(step["inputs"]["commands"])
+        script.append(
+            f"(\n{commands}\n) > /tmp/{step['name']}.log 2>&1 &\n" '__pids="$__pids $!"'
+        )
+    logs = "\n".join(
+        f'echo "--- {step["name"]}"; cat /tmp/{step["name"]}.log' for step in steps
+    )
+    script.append(
+        "__failed=0\n"
+        'for __pid in $__pids; do wait "$__pid" || __failed=1; done\n'
+        f"{logs}\n"
+        'exit "$__failed"'
+    )
+    return {"name": name, "action": "ExecuteBash", "inputs": {"commands": script}}
+
+
+def _runs(steps: list, concurrent: set) -> list:
+    """Splits steps into runs of consecutive concurrent steps and single other steps."""
+    runs = []
+    for step in steps:
+        if runs and step["name"] in concurrent and runs[-1][0]["name"] in concurrent:
+            runs[-1].append(step)
+        else:
+            runs.append([step])
+    return runs
+
+
+def _installs_first(step: dict) -> bool:
+    """Whether the package commands of a step only follow lines they can move ahead of."""
+    started = False
+    for line in "\n".join(step["inputs"]["commands"]).split("\n"):
+        if parse_package_command(line) is not None:
+            if started:
+                return False
+        elif not PASSIVE_PATTERN.match(line):
+            started = True
+    return True
+
+
+def _can_hoist(run: list) -> bool:
+    """Whether the package commands of a run of concurrent steps can run before all of them."""
+    scripts = "\n".join(
+        command for step in run for command in step["inputs"]["commands"]
+    )
+    if any(change in scripts for change in SOURCE_CHANGES):
+        return False
+    return all(_installs_first(step) for step in run)
+
+
+def _package_commands(run: list) -> list:
+    """Removes the package commands from the steps of a run and returns them, in order."""
+    packages = []
+    for step in run:
+        commands = []
+        for command in step["inputs"]["commands"]:
+            lines = []
+            for line in command.split("\n"):
+                if parse_package_command(line) is None:
+                    lines.append(line)
+                else:
+                    packages.append(line.strip())
+            commands.append("\n".join(lines))
+        step["inputs"]["commands"] = commands
+    return packages
+
+
+def _hoisted(steps: list, concurrent: set) -> list:
+    """Moves the package commands of concurrent steps into a step running before them.
+
+    Concurrent steps changing package sources, or running other commands
+    before their package commands, run one after another instead, as does a
+    concurrent step without concurrent neighbours.
+    """
+    hoisted = []
+    for run in _runs(steps, concurrent):
+        # runs of more than one step are always concurrent
+        if len(run) == 1 or not _can_hoist(run):
+            concurrent.difference_update(step["name"] for step in run)
+            hoisted.extend(run)
+            continue
+
+        packages = _package_commands(run)
+        if packages:
+            hoisted.append(
+                {
+                    "name": f"Packages{run[0]['name']}",
+                    "action": "ExecuteBash",
+                    "inputs": {"commands": packages},
+                }
+            )
+        hoisted.extend(run)
+
+    return hoisted
+
+
+def _grouped(steps: list, concurrent: set) -> list:
+    grouped = []
+    for run in _runs(steps, concurrent):
+        if len(run) > 1:
+            grouped.append(concurrent_step(f"Concurrent{run[0]['name']}", run))
+        else:
+            grouped.extend(run)
+    return grouped
+
+
+def _step_names(document: dict) -> dict:
+    """Maps (phase name, step name) onto the compiled name of every step of a document."""
+    return {
+        (phase["name"], step["name"]): step["name"]
+        if step["name"].startswith(document["name"])
+        else f"{document['name']}{step['name']}"
+        for phase in document.get("phases", [])
+        for step in phase.get("steps", [])
+    }
+
+
+def _prefixed_declarations(document: dict, section: str) -> list:
+    return [
+        {
+            f"{document['name']}{variable}": value
+            for variable, value in declaration.items()
+        }
+        for declaration in document.get(section) or []
+    ]
+
+
+def _compiled_steps(document: dict, entry: dict, phases: dict, concurrent: set):
+    """Adds the renamed steps of a document to phases, and the concurrent ones to concurrent."""
+    step_names = _step_names(document)
+    for phase in document.get("phases", []):
+        for step in phase.get("steps", []):
+            compiled_step = _renamed(document, step, step_names)
+            compiled_step["name"] = step_names[(phase["name"], step["name"])]
+            phases.setdefault(phase["name"], []).append(compiled_step)
+            # a concurrent step runs in the background of a combined step, without its own guards
+            backgrounded = step.get("action") == "ExecuteBash" and not is_guarded(step)
+            if entry.get("concurrent") and backgrounded:
+                concurrent.add(compiled_step["name"])
+
+
+def compile_recipe(name: str, components: list) -> tuple:
+    """Compiles (document, entry) pairs into one document and the parameter values to pass to it.
+
+    Parameters, constants and steps are prefixed with the name of their
+    component, so they stay unique in the compiled document; steps already
+    named after their component, e.g. BasicSetup, keep their name.
+    """
+    declarations = {"parameters": [], "constants": []}
+    parameters = {}
+    phases = {}
+    concurrent = set()
+
+    for document, entry in components:
+        for section, declared in declarations.items():
+            declared.extend(_prefixed_declarations(document, section))
+        for parameter, value in entry.get("parameters", {}).items():
+            parameters[f"{document['name']}{parameter}"] = value
+        _compiled_steps(document, entry, phases, concurrent)
+
+    component_names = ", ".join(document["name"] for document, _ in components)
+    compiled = {
+        "name": name,
+        "description": f"Compiled from {component_names}",
+        "schemaVersion": 1.0,
+    }
+    for section, declared in declarations.items():
+        if declared:
+            compiled[section] = declared
+
+    compiled["phases"] = []
+    for phase_name, steps in phases.items():
+        if phase_name == "build":
+            steps = _grouped(merge_packages(_hoisted(steps, concurrent)), concurrent)
+        compiled["phases"].append({"name": phase_name, "steps": steps})
+
+    return compiled, parameters
@@ -7,11 +7,21 @@ from aws_cdk import aws_ssm as ssm
 from cdk_nag import NagSuppressions
 from constructs import Construct
 
-dirname = os.path.dirname(__file__)
+from src.package_cache import ARTIFACTS_DIR
+from src.step_dashboard import StepMetrics
+
+
+def components_bucket_name(account: str, region: str) -> str:
+    """Name of the components bucket, which every stack and command derives the same way."""
+    return f"image-builder-components-{account}-{region}"
 
 
 class S3Ops(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    """Components bucket of the pipelines, with the cached installers when `artifacts` is set."""
+
+    def __init__(
+        self, scope: Construct, construct_id: str, artifacts: bool = False, **kwargs
+    ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # S3 Bucket for image components
@@ -19,7 +29,7 @@ class S3Ops(Stack):
             self,
             "rS3ImageBuilderComponents",
             block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
-            bucket_name=f"image-builder-components-{self.account}-{self.region}",
+            bucket_name=components_bucket_name(self.account, self.region),
             encryption=s3.BucketEncryption.S3_MANAGED,
             enforce_ssl=True,
             versioned=True,
@@ -32,24 +42,46 @@ class S3Ops(Stack):
             noncurrent_version_expiration=Duration.days(30),
         )
 
-        # set component folder as source for deployment
-        source_asset = s3_deployment.Source.asset(os.path.join(dirname, "components"))
+        # deploy the installers cached by `python -m src.package_cache` when a pipeline downloads them
+        if artifacts:
+            if not os.path.isdir(ARTIFACTS_DIR):
+                raise ValueError(
+                    f"package_cache artifacts are enabled but {ARTIFACTS_DIR} does not exist, "
+                    "run python -m src.package_cache first"
+                )
+            s3_deployment.BucketDeployment(
+                self,
+                "rStackArtifactDeployments",
+                destination_bucket=ops_bucket,
+                sources=[s3_deployment.Source.asset(ARTIFACTS_DIR)],
+                destination_key_prefix="artifacts",
+            )
+            NagSuppressions.add_resource_suppressions_by_path(
+                self,
+                path="/S3Ops/Custom::CDKBucketDeployment8693BB64968944B69AAFB0CC9EB8756C/ServiceRole",
+                suppressions=[
+                    {
+                        "id": "AwsSolutions-IAM4",
+                        "reason": "CDK created permissions for custom resource",
+                    },
+                    {
+                        "id": "AwsSolutions-IAM5",
+                        "reason": "CDK created permissions for custom resource",
+                    },
+                ],
+                apply_to_children=True,
+            )
 
-        # deploy everything under folder to s3 bucket
-        s3_deployment.BucketDeployment(
-            self,
-            "rStackComponentDeployments",
-            destination_bucket=ops_bucket,
-            sources=[source_asset],
-            destination_key_prefix="components",
-        )
+        # log group and metric filters of the component step timings
+        StepMetrics(self, "rStepMetrics")
 
+        # for tools outside the app only, the stacks derive the name with components_bucket_name
         ssm.StringParameter(
             self,
             "rComponentsBucketName",
             parameter_name="/centralised-amis/components-bucket-name",
             string_value=ops_bucket.bucket_name,
-            description="Bucket name to upload image builder components",
+            description="Bucket name of the image builder components and cached installers",
             tier=ssm.ParameterTier.STANDARD,
         )
 
@@ -62,19 +94,3 @@ class S3Ops(Stack):
                 }
             ],
         )
-
-        NagSuppressions.add_resource_suppressions_by_path(
-            self,
-            path="/S3Ops/Custom::CDKBucketDeployment8693BB64968944B69AAFB0CC9EB8756C/ServiceRole",
-            suppressions=[
-                {
-                    "id": "AwsSolutions-IAM4",
-                    "reason": "CDK created permissions for custom resource",
-                },
-                {
-                    "id": "AwsSolutions-IAM5",
-                    "reason": "CDK created permissions for custom resource",
-                },
-            ],
-            apply_to_children=True,
-        )
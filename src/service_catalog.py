@@ -0,0 +1,185 @@
+"""Generates the Service Catalog product templates of the pipelines.
+
+Every pipeline spec with a `product` gets a workspace product template in
+`service-catalog-products/<file>`, rendered from `src/workspace_product.cfn.yml`.
+Unless an `AmiId` is passed, the product resolves the latest AMI of the
+pipeline from the SSM parameter named by its `LatestAmiId` parameter, which
+the pipeline stack updates whenever it builds an image, so a new image is
+available to new workspaces without editing the product.
+
+    python -m src.service_catalog           # write the product templates
+    python -m src.service_catalog --check   # fail when a template is out of date
+
+A `product` has the template `file` name, a `description`, the
+`instance_types` offered to users, the first one being the default, and the
+`volume_size` of the root volume in GiB.
+
+    python -m src.service_catalog --rank UbuntuImagebuilderPipeline --bucket <components bucket>
+
+orders the `instance_types` of the product of a pipeline in cdk.json by the
+median session start time the desktop performance tests stored for the
+pipeline and its instance benchmark trials, see src/performance_tests.py, and
+regenerates the templates, so the default instance type is the fastest one
+measured. Instance types without results keep their order after the measured
+ones.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+dirname = os.path.dirname(__file__)
+
+CDK_JSON_PATH = os.path.join(os.path.dirname(dirname), "cdk.json")
+PRODUCTS_DIR = os.path.join(os.path.dirname(dirname), "service-catalog-products")
+PRODUCT_TEMPLATE_PATH = os.path.join(dirname, "workspace_product.cfn.yml")
+
+# where the cfn helper scripts are installed on each operating system
+CFN_SIGNAL = {
+    "amazon_linux": "/opt/aws/bin/cfn-signal",
+    "ubuntu": "/usr/local/bin/cfn-signal",
+}
+
+
+def latest_ami_parameter_name(name: str) -> str:
+    """SSM parameter holding the id of the latest AMI of the pipeline named name."""
+    return f"/centralised-amis/{name}/latest-ami-id"
+
+
+def render_product(template: str, spec: dict) -> str:
+    """Renders the product template of a pipeline spec."""
+    product = spec["product"]
+    instance_types = product.get("instance_types", ["t3.xlarge"])
+    values = {
+        "Description": product["description"],
+        "AmiParameter": latest_ami_parameter_name(spec["name"]),
+        "InstanceType": instance_types[0],
+        "AllowedInstanceTypes": ", ".join(instance_types),
+        "VolumeSize": str(product.get("volume_size", 24)),
+        "CfnSignal": CFN_SIGNAL[spec["os"]],
+    }
+
+    if product.get("volume_size", 24) < spec.get("root_volume_size", 0):
+        raise ValueError(
+            f"Product volume_size of {spec['id']} is smaller than the root_volume_size of its AMI"
+        )
+
+    for placeholder, value in values.items():
+        template = template.replace(f"{{{{ {placeholder} }}}}", value)
+    return template
+
+
+def rank_product_instance_types(
+    instance_types: list, results: list, measure: str = "session_start_seconds"
+) -> list:
+    """Orders instance types by the median measure of their performance test results, fastest first."""
+    measured = {}
+    for result in results:
+        value = result["results"].get(measure)
+        if result.get("instance_type") in instance_types and value is not None:
+            measured.setdefault(result["instance_type"], []).append(value)
+    medians = {
+        instance_type: statistics.median(values)
+        for instance_type, values in measured.items()
+    }
+
+    # sorted is stable, so instance types without results keep their order
+    return sorted(
+        instance_types,
+        key=lambda instance_type: (
+            instance_type not in medians,
+            medians.get(instance_type, 0),
+        ),
+    )
+
+
+def _rank(cdk_json_path: str, pipeline_id: str, bucket_name: str) -> None:
+    from src.instance_benchmark import trial_specs, write_instance_types
+    from src.performance_tests import report
+
+    with open(cdk_json_path, encoding="utf-8") as cdk_json:
+        text = cdk_json.read()
+    context = json.loads(text)["context"]
+    specs = [spec for spec in context["pipelines"] if spec["id"] == pipeline_id]
+    if not specs or not specs[0].get("product"):
+        raise ValueError(f"Pipeline {pipeline_id} has no product in cdk.json")
+
+    # the trials of the instance benchmark test the same image on other instance types
+    trials = trial_specs(specs, context.get("instance_benchmark") or {})
+    results = []
+    for spec in specs + trials:
+        results.extend(report(bucket_name, spec["name"]))
+
+    instance_types = rank_product_instance_types(
+        specs[0]["product"].get("instance_types", ["t3.xlarge"]), results
+    )
+    print(f"{pipeline_id}: {', '.join(instance_types)}")
+    with open(cdk_json_path, "w", encoding="utf-8") as cdk_json:
+        cdk_json.write(
+            write_instance_types(
+                text, pipeline_id, instance_types, ("product", "instance_types")
+            )
+        )
+
+
+def product_templates(specs: list, template: str) -> dict:
+    """Maps the file name of every product onto its rendered template."""
+    return {
+        spec["product"]["file"]: render_product(template, spec)
+        for spec in specs
+        if spec.get("product")
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cdk-json", default=CDK_JSON_PATH)
+    parser.add_argument("--products-dir", default=PRODUCTS_DIR)
+    parser.add_argument(
+        "--check", action="store_true", help="fail when a template is out of date"
+    )
+    parser.add_argument(
+        "--rank",
+        metavar="PIPELINE_ID",
+        help="order the product instance types of a pipeline by its performance test results",
+    )
+    parser.add_argument(
+        "--bucket", help="components bucket holding the performance test results"
+    )
+    args = parser.parse_args()
+
+    if args.rank:
+        if not args.bucket:
+            parser.error("--rank needs the --bucket of the performance test results")
+        _rank(args.cdk_json, args.rank, args.bucket)
+
+    with open(args.cdk_json, encoding="utf-8") as cdk_json:
+        specs = json.load(cdk_json)["context"]["pipelines"]
+    with open(PRODUCT_TEMPLATE_PATH, encoding="utf-8") as template_file:
+        template = template_file.read()
+
+    outdated = []
+    for file_name, content in product_templates(specs, template).items():
+        path = os.path.join(args.products_dir, file_name)
+        current = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as product_file:
+                current = product_file.read()
+        if current == content:
+            continue
+
+        outdated.append(file_name)
+        if not args.check:
+            with open(path, "w", encoding="utf-8") as product_file:
+                product_file.write(content)
+            print(f"Wrote {path}")
+
+    if args.check and outdated:
+        sys.exit(
+            f"Out of date: {', '.join(outdated)}, run python -m src.service_catalog"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Log group, metric filters and dashboards of the step level build timings.
+
+The components report their steps as described in src/step_metrics.py.
+"""
+from aws_cdk import Duration
+from aws_cdk import aws_cloudwatch as cloudwatch
+from aws_cdk import aws_logs as logs
+from constructs import Construct
+
+from src.step_metrics import STEP_LOG_GROUP, STEP_METRICS_NAMESPACE, step_names
+
+
+class StepMetrics(Construct):
+    """Log group the instrumented steps report to and the metric filters on it."""
+
+    def __init__(self, scope: Construct, construct_id: str) -> None:
+        super().__init__(scope, construct_id)
+
+        self.log_group = logs.LogGroup(
+            self,
+            "rLogGroup",
+            log_group_name=STEP_LOG_GROUP,
+            retention=logs.RetentionDays.ONE_YEAR,
+        )
+
+        for metric_name, field, unit in (
+            ("StepDuration", "$.duration_seconds", cloudwatch.Unit.SECONDS),
+            ("BytesDownloaded", "$.bytes_downloaded", cloudwatch.Unit.BYTES),
+        ):
+            logs.MetricFilter(
+                self,
+                f"r{metric_name}Filter",
+                log_group=self.log_group,
+                filter_pattern=logs.FilterPattern.exists(field),
+                metric_namespace=STEP_METRICS_NAMESPACE,
+                metric_name=metric_name,
+                metric_value=field,
+                dimensions={
+                    "Pipeline": "$.pipeline",
+                    "Component": "$.component",
+                    "Step": "$.step",
+                },
+                unit=unit,
+            )
+
+
+class StepDashboard(Construct):
+    """Dashboard with the duration and downloaded bytes of every step of a recipe's components.
+
+    Steps are stacked per component, so the widgets show both which component and
+    which of its steps dominate a build.
+    """
+
+    def __init__(
+        self, scope: Construct, construct_id: str, name: str, documents: list
+    ) -> None:
+        super().__init__(scope, construct_id)
+
+        def metrics(metric_name: str, document: dict) -> list:
+            return [
+                cloudwatch.Metric(
+                    namespace=STEP_METRICS_NAMESPACE,
+                    metric_name=metric_name,
+                    # components with the same name run in other pipelines, e.g. ShrinkImage
+                    dimensions_map={
+                        "Pipeline": name,
+                        "Component": document["name"],
+                        "Step": step,
+                    },
+                    statistic="Maximum",
+                    period=Duration.days(1),
+                    label=step,
+                )
+                for step in step_names(document)
+            ]
+
+        self.dashboard = cloudwatch.Dashboard(
+            self,
+            "rDashboard",
+            dashboard_name=f"{name}BuildSteps",
+            start="-P4W",
+        )
+
+        for document in documents:
+            if not step_names(document):
+                continue
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(
+                    title=f"{document['name']} step duration (seconds)",
+                    left=metrics("StepDuration", document),
+                    stacked=True,
+                    width=12,
+                ),
+                cloudwatch.GraphWidget(
+                    title=f"{document['name']} bytes downloaded",
+                    left=metrics("BytesDownloaded", document),
+                    stacked=True,
+                    width=12,
+                ),
+            )
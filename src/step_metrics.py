@@ -0,0 +1,122 @@
+"""Step level build timings of image builder components.
+
+Every ExecuteBash step of a component is instrumented before the component is
+uploaded: the step records its start time and the bytes received by the build
+instance, and reports them on exit as a JSON event
+
+    {"pipeline": "UbuntuWorkspace", "component": "InstallXrdp", "step": "build/InstallXrdp", "duration_seconds": 42.1, "bytes_downloaded": 1024, "exit_code": 0}
+
+which is printed to the component log and, when the AWS CLI is installed on the
+build instance, sent to the STEP_LOG_GROUP log group. Metric filters on that log
+group turn the events into StepDuration and BytesDownloaded metrics with the
+Pipeline, Component and Step dimensions, shown per pipeline by a StepDashboard.
+The same component runs in several pipelines, so every rendered component
+declares the PIPELINE_PARAMETER, which the recipes set to the pipeline name.
+
+The CDK constructs live in src/step_dashboard.py, so rendering and validating
+components does not load aws_cdk.
+"""
+import copy
+
+import yaml
+
+# the build instance role may already write to every /aws/imagebuilder/ log group
+STEP_LOG_GROUP = "/aws/imagebuilder/component-steps"
+STEP_METRICS_NAMESPACE = "ImageBuilder/Steps"
+PIPELINE_PARAMETER = "StepMetricsPipeline"
+
+# %s are replaced with the component, the step and the log group; shell braces are single
+# so AWSTOE does not mistake them for {{ variables }}
+STEP_PROLOGUE = """\
+__step_start=$(date +%%s%%N)
+__step_rx() { awk -F'[: ]+' 'NR > 2 && $2 != "lo" { bytes += $3 } END { print bytes + 0 }' /proc/net/dev; }
+__step_rx_start=$(__step_rx)
+__step_imds() {
+    curl -s -H "X-aws-ec2-metadata-token: $(curl -s -X PUT -H 'X-aws-ec2-metadata-token-ttl-seconds: 60' http://169.254.169.254/latest/api/token)" "http://169.254.169.254/latest/meta-data/$1"
+}
+__step_report() {
+    __step_status=$?
+    __step_event=$(printf '{"pipeline":"%%s","component":"%%s","step":"%%s","duration_seconds":%%s,"bytes_downloaded":%%s,"exit_code":%%s}' \\
+        "$__step_pipeline" "%s" "%s" \\
+        "$(awk -v start="$__step_start" -v end="$(date +%%s%%N)" 'BEGIN { printf "%%.3f", (end - start) / 1e9 }')" \\
+        "$(($(__step_rx) - __step_rx_start))" "$__step_status")
+    echo "$__step_event"
+    if command -v aws >/dev/null 2>&1; then
+        __step_region=$(__step_imds placement/region)
+        __step_stream=$(__step_imds instance-id)
+        printf '[{"timestamp":%%s,"message":"%%s"}]' "$(($(date +%%s%%N) / 1000000))" "${__step_event//\\"/\\\\\\"}" > /tmp/step-metrics.json
+        aws logs create-log-stream --region "$__step_region" --log-group-name "%s" --log-stream-name "$__step_stream" >/dev/null 2>&1
+        aws logs put-log-events --region "$__step_region" --log-group-name "%s" --log-stream-name "$__step_stream" \\
+            --log-events file:///tmp/step-metrics.json >/dev/null 2>&1 || echo "Could not send step metrics"
+    fi
+    exit "$__step_status"
+}
+trap __step_report EXIT"""
+# set after the trap, so the prologue itself holds no {{ variables }}; read when the step exits
+STEP_PIPELINE = f"__step_pipeline='{{{{ {PIPELINE_PARAMETER} }}}}'"
+
+
+def step_names(document: dict) -> list:
+    """Returns the Step dimension value of every instrumented step of a component."""
+    return [
+        f"{phase['name']}/{step['name']}"
+        for phase in document.get("phases", [])
+        for step in phase.get("steps", [])
+        if step.get("action") == "ExecuteBash"
+    ]
+
+
+def instrument_document(document: dict) -> dict:
+    """Returns a copy of a component document with every ExecuteBash step timed."""
+    instrumented = copy.deepcopy(document)
+    # declared by every component, as recipes pass it to all of their components; phases stay last
+    parameters = (instrumented.pop("parameters", None) or []) + [
+        {
+            PIPELINE_PARAMETER: {
+                "type": "string",
+                "default": "unknown",
+                "description": "Name of the pipeline the step metrics are reported for",
+            }
+        }
+    ]
+    phases = instrumented.pop("phases", [])
+    instrumented.update(parameters=parameters, phases=phases)
+
+    for phase in instrumented.get("phases", []):
+        for step in phase.get("steps", []):
+            if step.get("action") != "ExecuteBash":
+                continue
+            # AWSTOE runs all commands of a step as one script, so the trap covers the whole step
+            step["inputs"]["commands"][:0] = [
+                STEP_PROLOGUE
+                % (
+                    instrumented["name"],
+                    f"{phase['name']}/{step['name']}",
+                    STEP_LOG_GROUP,
+                    STEP_LOG_GROUP,
+                ),
+                STEP_PIPELINE,
+            ]
+
+    return instrumented
+
+
+class _LiteralDumper(yaml.SafeDumper):
+    """Dumps multi-line strings as literal blocks so uploaded components stay readable."""
+
+
+def _represent_str(dumper, value):
+    style = "|" if "\n" in value else None
+    return dumper.represent_scalar("tag:yaml.org,2002:str", value, style=style)
+
+
+_LiteralDumper.add_representer(str, _represent_str)
+
+
+def render_document(document: dict) -> str:
+    return yaml.dump(
+        instrument_document(document),
+        Dumper=_LiteralDumper,
+        sort_keys=False,
+        width=1000,
+    )
@@ -0,0 +1,255 @@
+"""Checks the synthesized templates against size and resource count budgets.
+
+CloudFormation rejects templates over 1 MiB, with more than 500 resources, 200
+outputs or 200 parameters. Every pipeline adds a stack, so the stacks are
+checked after synth, before a deployment fails:
+
+    cdk synth -q
+    python -m src.template_budget cdk.out
+
+For every stack of the cloud assembly the report lists the template bytes,
+the resource, output and parameter counts and the IAM policy statements and
+cdk-nag suppressions repeated in the stack or across stacks, with a
+suggestion on how to share them. The `template_budget` context sets the
+budgets; the command fails when a stack exceeds one of them.
+"""
+import argparse
+import json
+import os
+import sys
+
+dirname = os.path.dirname(__file__)
+
+CDK_JSON_PATH = os.path.join(os.path.dirname(dirname), "cdk.json")
+
+# 80% of the CloudFormation quotas, to leave room for the next pipeline
+DEFAULT_BUDGETS = {
+    "max_template_bytes": 838860,
+    "max_resources": 400,
+    "max_outputs": 160,
+    "max_parameters": 160,
+    "max_duplicate_statements": 20,
+}
+
+
+def _stack_artifacts(assembly_dir: str) -> dict:
+    with open(
+        os.path.join(assembly_dir, "manifest.json"), encoding="utf-8"
+    ) as manifest:
+        artifacts = json.load(manifest)["artifacts"]
+
+    return {
+        artifact_id: artifact
+        for artifact_id, artifact in artifacts.items()
+        if artifact["type"] == "aws:cloudformation:stack"
+    }
+
+
+def policy_statements(template: dict) -> list:
+    """Returns (logical id, statement) for every statement of the IAM policies of a template."""
+    statements = []
+    for logical_id, resource in template.get("Resources", {}).items():
+        properties = resource.get("Properties", {})
+        documents = []
+        if resource["Type"] in ("AWS::IAM::Policy", "AWS::IAM::ManagedPolicy"):
+            documents.append(properties.get("PolicyDocument", {}))
+        elif resource["Type"] == "AWS::IAM::Role":
+            documents.extend(
+                policy.get("PolicyDocument", {})
+                for policy in properties.get("Policies", [])
+            )
+        for document in documents:
+            statement = document.get("Statement", [])
+            for item in statement if isinstance(statement, list) else [statement]:
+                statements.append((logical_id, item))
+    return statements
+
+
+def nag_suppressions(template: dict, construct_paths: dict = None) -> list:
+    """Returns (construct, rule id) of every cdk-nag suppression of a template.
+
+    The construct is the top level construct of the stack the resource belongs
+    to, so a suppression applied to the children of a construct counts once.
+    `construct_paths` maps logical ids onto construct paths, the templates only
+    have them with path metadata.
+    """
+    construct_paths = construct_paths or {}
+    suppressions = []
+    for logical_id, resource in template.get("Resources", {}).items():
+        metadata = resource.get("Metadata", {})
+        path = construct_paths.get(logical_id, metadata.get("aws:cdk:path", logical_id))
+        construct = "/".join(path.strip("/").split("/")[:2])
+        for suppression in metadata.get("cdk_nag", {}).get("rules_to_suppress", []):
+            suppressions.append((construct, suppression["id"]))
+    return suppressions
+
+
+def analyze(
+    templates: dict, construct_paths: dict = None, template_bytes: dict = None
+) -> dict:
+    """Reports the size, counts and repeated statements and suppressions of every stack.
+
+    `templates` maps stack ids onto their parsed templates, `construct_paths`
+    stack ids onto the construct paths of their resources and `template_bytes`
+    stack ids onto the size of their template files, as uploaded to
+    CloudFormation. Without a file, the size of the compact json counts.
+    """
+    construct_paths = construct_paths or {}
+    template_bytes = template_bytes or {}
+    # where each statement is used, keyed by its canonical json
+    uses = {}
+    for stack_id, template in templates.items():
+        for logical_id, statement in policy_statements(template):
+            key = json.dumps(statement, sort_keys=True)
+            uses.setdefault(key, []).append((stack_id, logical_id))
+
+    report = {}
+    for stack_id, template in templates.items():
+        duplicates = []
+        for key, used_by in uses.items():
+            in_stack = [
+                logical_id for stack, logical_id in used_by if stack == stack_id
+            ]
+            if in_stack and len(used_by) > 1:
+                duplicates.append(
+                    {
+                        "statement": json.loads(key),
+                        "used_by": [
+                            f"{stack}/{logical_id}" for stack, logical_id in used_by
+                        ],
+                    }
+                )
+
+        suppressed = {}
+        for construct, rule_id in nag_suppressions(
+            template, construct_paths.get(stack_id)
+        ):
+            suppressed.setdefault(rule_id, set()).add(construct)
+
+        report[stack_id] = {
+            "template_bytes": template_bytes.get(
+                stack_id, len(json.dumps(template).encode("utf-8"))
+            ),
+            "resources": len(template.get("Resources", {})),
+            "outputs": len(template.get("Outputs", {})),
+            "parameters": len(template.get("Parameters", {})),
+            "duplicate_statements": duplicates,
+            "repeated_suppressions": {
+                rule_id: sorted(constructs)
+                for rule_id, constructs in sorted(suppressed.items())
+                if len(constructs) > 1
+            },
+        }
+
+    return report
+
+
+def budget_violations(report: dict, budgets: dict) -> list:
+    """Returns a message for every stack exceeding one of the budgets."""
+    budgets = {**DEFAULT_BUDGETS, **budgets}
+    measures = {
+        "max_template_bytes": "template_bytes",
+        "max_resources": "resources",
+        "max_outputs": "outputs",
+        "max_parameters": "parameters",
+    }
+
+    violations = []
+    for stack_id, stack in sorted(report.items()):
+        for budget, measure in measures.items():
+            if stack[measure] > budgets[budget]:
+                violations.append(
+                    f"{stack_id}: {stack[measure]} {measure} is over the budget of {budgets[budget]}"
+                )
+        duplicates = len(stack["duplicate_statements"])
+        if duplicates > budgets["max_duplicate_statements"]:
+            violations.append(
+                f"{stack_id}: {duplicates} duplicate policy statements is over the budget of {budgets['max_duplicate_statements']}"
+            )
+    return violations
+
+
+def suggestions(report: dict) -> list:
+    """Suggests how to share the statements and suppressions repeated by the stacks."""
+    shared = {}
+    for stack in report.values():
+        for duplicate in stack["duplicate_statements"]:
+            stacks = sorted({used.split("/")[0] for used in duplicate["used_by"]})
+            shared.setdefault(tuple(stacks), set()).add(
+                json.dumps(duplicate["statement"], sort_keys=True)
+            )
+
+    messages = []
+    for stacks, statements in sorted(shared.items()):
+        if len(stacks) > 1:
+            messages.append(
+                f"{len(statements)} policy statements are repeated in {', '.join(stacks)}: "
+                "move them into a managed policy of a shared stack, e.g. BuildInfrastructure, and attach it"
+            )
+        else:
+            messages.append(
+                f"{len(statements)} policy statements are repeated within {stacks[0]}: "
+                "move them into one managed policy attached to every role needing them"
+            )
+    for stack_id, stack in sorted(report.items()):
+        for rule_id, constructs in stack["repeated_suppressions"].items():
+            messages.append(
+                f"{stack_id}: {rule_id} is suppressed on {len(constructs)} constructs: "
+                "suppress it once with NagSuppressions.add_stack_suppressions if it applies to the whole stack"
+            )
+    return messages
+
+
+def load_assembly(assembly_dir: str) -> tuple:
+    """Reads the templates, construct paths and template sizes of the stacks of a cloud assembly."""
+    templates = {}
+    construct_paths = {}
+    template_bytes = {}
+    for stack_id, artifact in _stack_artifacts(assembly_dir).items():
+        path = os.path.join(assembly_dir, artifact["properties"]["templateFile"])
+        with open(path, encoding="utf-8") as template_file:
+            templates[stack_id] = json.load(template_file)
+        template_bytes[stack_id] = os.path.getsize(path)
+
+        construct_paths[stack_id] = {
+            entry["data"]: construct_path
+            for construct_path, entries in artifact.get("metadata", {}).items()
+            for entry in entries
+            if entry["type"] == "aws:cdk:logicalId"
+        }
+    return templates, construct_paths, template_bytes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("assembly_dir", nargs="?", default="cdk.out")
+    parser.add_argument("--cdk-json", default=CDK_JSON_PATH)
+    parser.add_argument("--json", action="store_true", help="print the full report")
+    args = parser.parse_args()
+
+    with open(args.cdk_json, encoding="utf-8") as cdk_json:
+        budgets = json.load(cdk_json)["context"].get("template_budget") or {}
+
+    report = analyze(*load_assembly(args.assembly_dir))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(
+            "stack\ttemplate_bytes\tresources\toutputs\tparameters\tduplicate_statements"
+        )
+        for stack_id, stack in sorted(report.items()):
+            print(
+                f"{stack_id}\t{stack['template_bytes']}\t{stack['resources']}\t"
+                f"{stack['outputs']}\t{stack['parameters']}\t{len(stack['duplicate_statements'])}"
+            )
+    for message in suggestions(report):
+        print(message)
+
+    violations = budget_violations(report, budgets)
+    for violation in violations:
+        print(violation, file=sys.stderr)
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Synth time benchmark for the CDK app.
+
+Every run happens in a fresh python process so import timings are cold. A run
+builds the app with src.cdk_app.build_app, as app.py does, and times the
+import of aws_cdk and cdk_nag, the construction of the S3Ops, build
+infrastructure, pipeline and build orchestrator stacks and app.synth()
+separately. It reports peak memory of the python process and of the jsii
+kernel (node) process. The AwsSolutionsChecks run as aspects during
+app.synth(), as in `cdk synth`; their time is what synth takes beyond a run
+with `--nag-scope none`, which leaves the checks out.
+
+The VPC lookup is answered from a cached context value, so the benchmark runs
+offline. `--pipelines` adds synthetic copies of the configured pipelines to
+show how synth cost grows with the number of pipelines.
+
+    python -m tests.benchmark.synth_benchmark_test --pipelines 0 4 16 --output bench.json
+
+pytest leaves it out unless it is selected, e.g. `python -m pytest -m benchmark`.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import pytest
+
+from tests.conftest import ACCOUNT, REGION, ROOT_DIR, load_offline_context
+
+
+def _jsii_kernel_peak_kb() -> Optional[int]:
+    # the jsii kernel runs as a node child process, its peak rss is only visible through /proc
+    peak = 0
+    try:
+        for task in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{task}/children", encoding="utf-8") as children:
+                for pid in children.read().split():
+                    with open(f"/proc/{pid}/status", encoding="utf-8") as status:
+                        for line in status:
+                            if line.startswith("VmHWM:"):
+                                peak += int(line.split()[1])
+    except OSError:
+        return None
+    return peak
+
+
+def run_once(synthetic_pipelines: int, outdir: str, nag_scope: str = "all") -> dict:
+    timings = {}
+
+    def timed(phase, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[phase] = timings.get(phase, 0) + time.perf_counter() - start
+
+    aws_cdk = timed("import_aws_cdk", __import__, "aws_cdk")
+    timed("import_cdk_nag", __import__, "cdk_nag")
+
+    from src.cdk_app import build_app
+    from src.component_registry import MANIFEST_PATH, ComponentRegistry
+
+    # synthetic pipelines must not add recipe versions to the real manifest
+    manifest_path = os.path.join(outdir, "component_versions.json")
+    shutil.copyfile(MANIFEST_PATH, manifest_path)
+
+    context = load_offline_context(synthetic_pipelines)
+    context["nag_scope"] = nag_scope
+
+    app = timed(
+        "construct_app",
+        aws_cdk.App,
+        context=context,
+        outdir=os.path.join(outdir, "cdk.out"),
+    )
+    # the same stacks as app.py, stack selection included; build_app times every stack
+    build_app(
+        app,
+        env={"account": ACCOUNT, "region": REGION},
+        registry=ComponentRegistry(manifest_path=manifest_path),
+        timed=timed,
+    )
+    assembly = timed("synth", app.synth)
+
+    return {
+        "synthetic_pipelines": synthetic_pipelines,
+        "nag_scope": nag_scope,
+        "pipelines": len(context["pipelines"]),
+        "stacks": len(assembly.stacks),
+        "constructs": len(app.node.find_all()),
+        "template_bytes": sum(
+            os.path.getsize(os.path.join(assembly.directory, stack.template_file))
+            for stack in assembly.stacks
+        ),
+        "timings_seconds": {phase: round(value, 4) for phase, value in timings.items()},
+        "total_seconds": round(sum(timings.values()), 4),
+        "peak_memory_kb": {
+            "python": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "jsii_kernel": _jsii_kernel_peak_kb(),
+        },
+    }
+
+
+def run_in_subprocess(synthetic_pipelines: int, nag_scope: str = "all") -> dict:
+    env = dict(os.environ, JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1")
+    completed = subprocess.run(  # nosec B603
+        [
+            sys.executable,
+            "-m",
+            "tests.benchmark.synth_benchmark_test",
+            "--run",
+            str(synthetic_pipelines),
+            "--nag-scope",
+            nag_scope,
+        ],
+        cwd=ROOT_DIR,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _timed_run(synthetic_pipelines: int, nag_scope: str) -> dict:
+    result = run_in_subprocess(synthetic_pipelines, nag_scope)
+    if nag_scope != "none":
+        # the checks run as aspects inside app.synth(), they take what synth takes beyond a run without them
+        baseline = run_in_subprocess(synthetic_pipelines, "none")
+        nag_seconds = (
+            result["timings_seconds"]["synth"] - baseline["timings_seconds"]["synth"]
+        )
+        result["nag_checks_seconds"] = round(max(nag_seconds, 0), 4)
+    return result
+
+
+def benchmark(pipeline_counts: list, repeat: int = 1, nag_scope: str = "all") -> dict:
+    return {
+        "python": sys.version.split()[0],
+        "results": [
+            _timed_run(count, nag_scope)
+            for count in pipeline_counts
+            for _ in range(repeat)
+        ],
+    }
+
+
+@pytest.mark.benchmark
+def test_synth_benchmark_reports_every_phase(offline_context):
+    report = benchmark([1])
+    (result,) = report["results"]
+
+    assert result["pipelines"] == len(offline_context["pipelines"]) + 1
+    assert set(result["timings_seconds"]) >= {
+        "import_aws_cdk",
+        "import_cdk_nag",
+        "construct_app",
+        "construct_s3_ops",
+        "construct_build_infrastructure",
+        "construct_pipelines",
+        "synth",
+    }
+    assert result["nag_checks_seconds"] >= 0
+    # S3Ops, BuildInfrastructure and a stack per pipeline
+    assert result["stacks"] == result["pipelines"] + 2
+    assert result["template_bytes"] > 0
+    assert result["peak_memory_kb"]["python"] > 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--pipelines",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="numbers of synthetic pipelines to add",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per pipeline count")
+    parser.add_argument(
+        "--output", help="write the json report to this file instead of stdout"
+    )
+    parser.add_argument(
+        "--nag-scope",
+        choices=("all", "selected", "none"),
+        default="all",
+        help="nag_scope context of the runs",
+    )
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        with tempfile.TemporaryDirectory() as outdir:
+            print(json.dumps(run_once(args.run, outdir, args.nag_scope)))
+        return
+
+    report = json.dumps(
+        benchmark(args.pipelines, args.repeat, args.nag_scope), indent=2
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Fixtures shared by the tests, e.g. the context for synthesizing the app offline.
+
+The VPC lookup is answered from a cached context value of a fake account, so
+synth does not call AWS. The synth benchmark also runs outside pytest and
+imports load_offline_context directly.
+"""
+import copy
+import json
+import os
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ACCOUNT = "123456789012"
+REGION = "eu-west-2"
+VPC_ID = "vpc-0123456789abcdef0"
+SUBNET_ID = "subnet-0123456789abcdef0"
+
+VPC_CONTEXT = {
+    "vpcId": VPC_ID,
+    "vpcCidrBlock": "10.0.0.0/16",
+    "availabilityZones": [],
+    "subnetGroups": [
+        {
+            "name": "Private",
+            "type": "Private",
+            "subnets": [
+                {
+                    "subnetId": SUBNET_ID,
+                    "cidr": "10.0.0.0/24",
+                    "availabilityZone": f"{REGION}a",
+                    "routeTableId": "rtb-0123456789abcdef0",
+                }
+            ],
+        }
+    ],
+}
+
+
+def load_offline_context(synthetic_pipelines: int = 0) -> dict:
+    """Returns the cdk.json context with `synthetic_pipelines` copies of the configured pipelines added."""
+    with open(os.path.join(ROOT_DIR, "cdk.json"), encoding="utf-8") as cdk_json:
+        context = json.load(cdk_json)["context"]
+
+    context["vpc_id"] = VPC_ID
+    context["subnet_id"] = SUBNET_ID
+    context[
+        f"vpc-provider:account={ACCOUNT}:filter.vpc-id={VPC_ID}:region={REGION}:returnAsymmetricSubnets=true"
+    ] = VPC_CONTEXT
+
+    templates = context["pipelines"]
+    for index in range(synthetic_pipelines):
+        spec = copy.deepcopy(templates[index % len(templates)])
+        spec["id"] = f"BenchmarkPipeline{index}"
+        spec["name"] = f"BenchmarkPipeline{index}"
+        context["pipelines"].append(spec)
+
+    return context
+
+
+@pytest.fixture
+def offline_context() -> dict:
+    """The cdk.json context for synthesizing the app offline."""
+    return load_offline_context()
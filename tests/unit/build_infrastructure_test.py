@@ -0,0 +1,129 @@
+import json
+
+from aws_cdk import App
+from aws_cdk.assertions import Match, Template
+
+from src.build_infrastructure import BuildInfrastructure
+from tests.conftest import ACCOUNT, REGION, SUBNET_ID, VPC_ID
+
+SNAPSHOT = {
+    "vpcs": {
+        VPC_ID: {
+            "cidr_block": "10.0.0.0/16",
+            "availability_zones": [f"{REGION}a"],
+            "subnets": {
+                SUBNET_ID: {
+                    "availability_zone": f"{REGION}a",
+                    "cidr_block": "10.0.0.0/24",
+                }
+            },
+        }
+    },
+}
+
+CONTEXT = {
+    "subnet_id": SUBNET_ID,
+    "package_cache": {"proxy": "", "artifacts": True},
+    "performance_tests": {"enabled": False},
+}
+
+
+def _template(specs: list) -> Template:
+    stack = BuildInfrastructure(
+        App(context=CONTEXT),
+        "BuildInfrastructure",
+        vpc_id=VPC_ID,
+        snapshot=SNAPSHOT,
+        env={"account": ACCOUNT, "region": REGION},
+    )
+    for spec in specs:
+        stack.pipeline_configuration(spec)
+    return Template.from_stack(stack)
+
+
+def _granted(template: Template, action: str) -> list:
+    """Resources of the build instance policy statements allowing `action`, as json."""
+    (policy,) = template.find_resources("AWS::IAM::ManagedPolicy").values()
+    return [
+        json.dumps(statement["Resource"])
+        for statement in policy["Properties"]["PolicyDocument"]["Statement"]
+        if action in statement["Action"]
+    ]
+
+
+def test_pipelines_with_the_same_egress_rules_share_a_security_group():
+    proxy_rules = [{"cidr": "10.0.0.10/32", "port": 3142}]
+    template = _template(
+        [
+            {"name": "Ubuntu", "os": "ubuntu"},
+            {"name": "Al2", "os": "amazon_linux"},
+            {"name": "UbuntuProxy", "os": "ubuntu", "egress_rules": proxy_rules},
+        ]
+    )
+
+    template.resource_count_is("AWS::EC2::SecurityGroup", 2)
+    template.has_resource_properties(
+        "AWS::EC2::SecurityGroup",
+        {
+            "SecurityGroupEgress": [
+                Match.object_like({"CidrIp": "10.0.0.10/32", "FromPort": 3142})
+            ]
+        },
+    )
+    configs = template.find_resources("AWS::ImageBuilder::InfrastructureConfiguration")
+    groups = {
+        config["Properties"]["Name"].split("-")[-1]: str(
+            config["Properties"]["SecurityGroupIds"]
+        )
+        for config in configs.values()
+    }
+    assert groups["Ubuntu"] == groups["Al2"] != groups["UbuntuProxy"]
+
+
+def test_every_pipeline_has_an_exported_infrastructure_configuration():
+    template = _template(
+        [
+            {"name": "Ubuntu", "os": "ubuntu", "instance_types": ["m5.large"]},
+            {"name": "Al2", "os": "amazon_linux"},
+            # a spec configured twice keeps a single configuration
+            {"name": "Ubuntu", "os": "ubuntu", "instance_types": ["m5.large"]},
+        ]
+    )
+
+    template.resource_count_is("AWS::ImageBuilder::InfrastructureConfiguration", 2)
+    template.has_resource_properties(
+        "AWS::ImageBuilder::InfrastructureConfiguration",
+        {
+            "Name": "BuildInfrastructure-Ubuntu",
+            "InstanceTypes": ["m5.large"],
+            "SubnetId": SUBNET_ID,
+        },
+    )
+    exports = template.find_outputs("*")
+    assert len(exports) == 2
+    assert all(output["Value"]["Fn::GetAtt"][1] == "Arn" for output in exports.values())
+
+
+def test_the_build_role_is_only_granted_what_the_pipelines_use():
+    template = _template([{"name": "Al2", "os": "amazon_linux", "shrink_image": False}])
+    assert _granted(template, "s3:PutObject") == []
+    assert _granted(template, "ecr:PutImage") == []
+    (image_builder_buckets,) = _granted(template, "s3:GetObject")
+    assert "artifacts" not in image_builder_buckets
+
+    template = _template(
+        [
+            {"name": "Ubuntu", "os": "ubuntu"},
+            {"name": "UbuntuResearch", "os": "ubuntu", "container": {}},
+        ]
+    )
+    # one statement per grant, with the resources of every pipeline using it
+    (results,) = _granted(template, "s3:PutObject")
+    assert "/performance/Ubuntu/*" in results
+    assert "/performance/UbuntuResearch/*" in results
+    assert any(
+        "/artifacts/*" in bucket for bucket in _granted(template, "s3:GetObject")
+    )
+    (repository,) = _granted(template, "ecr:PutImage")
+    assert repository.endswith('repository/centralised-images/ubunturesearch"]]}')
+    assert _granted(template, "ecr:GetAuthorizationToken") == ['"*"']
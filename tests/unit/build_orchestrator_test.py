@@ -0,0 +1,166 @@
+import datetime
+import importlib
+import types
+
+import pytest
+
+RECIPE_ARN = "arn:aws:imagebuilder:eu-west-2:111111111111:image-recipe/ubuntu/1.0.1"
+
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    monkeypatch.setenv("PIPELINES", "[]")
+    monkeypatch.setenv("MAX_CONCURRENT_BUILDS", "2")
+    monkeypatch.setenv("MAX_CONCURRENT_BUILDS_PER_SUBNET", "1")
+    monkeypatch.setenv("FINGERPRINT_TAG", "RecipeFingerprint")
+    monkeypatch.setenv("FINGERPRINT_MAX_AGE_DAYS", "7")
+    return importlib.reload(
+        importlib.import_module("src.functions.build_orchestrator.index")
+    )
+
+
+class FakeImagebuilder:
+    def __init__(self):
+        self.started = []
+
+    def get_image_pipeline(self, **kwargs):
+        return {"imagePipeline": {"imageRecipeArn": RECIPE_ARN}}
+
+    def start_image_pipeline_execution(self, **kwargs):
+        self.started.append(kwargs["imagePipelineArn"])
+
+
+class FakeEc2:
+    def __init__(self, images=()):
+        self.images = list(images)
+        self.tags = {}
+
+    def describe_images(self, **kwargs):
+        return {"Images": self.images}
+
+    def create_tags(self, **kwargs):
+        for resource in kwargs["Resources"]:
+            self.tags.setdefault(resource, []).extend(
+                tag["Key"] for tag in kwargs["Tags"]
+            )
+
+
+class ParameterNotFoundError(Exception):
+    pass
+
+
+class FakeSsm:
+    exceptions = types.SimpleNamespace(ParameterNotFound=ParameterNotFoundError)
+
+    def __init__(self, parameters=None):
+        self.parameters = dict(parameters or {})
+
+    def get_parameter(self, **kwargs):
+        if kwargs["Name"] not in self.parameters:
+            raise ParameterNotFoundError(kwargs["Name"])
+        return {"Parameter": {"Value": self.parameters[kwargs["Name"]]}}
+
+    def put_parameter(self, **kwargs):
+        self.parameters[kwargs["Name"]] = kwargs["Value"]
+
+
+def _ago(**delta) -> str:
+    return (
+        datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(**delta)
+    ).isoformat()
+
+
+def _image(version: str, created: str, status: str = "AVAILABLE") -> dict:
+    return {"version": version, "dateCreated": created, "state": {"status": status}}
+
+
+def _pipeline(name: str, subnet: str = "subnet-1", parent: str = None) -> dict:
+    return {
+        "arn": f"arn:{name}",
+        "name": name,
+        "parent": parent,
+        "subnet": subnet,
+        "fingerprint": f"fingerprint-{name}",
+        "parameter": f"/workspace/{name}/latest-ami",
+    }
+
+
+def test_build_reason_is_a_missing_image_of_the_recipe_version(orchestrator):
+    pipeline = _pipeline("Ubuntu")
+    images = {pipeline["arn"]: [_image("1.0.0/1", "2024-01-01T00:00:00Z")]}
+
+    assert orchestrator.build_reason(pipeline, "1.0.1", images) == (
+        "no image of recipe version 1.0.1"
+    )
+    assert orchestrator.build_reason(pipeline, "1.0.0", images) is None
+
+
+def test_build_reason_is_a_newer_parent_image(orchestrator):
+    parent = _pipeline("Ubuntu")
+    pipeline = _pipeline("UbuntuResearch", parent=parent["arn"])
+    images = {
+        parent["arn"]: [_image("1.0.0/2", "2024-02-01T00:00:00Z")],
+        pipeline["arn"]: [_image("1.0.0/1", "2024-01-01T00:00:00Z")],
+    }
+
+    assert orchestrator.build_reason(pipeline, "1.0.0", images) == (
+        "parent pipeline built a newer image"
+    )
+    # a failed parent build is not used by the children
+    images[parent["arn"]][0]["state"]["status"] = "FAILED"
+    assert orchestrator.build_reason(pipeline, "1.0.0", images) is None
+
+
+def test_fingerprint_image_is_the_latest_recent_ami(orchestrator):
+    ec2 = FakeEc2(
+        [
+            {"ImageId": "ami-old", "CreationDate": _ago(days=30)},
+            {"ImageId": "ami-1", "CreationDate": _ago(days=2)},
+            {"ImageId": "ami-2", "CreationDate": _ago(days=1)},
+        ]
+    )
+
+    assert orchestrator.fingerprint_image(ec2, "fingerprint") == "ami-2"
+    # amis built before the latest parent image do not include it
+    assert orchestrator.fingerprint_image(ec2, "fingerprint", _ago(hours=1)) is None
+
+
+def test_publish_image_sets_the_parameter_once(orchestrator):
+    pipeline = _pipeline("Ubuntu")
+    ssm = FakeSsm()
+    ec2 = FakeEc2()
+
+    assert orchestrator.publish_image(ssm, ec2, pipeline, "ami-1")
+    assert ssm.parameters[pipeline["parameter"]] == "ami-1"
+    assert ec2.tags["ami-1"] == ["ReusedBy:Ubuntu"]
+    assert not orchestrator.publish_image(ssm, ec2, pipeline, "ami-1")
+
+
+def test_start_builds_caps_the_concurrent_builds(orchestrator):
+    pipelines = [
+        _pipeline("Running", subnet="subnet-1"),
+        _pipeline("SameSubnet", subnet="subnet-1"),
+        _pipeline("OtherSubnet", subnet="subnet-2"),
+        _pipeline("OverTheCap", subnet="subnet-3"),
+    ]
+    images = {pipeline["arn"]: [] for pipeline in pipelines}
+    images["arn:Running"] = [_image("1.0.1/1", _ago(minutes=10), "BUILDING")]
+    imagebuilder = FakeImagebuilder()
+
+    orchestrator.start_builds(imagebuilder, FakeEc2(), FakeSsm(), pipelines, images)
+
+    # one build per subnet and two in the account, counting the running one
+    assert imagebuilder.started == ["arn:OtherSubnet"]
+
+
+def test_start_builds_reuses_an_image_with_the_same_fingerprint(orchestrator):
+    pipeline = _pipeline("Ubuntu")
+    images = {pipeline["arn"]: [_image("1.0.0/1", _ago(days=3))]}
+    ec2 = FakeEc2([{"ImageId": "ami-1", "CreationDate": _ago(days=1)}])
+    ssm = FakeSsm()
+    imagebuilder = FakeImagebuilder()
+
+    orchestrator.start_builds(imagebuilder, ec2, ssm, [pipeline], images)
+
+    assert imagebuilder.started == []
+    assert ssm.parameters[pipeline["parameter"]] == "ami-1"
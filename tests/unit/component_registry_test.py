@@ -0,0 +1,138 @@
+import json
+
+import yaml
+
+from src.component_registry import (
+    INITIAL_VERSION,
+    ComponentRegistry,
+    inputs_digest,
+    recipe_fingerprint,
+)
+from src.performance_tests import performance_test_entry, shrink_image_entry
+from src.step_metrics import PIPELINE_PARAMETER
+
+
+def _document(command: str) -> dict:
+    return {
+        "name": "InstallTools",
+        "schemaVersion": 1.0,
+        "phases": [
+            {
+                "name": "build",
+                "steps": [
+                    {
+                        "name": "InstallTools",
+                        "action": "ExecuteBash",
+                        "inputs": {"commands": [command]},
+                    }
+                ],
+            }
+        ],
+    }
+
+
+def _write_component(components_dir, command: str) -> None:
+    path = components_dir / "ubuntu" / "install_tools.yml"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(yaml.safe_dump(_document(command)), encoding="utf-8")
+
+
+def _registry(tmp_path) -> ComponentRegistry:
+    return ComponentRegistry(
+        components_dir=str(tmp_path / "components"),
+        manifest_path=str(tmp_path / "component_versions.json"),
+    )
+
+
+def test_new_components_get_the_initial_version(tmp_path):
+    _write_component(tmp_path / "components", "apt-get install -y -q git")
+
+    assert _registry(tmp_path).component_version("ubuntu/install_tools.yml") == (
+        INITIAL_VERSION
+    )
+
+
+def test_changed_content_bumps_the_patch_version(tmp_path):
+    _write_component(tmp_path / "components", "apt-get install -y -q git")
+    _registry(tmp_path).component_version("ubuntu/install_tools.yml")
+
+    _write_component(tmp_path / "components", "apt-get install -y -q git curl")
+
+    assert _registry(tmp_path).component_version("ubuntu/install_tools.yml") == "1.0.1"
+
+
+def test_unchanged_content_keeps_its_version(tmp_path):
+    _write_component(tmp_path / "components", "apt-get install -y -q git")
+    _registry(tmp_path).component_version("ubuntu/install_tools.yml")
+
+    assert _registry(tmp_path).component_version("ubuntu/install_tools.yml") == (
+        INITIAL_VERSION
+    )
+
+
+def test_reverted_content_gets_a_new_version(tmp_path):
+    _write_component(tmp_path / "components", "apt-get install -y -q git")
+    _registry(tmp_path).component_version("ubuntu/install_tools.yml")
+    _write_component(tmp_path / "components", "apt-get install -y -q git curl")
+    _registry(tmp_path).component_version("ubuntu/install_tools.yml")
+
+    # the reverted component must be the highest version, which image builder picks
+    _write_component(tmp_path / "components", "apt-get install -y -q git")
+
+    assert _registry(tmp_path).component_version("ubuntu/install_tools.yml") == "1.0.2"
+
+
+def test_versions_are_written_to_the_manifest(tmp_path):
+    _write_component(tmp_path / "components", "apt-get install -y -q git")
+    registry = _registry(tmp_path)
+    registry.component_version("ubuntu/install_tools.yml")
+    registry.recipe_version("rUbuntuRecipe", {"parent_image": "ami-1"})
+    registry.recipe_version("rUbuntuRecipe", {"parent_image": "ami-2"})
+
+    with open(tmp_path / "component_versions.json", encoding="utf-8") as manifest:
+        recorded = json.load(manifest)
+
+    assert recorded["components"]["ubuntu/install_tools.yml"] == {
+        registry.component_hash("ubuntu/install_tools.yml"): INITIAL_VERSION
+    }
+    assert sorted(recorded["recipes"]["rUbuntuRecipe"].values()) == ["1.0.0", "1.0.1"]
+
+
+def test_inputs_digest_ignores_the_order_of_keys():
+    inputs = {"components": [["ubuntu/install_tools.yml", "1.0.0", None]], "a": 1}
+    reordered = {"a": 1, "components": [["ubuntu/install_tools.yml", "1.0.0", None]]}
+
+    assert inputs_digest(inputs) == inputs_digest(reordered)
+    assert inputs_digest(inputs) != inputs_digest({**inputs, "a": 2})
+
+
+def _recipe_inputs(pipeline_name: str) -> dict:
+    entries = [
+        {"path": "ubuntu/install_xrdp.yml"},
+        shrink_image_entry("ubuntu", "components-bucket", pipeline_name),
+        performance_test_entry(
+            "ubuntu", {"disk_read_mib": 512}, "components-bucket", pipeline_name
+        ),
+    ]
+    return {
+        "components": [
+            [
+                entry["path"],
+                "1.0.0",
+                {**entry.get("parameters", {}), PIPELINE_PARAMETER: pipeline_name},
+            ]
+            for entry in entries
+        ],
+        "parent_image": "ami-0aaa5410833273cfe",
+        "root_volume_size": 8,
+    }
+
+
+def test_pipelines_with_the_same_recipe_share_the_fingerprint():
+    fingerprint = recipe_fingerprint(_recipe_inputs("UbuntuWorkspace"))
+
+    assert recipe_fingerprint(_recipe_inputs("UbuntuResearch")) == fingerprint
+    # the other parameters still change the image
+    other = _recipe_inputs("UbuntuResearch")
+    other["components"][2][2]["DiskReadMiB"] = 1024
+    assert recipe_fingerprint(other) != fingerprint
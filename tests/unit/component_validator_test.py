@@ -0,0 +1,115 @@
+import os
+import subprocess  # nosec B404
+import sys
+
+import pytest
+
+from src.component_registry import COMPONENTS_DIR
+from src.component_validator import (
+    bash_syntax,
+    shellcheck,
+    validate_component,
+    validate_document,
+)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _document(steps: list, **keys) -> dict:
+    return {
+        "name": "InstallTools",
+        "schemaVersion": 1.0,
+        "parameters": [{"Version": {"type": "string", "default": "1"}}],
+        "phases": [{"name": "build", "steps": steps}],
+        **keys,
+    }
+
+
+def _bash_step(*commands: str) -> dict:
+    return {
+        "name": "InstallTools",
+        "action": "ExecuteBash",
+        "inputs": {"commands": list(commands)},
+    }
+
+
+def test_the_components_are_valid():
+    for os_name in ("amazon_linux", "ubuntu"):
+        for file_name in os.listdir(os.path.join(COMPONENTS_DIR, os_name)):
+            path = os.path.join(COMPONENTS_DIR, os_name, file_name)
+            assert validate_component(path) == [], path
+
+
+def test_schema_errors_are_reported():
+    assert validate_document(_document([_bash_step("true")])) == []
+
+    errors = validate_document(
+        _document([_bash_step("true")], schemaVersion=2.0, owner="me")
+    )
+    assert errors == ["unknown top level key owner", "schemaVersion must be 1.0"]
+
+    assert validate_document(_document([], phases=[])) == [
+        "at least one phase is required"
+    ]
+    (error,) = validate_document(_document([{**_bash_step("true"), "retries": 3}]))
+    assert error == "phase build, step InstallTools: unknown key retries"
+
+
+def test_unknown_actions_are_reported():
+    step = {"name": "Download", "action": "ExecuteBashScript", "inputs": {}}
+
+    (error,) = validate_document(_document([step]))
+    assert error == "phase build, step Download: unknown action ExecuteBashScript"
+
+
+def test_undeclared_variables_are_reported():
+    document = _document(
+        [
+            _bash_step(
+                "echo {{ Version }} {{ build.Download.outputs.stdout }}",
+                "echo {{ Release }}",
+            )
+        ]
+    )
+
+    (error,) = validate_document(document)
+    assert error == (
+        "phase build, step InstallTools: {{ Release }} is not a declared parameter or constant"
+    )
+
+
+def test_bash_syntax_errors_are_reported():
+    assert bash_syntax(_document([_bash_step("echo {{ Version }}")])) == []
+
+    (error,) = bash_syntax(
+        _document([_bash_step("if true; then", "echo {{ Version }}")])
+    )
+    assert error.startswith("phase build, step InstallTools: line 3: syntax error")
+
+
+def test_synth_validation_does_not_depend_on_shellcheck(monkeypatch):
+    monkeypatch.setattr(
+        "shutil.which", lambda name: "/bin/bash" if name == "bash" else None
+    )
+    document = _document([_bash_step("echo {{ Version }}")])
+
+    # only the command line shellchecks, and it fails without shellcheck
+    path = os.path.join(COMPONENTS_DIR, "ubuntu", "install_xrdp.yml")
+    assert validate_component(path) == []
+    with pytest.raises(FileNotFoundError, match="shellcheck is not installed"):
+        shellcheck(document)
+
+
+def test_validation_does_not_load_the_cdk():
+    completed = subprocess.run(  # nosec B603
+        [
+            sys.executable,
+            "-c",
+            "import sys, src.component_validator; print('aws_cdk' in sys.modules)",
+        ],
+        cwd=ROOT_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    assert completed.stdout.strip() == "False"
@@ -0,0 +1,50 @@
+import pytest
+
+from src.container_image import (
+    DOCKERFILE_TEMPLATE,
+    container_dockerfile_template,
+    container_parent_image,
+    container_repository_name,
+)
+
+
+def test_container_parent_image_defaults_to_the_distribution_of_the_os():
+    assert container_parent_image("ubuntu", {}) == "ubuntu:22.04"
+    assert container_parent_image("amazon_linux", {}) == "amazonlinux:2"
+    parent_image = container_parent_image("ubuntu", {"parent_image": "ubuntu:24.04"})
+    assert parent_image == "ubuntu:24.04"
+
+    with pytest.raises(
+        ValueError, match="No default container parent_image for os windows"
+    ):
+        container_parent_image("windows", {})
+
+
+def test_the_ubuntu_container_installs_what_the_components_download_with():
+    template = container_dockerfile_template("ubuntu", {})
+    (install,) = [line for line in template.splitlines() if line.startswith("RUN")]
+    assert {"curl", "unzip", "ca-certificates"} <= set(install.split())
+    # the parent image and the components placeholders stay around the install
+    assert template.startswith("FROM {{{ imagebuilder:parentImage }}}")
+    assert template.endswith("{{{ imagebuilder:components }}}\n")
+
+    assert container_dockerfile_template("amazon_linux", {}) == DOCKERFILE_TEMPLATE
+    custom = {"dockerfile_template": "FROM {{{ imagebuilder:parentImage }}}"}
+    assert (
+        container_dockerfile_template("ubuntu", custom) == custom["dockerfile_template"]
+    )
+
+
+def test_container_repositories_are_named_after_the_pipeline():
+    repository_name = container_repository_name("UbuntuWorkspace", {})
+    assert repository_name == "centralised-images/ubuntuworkspace"
+    repository_name = container_repository_name(
+        "UbuntuWorkspace", {"repository_name": "centralised-images/desktops"}
+    )
+    assert repository_name == "centralised-images/desktops"
+
+    # the build instances can not push anywhere else
+    with pytest.raises(
+        ValueError, match="must start with centralised-images/, not desktops"
+    ):
+        container_repository_name("UbuntuWorkspace", {"repository_name": "desktops"})
@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+
+from src.context_snapshot import (
+    SNAPSHOT_PATH,
+    snapshot_changes,
+    snapshot_path,
+    snapshot_subnet,
+    snapshot_targets,
+    stale_entries,
+)
+
+CONTEXT = {
+    "vpc_id": "vpc-default",
+    "subnet_id": "subnet-default",
+    "pipelines": [
+        {"id": "UbuntuDesktop", "base_image_parameter": "/ubuntu/ami"},
+        {"id": "Al2Desktop", "vpc_id": "vpc-other", "subnet_id": "subnet-other"},
+    ],
+    "context_snapshot": {"max_age_days": 30},
+}
+
+SNAPSHOT = {
+    "version": 1,
+    "account": "123456789012",
+    "region": "eu-west-2",
+    "recorded_at": "2026-10-01T00:00:00+00:00",
+    "vpcs": {
+        "vpc-default": {
+            "cidr_block": "10.0.0.0/16",
+            "availability_zones": ["eu-west-2a"],
+            "subnets": {
+                "subnet-default": {
+                    "availability_zone": "eu-west-2a",
+                    "cidr_block": "10.0.0.0/24",
+                }
+            },
+        }
+    },
+    "parameters": {"/ubuntu/ami": "ami-0123"},
+}
+
+
+def test_targets_cover_the_context_and_every_pipeline():
+    assert snapshot_targets(CONTEXT) == (
+        {"vpc-default": {"subnet-default"}, "vpc-other": {"subnet-other"}},
+        {"/ubuntu/ami"},
+    )
+
+
+def test_the_snapshot_path_is_read_from_the_context():
+    assert snapshot_path(CONTEXT) == SNAPSHOT_PATH
+    context = {"context_snapshot": {"path": "snapshots/eu-west-2.json"}}
+    path = snapshot_path(context, "/work/cdk.json")
+    assert path == "/work/snapshots/eu-west-2.json"
+
+
+def test_missing_and_old_entries_are_stale():
+    recent = datetime.datetime(2026, 10, 18, tzinfo=datetime.timezone.utc)
+    assert stale_entries(SNAPSHOT, CONTEXT, recent) == ["VPC vpc-other is not recorded"]
+
+    context = {key: value for key, value in CONTEXT.items() if key != "pipelines"}
+    old = datetime.datetime(2026, 12, 1, tzinfo=datetime.timezone.utc)
+    assert stale_entries(SNAPSHOT, context, old) == [
+        "Recorded 61 days ago, more than max_age_days 30"
+    ]
+
+
+def test_changes_list_every_changed_value():
+    refreshed = {
+        **SNAPSHOT,
+        "recorded_at": "2026-10-18T00:00:00+00:00",
+        "parameters": {"/ubuntu/ami": "ami-4567"},
+    }
+    assert snapshot_changes(SNAPSHOT, refreshed) == [
+        'parameters./ubuntu/ami: "ami-0123" -> "ami-4567"'
+    ]
+
+
+def test_unknown_subnets_fail():
+    assert snapshot_subnet(SNAPSHOT, "vpc-default", "subnet-default")
+    with pytest.raises(
+        ValueError,
+        match="Subnet subnet-unknown is not a recorded subnet of VPC vpc-default",
+    ):
+        snapshot_subnet(SNAPSHOT, "vpc-default", "subnet-unknown")
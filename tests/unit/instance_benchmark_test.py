@@ -0,0 +1,255 @@
+import json
+import os
+
+import pytest
+
+from src.image_builder_pipeline import pipeline_schedule
+from src.instance_benchmark import (
+    build_duration_seconds,
+    build_log_streams,
+    collect,
+    rank_instance_types,
+    recommend,
+    trial_specs,
+    write_instance_types,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+BENCHMARK = {
+    "pipelines": ["UbuntuImagebuilderPipeline"],
+    "instance_types": ["t3.medium", "c6i.xlarge"],
+    "prices": {
+        "t3.medium": 0.0472,
+        "t3.xlarge": 0.1888,
+        "m6i.large": 0.111,
+        "c6i.xlarge": 0.202,
+    },
+    "max_build_minutes": 30,
+}
+
+
+def load_fixture(name: str) -> dict:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as fixture:
+        return json.load(fixture)
+
+
+def test_trial_specs_build_each_pipeline_on_a_single_instance_type():
+    specs = [
+        {
+            "id": "UbuntuImagebuilderPipeline",
+            "name": "UbuntuWorkspace",
+            "instance_types": ["t3.medium"],
+            "fast_snapshot_restore": {"eu-west-2": ["eu-west-2a"]},
+            "container": {},
+        }
+    ]
+
+    trials = trial_specs(specs, BENCHMARK)
+
+    assert [trial["id"] for trial in trials] == [
+        "UbuntuImagebuilderPipelineT3MediumTrial",
+        "UbuntuImagebuilderPipelineC6iXlargeTrial",
+    ]
+    assert [trial["instance_types"] for trial in trials] == [
+        ["t3.medium"],
+        ["c6i.xlarge"],
+    ]
+    assert all(trial["distribution"] is None for trial in trials)
+    assert all(trial["schedule"] is None for trial in trials)
+    assert all("fast_snapshot_restore" not in trial for trial in trials)
+    assert all("container" not in trial for trial in trials)
+    assert specs[0]["instance_types"] == ["t3.medium"]
+
+
+def test_trial_pipelines_ignore_the_schedule_context():
+    specs = [{"id": "UbuntuImagebuilderPipeline", "name": "UbuntuWorkspace"}]
+
+    for trial in trial_specs(specs, BENCHMARK):
+        # the pipeline stack falls back to the schedule context when the spec has no schedule
+        assert pipeline_schedule(trial.get("schedule", "cron(0 2 * * ? *)")) is None
+
+
+def test_trial_specs_reject_unknown_pipelines():
+    with pytest.raises(
+        ValueError, match="Cannot benchmark unknown pipeline UbuntuImagebuilderPipeline"
+    ):
+        trial_specs([], BENCHMARK)
+
+
+def test_build_duration_spans_every_log_stream_of_the_build():
+    log_streams = load_fixture("instance_benchmark_log_streams.json")["logStreams"]
+
+    assert build_duration_seconds(log_streams) == 2128.0
+
+
+def test_recommendation_prefers_cheapest_build_within_the_limit():
+    ranking = recommend(load_fixture("instance_benchmark_timings.json"), BENCHMARK)
+
+    # t3.medium is the cheapest build but takes over an hour, so it comes last
+    assert [
+        result["instance_type"] for result in ranking["UbuntuImagebuilderPipeline"]
+    ] == [
+        "c6i.xlarge",
+        "t3.xlarge",
+        "m6i.large",
+        "t3.medium",
+    ]
+    # instance types without successful builds are not recommended
+    assert [
+        result["instance_type"] for result in ranking["Al2MateImagebuilderPipeline"]
+    ] == [
+        "t3.medium",
+        "m6i.large",
+        "t3.xlarge",
+    ]
+
+
+def test_ranking_without_limit_is_by_cost():
+    ranking = rank_instance_types(
+        {"t3.medium": [3600], "c6i.xlarge": [900]}, BENCHMARK["prices"]
+    )
+
+    assert ranking == [
+        {
+            "instance_type": "t3.medium",
+            "median_seconds": 3600,
+            "builds": 1,
+            "cost": 0.0472,
+        },
+        {
+            "instance_type": "c6i.xlarge",
+            "median_seconds": 900,
+            "builds": 1,
+            "cost": 0.0505,
+        },
+    ]
+
+
+def test_ranking_requires_a_price_for_every_instance_type():
+    with pytest.raises(
+        ValueError, match="No price configured for instance type m7g.large"
+    ):
+        rank_instance_types({"m7g.large": [600]}, BENCHMARK["prices"])
+
+
+def test_build_log_streams_exclude_other_builds_with_the_same_prefix():
+    log_streams = [
+        {"logStreamName": name} for name in ["1.0.1/1", "1.0.1/1/step", "1.0.1/10"]
+    ]
+
+    assert build_log_streams(log_streams, "1.0.1/1") == log_streams[:2]
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages(**kwargs))
+
+
+class FakeImagebuilder:
+    def list_image_pipelines(self, **kwargs):
+        return {"imagePipelineList": [{"arn": "arn:trial"}]}
+
+    def get_paginator(self, operation):
+        assert operation == "list_image_pipeline_images"
+        image = "arn:aws:imagebuilder:eu-west-2:111111111111:image/trial/1.0.0/{}"
+        return FakePaginator(
+            lambda **kwargs: [
+                {"imageSummaryList": [_available(image.format(1))]},
+                {"imageSummaryList": [_available(image.format(2))]},
+            ]
+        )
+
+
+class FakeLogs:
+    def get_paginator(self, operation):
+        assert operation == "describe_log_streams"
+        return FakePaginator(
+            lambda **kwargs: [
+                {"logStreams": [_stream(kwargs["logStreamNamePrefix"], 0, 600_000)]},
+                {
+                    "logStreams": [
+                        _stream(f"{kwargs['logStreamNamePrefix']}/step", 0, 900_000)
+                    ]
+                },
+            ]
+        )
+
+
+def _available(arn: str) -> dict:
+    return {"arn": arn, "state": {"status": "AVAILABLE"}}
+
+
+def _stream(name: str, first: int, last: int) -> dict:
+    return {
+        "logStreamName": name,
+        "firstEventTimestamp": first,
+        "lastEventTimestamp": last,
+    }
+
+
+def test_collect_reads_every_page_of_images_and_log_streams(monkeypatch):
+    clients = {"imagebuilder": FakeImagebuilder(), "logs": FakeLogs()}
+    monkeypatch.setattr("boto3.client", clients.get)
+    context = {
+        "pipelines": [{"id": "Ubuntu", "name": "Ubuntu"}],
+        "instance_benchmark": {
+            "pipelines": ["Ubuntu"],
+            "instance_types": ["t3.medium"],
+        },
+    }
+
+    # both images, each lasting from its first to the end of its last log stream
+    assert collect(context) == {"Ubuntu": {"t3.medium": [900, 900]}}
+
+
+def test_write_instance_types_only_changes_the_given_pipeline():
+    cdk_json = """{
+  "app": "python3 app.py",
+  "context": {
+    "pipelines": [
+      {
+        "id": "Al2MateImagebuilderPipeline",
+        "instance_types": ["t3.medium"],
+        "egress_rules": [
+          {"cidr": "0.0.0.0/0", "port": 443}
+        ]
+      },
+      {
+        "id": "UbuntuImagebuilderPipeline",
+        "product": {"instance_types": ["t3.xlarge"]},
+        "instance_types": ["t3.medium"]
+      },
+      {
+        "id": "UbuntuResearchToolsPipeline",
+        "product": {"instance_types": ["t3.xlarge"]}
+      }
+    ],
+    "instance_benchmark": {
+      "pipelines": ["UbuntuImagebuilderPipeline"],
+      "instance_types": ["t3.medium", "c6i.xlarge"]
+    }
+  }
+}"""
+
+    written = write_instance_types(
+        cdk_json, "UbuntuImagebuilderPipeline", ["c6i.xlarge", "t3.xlarge"]
+    )
+
+    assert written == cdk_json.replace(
+        '"instance_types": ["t3.medium"]\n      },',
+        '"instance_types": ["c6i.xlarge", "t3.xlarge"]\n      },',
+    )
+    assert json.loads(written)["context"]["pipelines"][1]["product"] == {
+        "instance_types": ["t3.xlarge"]
+    }
+    with pytest.raises(ValueError, match="Pipeline UnknownPipeline not found"):
+        write_instance_types(cdk_json, "UnknownPipeline", ["t3.medium"])
+    # neither the product nor the benchmark instance types of a pipeline without its own are changed
+    with pytest.raises(
+        ValueError, match="Pipeline UbuntuResearchToolsPipeline has no instance_types"
+    ):
+        write_instance_types(cdk_json, "UbuntuResearchToolsPipeline", ["t3.medium"])
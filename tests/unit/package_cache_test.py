@@ -0,0 +1,30 @@
+import pytest
+
+from src.build_infrastructure import DEFAULT_EGRESS_RULES
+from src.package_cache import uses_artifacts, with_proxy_egress_rule
+
+
+def test_the_proxy_port_is_allowed_once():
+    egress_rules = with_proxy_egress_rule(DEFAULT_EGRESS_RULES, "http://10.0.0.10:3142")
+    assert egress_rules[:-1] == DEFAULT_EGRESS_RULES
+    assert egress_rules[-1]["cidr"] == "10.0.0.10/32"
+    assert egress_rules[-1]["port"] == 3142
+    assert with_proxy_egress_rule(egress_rules, "http://10.0.0.10:3142") == egress_rules
+
+    # host names may resolve to any address
+    (rule,) = with_proxy_egress_rule([], "http://proxy.internal:3128")
+    assert (rule["cidr"], rule["port"]) == ("0.0.0.0/0", 3128)
+    proxy_egress_rules = with_proxy_egress_rule(DEFAULT_EGRESS_RULES, "http://proxy")
+    assert proxy_egress_rules == DEFAULT_EGRESS_RULES
+
+    with pytest.raises(ValueError, match="proxy must be an http or https url"):
+        with_proxy_egress_rule(DEFAULT_EGRESS_RULES, "10.0.0.10:3142")
+
+
+def test_the_artifacts_are_deployed_when_a_pipeline_downloads_them():
+    specs = [{"os": "amazon_linux"}, {"os": "ubuntu", "package_cache": {}}]
+    assert not uses_artifacts(specs, {"artifacts": True})
+
+    specs.append({"os": "ubuntu"})
+    assert uses_artifacts(specs, {"artifacts": True})
+    assert not uses_artifacts(specs, None)
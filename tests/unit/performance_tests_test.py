@@ -0,0 +1,87 @@
+import pytest
+
+from src.component_registry import ComponentRegistry
+from src.component_validator import bash_steps
+from src.performance_tests import (
+    performance_test_entry,
+    proposed_root_volume_size,
+    root_snapshot_gib,
+    shrink_image_entry,
+)
+
+
+def test_thresholds_become_component_parameters():
+    entry = performance_test_entry(
+        "ubuntu",
+        {"thresholds": {"max_session_start_seconds": 30}, "disk_read_mib": 512},
+        "image-builder-components-123456789012-eu-west-2",
+        "UbuntuWorkspace",
+    )
+
+    assert entry == {
+        "path": "ubuntu/test_desktop_performance.yml",
+        "parameters": {
+            "ResultsBucket": "image-builder-components-123456789012-eu-west-2",
+            "ResultsPrefix": "performance/UbuntuWorkspace",
+            "MaxSessionStartSeconds": 30,
+            "DiskReadMiB": 512,
+        },
+    }
+
+
+def test_unknown_thresholds_fail():
+    with pytest.raises(
+        ValueError, match="Unknown performance test thresholds max_boot_seconds"
+    ):
+        performance_test_entry(
+            "ubuntu", {"thresholds": {"max_boot_seconds": 60}}, "bucket", "Ubuntu"
+        )
+
+
+def test_the_disk_usage_is_stored_below_the_test_results():
+    entry = shrink_image_entry("ubuntu", "bucket", "UbuntuWorkspace")
+
+    assert entry["path"] == "ubuntu/shrink_image.yml"
+    assert entry["parameters"]["ResultsPrefix"] == "performance/UbuntuWorkspace/volume"
+
+
+def test_shrinking_keeps_the_package_lists():
+    # child pipelines install packages on top of the shrunk image without an apt-get update
+    document = ComponentRegistry().component_document("ubuntu/shrink_image.yml")
+
+    for _, _, script in bash_steps(document):
+        assert "/var/lib/apt/lists" not in script
+
+
+def test_the_root_volume_fits_the_latest_image():
+    usages = [{"used_gib": 7}, {"used_gib": 5}]
+
+    assert proposed_root_volume_size(usages) == 7
+    assert proposed_root_volume_size(usages, free_gib=4) == 9
+    assert proposed_root_volume_size([]) is None
+
+
+def test_the_root_volume_is_not_smaller_than_the_parent_snapshot():
+    usages = [{"used_gib": 5}]
+
+    assert proposed_root_volume_size(usages, min_gib=8) == 8
+    assert proposed_root_volume_size(usages, min_gib=4) == 7
+
+
+class FakeEc2:
+    def describe_images(self, **kwargs):
+        return {
+            "Images": [
+                {
+                    "RootDeviceName": "/dev/sda1",
+                    "BlockDeviceMappings": [
+                        {"DeviceName": "/dev/sdb", "Ebs": {"VolumeSize": 100}},
+                        {"DeviceName": "/dev/sda1", "Ebs": {"VolumeSize": 8}},
+                    ],
+                }
+            ]
+        }
+
+
+def test_the_root_snapshot_is_the_root_device_of_the_image():
+    assert root_snapshot_gib(FakeEc2(), "ami-0aaa5410833273cfe") == 8
@@ -0,0 +1,57 @@
+import pytest
+
+from src.pipeline_specs import (
+    ordered_specs,
+    selected_stacks,
+    stack_dependencies,
+    stack_patterns,
+)
+
+SPECS = [
+    {"id": "UbuntuApps", "parent_pipeline": "UbuntuDesktop"},
+    {"id": "UbuntuDesktop"},
+    {"id": "Al2Desktop", "vpc_id": "vpc-other"},
+    {"id": "UbuntuDesktopT3MediumTrial", "trial_of": "UbuntuDesktop"},
+]
+
+
+def test_parents_are_ordered_before_their_children():
+    assert [spec["id"] for spec in ordered_specs(SPECS)] == [
+        "UbuntuDesktop",
+        "UbuntuApps",
+        "Al2Desktop",
+        "UbuntuDesktopT3MediumTrial",
+    ]
+
+    with pytest.raises(ValueError, match="Pipeline Loop is its own parent pipeline"):
+        ordered_specs([{"id": "Loop", "parent_pipeline": "Loop"}])
+
+
+def test_selection_adds_every_dependency():
+    dependencies = stack_dependencies(SPECS, "vpc-default", build_orchestrator=True)
+
+    assert selected_stacks(dependencies, ["UbuntuApps"]) == {
+        "UbuntuApps",
+        "UbuntuDesktop",
+        "BuildInfrastructure",
+        "S3Ops",
+    }
+    assert selected_stacks(dependencies, ["Al2*"]) == {
+        "Al2Desktop",
+        "BuildInfrastructure-vpc-other",
+        "S3Ops",
+    }
+    # the orchestrator manages every pipeline but the trials
+    assert "UbuntuDesktopT3MediumTrial" not in selected_stacks(
+        dependencies, ["BuildOrchestrator"]
+    )
+    assert selected_stacks(dependencies, []) == set(dependencies)
+
+    with pytest.raises(ValueError, match="No stack matches Unknown"):
+        selected_stacks(dependencies, ["Unknown"])
+
+
+def test_stack_patterns_accept_lists_and_comma_separated_strings():
+    assert stack_patterns("S3Ops, Ubuntu*") == ["S3Ops", "Ubuntu*"]
+    assert stack_patterns(["S3Ops"]) == ["S3Ops"]
+    assert stack_patterns(None) == []
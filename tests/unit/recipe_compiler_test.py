@@ -0,0 +1,342 @@
+from src.component_registry import ComponentRegistry
+from src.component_validator import validate_document
+from src.recipe_compiler import compile_recipe, merge_packages, parse_package_command
+
+
+def bash_step(name: str, *commands: str) -> dict:
+    return {
+        "name": name,
+        "action": "ExecuteBash",
+        "inputs": {"commands": list(commands)},
+    }
+
+
+def document(name: str, *steps: dict, parameters: list = None) -> dict:
+    document = {
+        "name": name,
+        "schemaVersion": 1.0,
+        "phases": [{"name": "build", "steps": list(steps)}],
+    }
+    if parameters:
+        document["parameters"] = parameters
+    return document
+
+
+def commands(steps: list) -> list:
+    return [step["inputs"]["commands"] for step in steps]
+
+
+def test_only_plain_package_commands_are_parsed():
+    assert parse_package_command("sudo yum install -y firefox") == (
+        "sudo ",
+        "yum",
+        "install",
+        ["firefox"],
+    )
+    assert parse_package_command("apt-get install -y $(cat packages)") is None
+    assert parse_package_command("apt-get install --no-install-recommends xrdp") is None
+    assert parse_package_command("apt-get update && apt-get upgrade") is None
+
+
+def test_installs_following_each_other_merge_and_refreshes_are_deduplicated():
+    steps = merge_packages(
+        [
+            bash_step("Setup", "apt-get -y -q update", "apt-get install -y jq"),
+            bash_step(
+                "Desktop",
+                "apt-get update",
+                'echo "Installing the desktop"',
+                "apt-get install -y -q ubuntu-mate-desktop",
+            ),
+            bash_step("Xrdp", "apt-get install -y xrdp jq", "systemctl restart xrdp"),
+        ]
+    )
+
+    assert commands(steps) == [
+        [
+            "apt-get -y -q update",
+            "DEBIAN_FRONTEND=noninteractive apt-get install -y -q jq ubuntu-mate-desktop xrdp",
+        ],
+        ['echo "Installing the desktop"'],
+        ["systemctl restart xrdp"],
+    ]
+
+
+def test_installs_do_not_move_ahead_of_other_commands():
+    preseed = "echo 'xrdp xrdp/ssl boolean true' | debconf-set-selections"
+    steps = merge_packages(
+        [
+            bash_step("Setup", "apt-get install -y jq", "jq --version"),
+            bash_step("Xrdp", preseed, "apt-get install -y xrdp"),
+            bash_step("Unzip", "apt-get install -y unzip"),
+        ]
+    )
+
+    assert commands(steps) == [
+        ["DEBIAN_FRONTEND=noninteractive apt-get install -y -q jq", "jq --version"],
+        [
+            preseed,
+            "DEBIAN_FRONTEND=noninteractive apt-get install -y -q xrdp unzip",
+        ],
+    ]
+
+
+def test_source_changes_start_a_new_install():
+    steps = merge_packages(
+        [
+            bash_step("Setup", "apt-get update", "apt-get install -y jq"),
+            bash_step(
+                "Repository",
+                "add-apt-repository -y ppa:example/tools",
+                "apt-get update",
+                "apt-get install -y tool",
+            ),
+            bash_step("More", "apt-get install -y unzip"),
+        ]
+    )
+
+    assert commands(steps) == [
+        ["apt-get update", "DEBIAN_FRONTEND=noninteractive apt-get install -y -q jq"],
+        [
+            "add-apt-repository -y ppa:example/tools",
+            "apt-get update",
+            "DEBIAN_FRONTEND=noninteractive apt-get install -y -q tool unzip",
+        ],
+    ]
+
+
+def test_installs_do_not_move_across_other_steps():
+    download = {
+        "name": "Download",
+        "action": "S3Download",
+        "inputs": [{"source": "s3://bucket/tool.deb", "destination": "/tmp/tool.deb"}],
+    }
+    steps = merge_packages(
+        [
+            bash_step("Setup", "apt-get install -y jq"),
+            download,
+            bash_step("Tool", "apt-get install -y unzip"),
+            bash_step("More", "apt-get install -y curl"),
+        ]
+    )
+
+    assert [step["name"] for step in steps] == ["Setup", "Download", "Tool"]
+    assert commands(steps[:1]) == [
+        ["DEBIAN_FRONTEND=noninteractive apt-get install -y -q jq"]
+    ]
+    assert steps[1] == download
+    assert commands(steps[2:]) == [
+        ["DEBIAN_FRONTEND=noninteractive apt-get install -y -q unzip curl"]
+    ]
+
+
+def test_installs_do_not_move_into_or_out_of_guarded_steps():
+    guarded = {
+        **bash_step("Optional", "apt-get install -y unzip"),
+        "onFailure": "Continue",
+    }
+    steps = merge_packages(
+        [
+            bash_step("Setup", "apt-get install -y jq"),
+            guarded,
+            bash_step("Tool", "apt-get install -y curl"),
+        ]
+    )
+
+    assert commands(steps) == [
+        ["DEBIAN_FRONTEND=noninteractive apt-get install -y -q jq"],
+        ["apt-get install -y unzip"],
+        ["DEBIAN_FRONTEND=noninteractive apt-get install -y -q curl"],
+    ]
+    assert steps[1]["onFailure"] == "Continue"
+
+
+def _shipped_installs(paths: list) -> list:
+    registry = ComponentRegistry()
+    compiled, _ = compile_recipe(
+        "Compiled", [(registry.component_document(path), {}) for path in paths]
+    )
+    (build,) = compiled["phases"]
+    return [
+        line.strip()
+        for step in build["steps"]
+        for command in step["inputs"]["commands"]
+        for line in command.split("\n")
+        if (parse_package_command(line) or ())[2:3] == ("install",)
+    ]
+
+
+def test_the_shipped_components_merge_where_nothing_runs_between_installs():
+    assert _shipped_installs(
+        ["amazon_linux/install_firefox.yml", "amazon_linux/install_libreoffice.yml"]
+    ) == ["sudo amazon-linux-extras install -y epel firefox libreoffice"]
+
+    # every Ubuntu install is followed by commands of its own component, e.g. gsettings after the desktop
+    assert _shipped_installs(
+        [
+            "ubuntu/basic_ubuntu_setup.yml",
+            "ubuntu/install_ubuntu_mate_desktop.yml",
+            "ubuntu/install_xrdp.yml",
+        ]
+    ) == [
+        "DEBIAN_FRONTEND=noninteractive apt-get install -y -q unzip jq fuse python3-pip",
+        "DEBIAN_FRONTEND=noninteractive apt-get install -y -q ubuntu-mate-desktop",
+        "DEBIAN_FRONTEND=noninteractive apt-get install -y -q xrdp",
+    ]
+
+
+def test_amazon_linux_extras_topics_are_merged():
+    steps = merge_packages(
+        [
+            bash_step(
+                "Firefox",
+                "sudo yum update -y",
+                "sudo amazon-linux-extras install epel -y",
+                "sudo amazon-linux-extras install -y firefox",
+            ),
+            bash_step("Libreoffice", "sudo amazon-linux-extras install -y libreoffice"),
+        ]
+    )
+
+    assert commands(steps) == [
+        [
+            "sudo yum update -y",
+            "sudo amazon-linux-extras install -y epel firefox libreoffice",
+        ]
+    ]
+
+
+def test_compiled_recipe_prefixes_parameters_and_runs_concurrent_steps_together():
+    compiled, parameters = compile_recipe(
+        "WorkspaceCompiled",
+        [
+            (
+                document(
+                    "Proxy",
+                    bash_step(
+                        "Configure", 'echo "{{ Proxy }}" > /etc/apt/apt.conf.d/01proxy'
+                    ),
+                    parameters=[{"Proxy": {"type": "string"}}],
+                ),
+                {
+                    "path": "ubuntu/proxy.yml",
+                    "parameters": {"Proxy": "http://proxy:3142"},
+                },
+            ),
+            (
+                document(
+                    "Desktop",
+                    bash_step(
+                        "Install", "apt-get install -y mate", "gsettings set a b"
+                    ),
+                ),
+                {"path": "ubuntu/desktop.yml", "concurrent": True},
+            ),
+            (
+                document(
+                    "Xrdp",
+                    bash_step(
+                        "Install",
+                        "apt-get install -y xrdp",
+                        "usermod -a -G ssl-cert xrdp",
+                    ),
+                ),
+                {"path": "ubuntu/xrdp.yml", "concurrent": True},
+            ),
+        ],
+    )
+
+    assert validate_document(compiled) == []
+    assert parameters == {"ProxyProxy": "http://proxy:3142"}
+    assert compiled["parameters"] == [{"ProxyProxy": {"type": "string"}}]
+
+    steps = compiled["phases"][0]["steps"]
+    assert [step["name"] for step in steps] == [
+        "ProxyConfigure",
+        "PackagesDesktopInstall",
+        "ConcurrentDesktopInstall",
+    ]
+    assert steps[0]["inputs"]["commands"] == [
+        'echo "{{ ProxyProxy }}" > /etc/apt/apt.conf.d/01proxy'
+    ]
+    # packages of concurrent steps are installed before any of them starts
+    assert steps[1]["inputs"]["commands"] == [
+        "DEBIAN_FRONTEND=noninteractive apt-get install -y -q mate xrdp"
+    ]
+    script = "\n".join(steps[2]["inputs"]["commands"])
+    assert "gsettings set a b" in script
+    assert "usermod -a -G ssl-cert xrdp" in script
+    assert "apt-get" not in script
+
+
+def test_steps_named_after_their_component_are_not_prefixed_again():
+    compiled, _ = compile_recipe(
+        "SetupCompiled",
+        [
+            (
+                document(
+                    "BasicSetup",
+                    bash_step("BasicSetup", "apt-get install -y jq"),
+                    bash_step("Users", "echo {{ build.BasicSetup.outputs.stdout }}"),
+                ),
+                {"path": "ubuntu/basic_ubuntu_setup.yml"},
+            )
+        ],
+    )
+
+    steps = compiled["phases"][0]["steps"]
+    assert [step["name"] for step in steps] == ["BasicSetup", "BasicSetupUsers"]
+    assert steps[1]["inputs"]["commands"] == [
+        "echo {{ build.BasicSetup.outputs.stdout }}"
+    ]
+
+
+def test_concurrent_steps_preparing_their_installs_run_one_after_another():
+    preseed = "echo 'xrdp xrdp/ssl boolean true' | debconf-set-selections"
+    compiled, _ = compile_recipe(
+        "WorkspaceCompiled",
+        [
+            (
+                document("Desktop", bash_step("Install", "apt-get install -y mate")),
+                {"path": "ubuntu/desktop.yml", "concurrent": True},
+            ),
+            (
+                document(
+                    "Xrdp", bash_step("Install", preseed, "apt-get install -y xrdp")
+                ),
+                {"path": "ubuntu/xrdp.yml", "concurrent": True},
+            ),
+        ],
+    )
+
+    steps = compiled["phases"][0]["steps"]
+    assert [step["name"] for step in steps] == ["DesktopInstall", "XrdpInstall"]
+    assert steps[1]["inputs"]["commands"][0] == preseed
+
+
+def test_a_single_concurrent_step_keeps_its_packages():
+    compiled, _ = compile_recipe(
+        "WorkspaceCompiled",
+        [
+            (
+                document("Setup", bash_step("Install", "apt-get install -y jq")),
+                {"path": "ubuntu/setup.yml"},
+            ),
+            (
+                document(
+                    "Desktop",
+                    bash_step(
+                        "Install", "apt-get install -y mate", "gsettings set a b"
+                    ),
+                ),
+                {"path": "ubuntu/desktop.yml", "concurrent": True},
+            ),
+        ],
+    )
+
+    steps = compiled["phases"][0]["steps"]
+    assert [step["name"] for step in steps] == ["SetupInstall", "DesktopInstall"]
+    assert steps[0]["inputs"]["commands"] == [
+        "DEBIAN_FRONTEND=noninteractive apt-get install -y -q jq mate"
+    ]
+    assert steps[1]["inputs"]["commands"] == ["gsettings set a b"]
@@ -0,0 +1,72 @@
+import json
+import os
+import re
+
+import pytest
+
+from src.service_catalog import (
+    CDK_JSON_PATH,
+    PRODUCT_TEMPLATE_PATH,
+    PRODUCTS_DIR,
+    product_templates,
+    rank_product_instance_types,
+    render_product,
+)
+
+
+def _template() -> str:
+    with open(PRODUCT_TEMPLATE_PATH, encoding="utf-8") as template_file:
+        return template_file.read()
+
+
+def test_products_are_generated_from_the_pipeline_specs():
+    with open(CDK_JSON_PATH, encoding="utf-8") as cdk_json:
+        specs = json.load(cdk_json)["context"]["pipelines"]
+
+    for file_name, content in product_templates(specs, _template()).items():
+        with open(os.path.join(PRODUCTS_DIR, file_name), encoding="utf-8") as product:
+            assert product.read() == content, "run python -m src.service_catalog"
+
+
+def test_products_resolve_the_latest_ami_of_the_pipeline():
+    spec = {
+        "id": "UbuntuDesktop",
+        "name": "UbuntuDesktop",
+        "os": "ubuntu",
+        "root_volume_size": 8,
+        "product": {"description": "Ubuntu desktop", "instance_types": ["m6i.large"]},
+    }
+    content = render_product(_template(), spec)
+
+    assert "Default: /centralised-amis/UbuntuDesktop/latest-ami-id" in content
+    # only resolved when no ami id is passed, so launches do not need the parameter to exist
+    assert "  LatestAmiId:\n    Type: String\n" in content
+    assert "!If [UseLatestAmi, !Sub '{{resolve:ssm:${LatestAmiId}}}', !Ref AmiId]" in (
+        content
+    )
+    # callers passing an ami id keep working
+    assert "  AmiId:\n    Type: String\n" in content
+    assert "Default: m6i.large" in content
+    assert not re.search(r"{{ \w+ }}", content)
+
+    spec["product"]["volume_size"] = 4
+    with pytest.raises(
+        ValueError, match="is smaller than the root_volume_size of its AMI"
+    ):
+        render_product(_template(), spec)
+
+
+def test_product_instance_types_are_ranked_by_session_start():
+    results = [
+        {"instance_type": "t3.xlarge", "results": {"session_start_seconds": 20}},
+        {"instance_type": "t3.xlarge", "results": {"session_start_seconds": 14}},
+        {"instance_type": "m6i.xlarge", "results": {"session_start_seconds": 9}},
+        # not offered by the product
+        {"instance_type": "c6i.xlarge", "results": {"session_start_seconds": 5}},
+    ]
+
+    ranked = rank_product_instance_types(
+        ["t3.xlarge", "t3.2xlarge", "m6i.xlarge", "m6i.2xlarge"], results
+    )
+
+    assert ranked == ["m6i.xlarge", "t3.xlarge", "t3.2xlarge", "m6i.2xlarge"]
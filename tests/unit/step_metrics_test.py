@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import subprocess  # nosec B404
+
+import yaml
+
+from src.component_registry import COMPONENTS_DIR
+from src.component_validator import bash_steps, bash_syntax
+from src.step_metrics import PIPELINE_PARAMETER, render_document, step_names
+
+DOCUMENT = {
+    "name": "InstallTools",
+    "schemaVersion": 1.0,
+    "phases": [
+        {
+            "name": "build",
+            "steps": [
+                {
+                    "name": "InstallTools",
+                    "action": "ExecuteBash",
+                    "inputs": {"commands": ["echo installing", "exit 3"]},
+                },
+                {"name": "Reboot", "action": "Reboot"},
+            ],
+        },
+        {
+            "name": "validate",
+            "steps": [
+                {
+                    "name": "CheckTools",
+                    "action": "ExecuteBash",
+                    "inputs": {"commands": ["true"]},
+                }
+            ],
+        },
+    ],
+}
+
+
+def test_rendered_components_are_valid_bash():
+    path = os.path.join(COMPONENTS_DIR, "ubuntu", "install_xrdp.yml")
+    with open(path, encoding="utf-8") as component_file:
+        document = yaml.safe_load(component_file)
+
+    rendered = yaml.safe_load(render_document(document))
+
+    assert bash_syntax(rendered) == []
+    for _, _, script in bash_steps(rendered):
+        # the component's own {{ variables }} follow the prologue
+        prologue = script[: script.index("trap __step_report EXIT")]
+        assert "{{" not in prologue
+        assert "}}" not in prologue
+
+
+def test_instrumented_steps_report_a_json_event():
+    rendered = yaml.safe_load(render_document(DOCUMENT))
+    # without the AWS CLI the event is only printed
+    env = {"PATH": os.pathsep.join(["/usr/bin", "/bin"])}
+
+    events = []
+    for _, _, script in bash_steps(rendered):
+        # the value the recipe passes, as AWSTOE substitutes it
+        script = script.replace(f"{{{{ {PIPELINE_PARAMETER} }}}}", "UbuntuWorkspace")
+        completed = subprocess.run(  # nosec B603
+            [shutil.which("bash"), "-c", script],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        events.append(json.loads(completed.stdout.splitlines()[-1]))
+        assert completed.returncode == events[-1]["exit_code"]
+
+    assert [event["step"] for event in events] == step_names(DOCUMENT)
+    assert step_names(DOCUMENT) == ["build/InstallTools", "validate/CheckTools"]
+    assert {event["component"] for event in events} == {"InstallTools"}
+    assert {event["pipeline"] for event in events} == {"UbuntuWorkspace"}
+    assert rendered["parameters"][-1][PIPELINE_PARAMETER]["type"] == "string"
+    assert [event["exit_code"] for event in events] == [3, 0]
+    assert all(event["duration_seconds"] >= 0 for event in events)
+    assert all(event["bytes_downloaded"] >= 0 for event in events)
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import subprocess  # nosec B404
+import sys
+
+from src.component_registry import MANIFEST_PATH
+from src.template_budget import (
+    CDK_JSON_PATH,
+    analyze,
+    budget_violations,
+    load_assembly,
+    suggestions,
+)
+from tests.conftest import ACCOUNT, REGION, ROOT_DIR
+
+GET_IMAGE = {"Action": "imagebuilder:GetImage", "Effect": "Allow", "Resource": "*"}
+
+
+def _role_policy(statements: list) -> dict:
+    return {
+        "Type": "AWS::IAM::Policy",
+        "Properties": {"PolicyDocument": {"Statement": statements}},
+        "Metadata": {"cdk_nag": {"rules_to_suppress": [{"id": "AwsSolutions-IAM5"}]}},
+    }
+
+
+def test_statements_repeated_across_stacks_are_reported():
+    templates = {
+        "UbuntuPipeline": {
+            "Resources": {
+                "FunctionPolicy": _role_policy([GET_IMAGE]),
+                "OrchestratorPolicy": _role_policy([GET_IMAGE]),
+            }
+        },
+        "Al2Pipeline": {
+            "Resources": {"FunctionPolicy": _role_policy([GET_IMAGE])},
+            "Outputs": {"ImageArn": {"Value": "arn"}},
+        },
+    }
+    report = analyze(templates, template_bytes={"Al2Pipeline": 2048})
+
+    assert report["Al2Pipeline"]["template_bytes"] == 2048
+    assert report["Al2Pipeline"]["resources"] == 1
+    assert report["Al2Pipeline"]["outputs"] == 1
+    (duplicate,) = report["Al2Pipeline"]["duplicate_statements"]
+    assert duplicate["statement"] == GET_IMAGE
+    assert len(duplicate["used_by"]) == 3
+    assert report["UbuntuPipeline"]["repeated_suppressions"] == {
+        "AwsSolutions-IAM5": ["FunctionPolicy", "OrchestratorPolicy"]
+    }
+    assert any(
+        "Al2Pipeline, UbuntuPipeline" in message for message in suggestions(report)
+    )
+
+    assert budget_violations(report, {}) == []
+    (violation,) = budget_violations(report, {"max_resources": 1})
+    assert violation.startswith("UbuntuPipeline: 2 resources")
+
+
+def test_synthesized_stacks_are_within_budget(tmp_path, offline_context):
+    # synth records new component versions, the test must not change the manifest
+    manifest_path = tmp_path / "component_versions.json"
+    shutil.copyfile(MANIFEST_PATH, manifest_path)
+    context = {**offline_context, "component_manifest": str(manifest_path)}
+    env = dict(
+        os.environ,
+        JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1",
+        CDK_DEFAULT_ACCOUNT=ACCOUNT,
+        CDK_DEFAULT_REGION=REGION,
+        CDK_OUTDIR=str(tmp_path / "cdk.out"),
+        CDK_CONTEXT_JSON=json.dumps(context),
+    )
+    subprocess.run(  # nosec B603
+        [sys.executable, "app.py"],
+        cwd=ROOT_DIR,
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+
+    report = analyze(*load_assembly(str(tmp_path / "cdk.out")))
+    with open(CDK_JSON_PATH, encoding="utf-8") as cdk_json:
+        budgets = json.load(cdk_json)["context"]["template_budget"]
+
+    assert len(report) > len(context["pipelines"])
+    assert budget_violations(report, budgets) == []